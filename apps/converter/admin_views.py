@@ -18,11 +18,12 @@ def system_monitor(request):
     # 获取转换统计
     today = timezone.now()
     last_week = today - timedelta(days=7)
+    today_start = timezone.localtime(today).replace(hour=0, minute=0, second=0, microsecond=0)
     
     stats = {
         'total_conversions': ConversionTask.objects.count(),
         'today_conversions': ConversionTask.objects.filter(
-            created_at__date=today.date()
+            created_at__gte=today_start
         ).count(),
         'failed_conversions': ConversionTask.objects.filter(
             status='failed'
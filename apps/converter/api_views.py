@@ -10,7 +10,7 @@ from .serializers import (
     ConversionRequestSerializer,
     BatchConversionSerializer
 )
-from .tasks import convert_file_task
+from .workers import submit_conversion
 from apps.security.validators import FileValidator, SecurityScanner
 
 class ConversionViewSet(viewsets.ModelViewSet):
@@ -41,11 +41,13 @@ class ConversionViewSet(viewsets.ModelViewSet):
                 original_file=file,
                 original_format=serializer.validated_data['original_format'],
                 target_format=serializer.validated_data['target_format'],
-                file_size=file.size
+                file_size=file.size,
+                file_hash=getattr(file, 'sha256', ''),
+                options=serializer.validated_data['options']
             )
             
             # 启动异步转换
-            convert_file_task.delay(task.id)
+            submit_conversion(task)
             
             return Response({
                 'task_id': task.id,
@@ -77,12 +79,14 @@ class ConversionViewSet(viewsets.ModelViewSet):
                     original_file=file,
                     original_format=serializer.validated_data['original_format'],
                     target_format=serializer.validated_data['target_format'],
-                    file_size=file.size
+                    file_size=file.size,
+                    file_hash=getattr(file, 'sha256', ''),
+                    options=serializer.validated_data['options']
                 )
                 tasks.append(task)
                 
                 # 启动异步转换
-                convert_file_task.delay(task.id)
+                submit_conversion(task)
             
             return Response({
                 'task_ids': [task.id for task in tasks],
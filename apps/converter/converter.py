@@ -4,6 +4,7 @@ import os
 import logging
 from PIL import Image
 from .validators import validate_conversion_options
+from .imaging import convert_image
 
 logger = logging.getLogger(__name__)
 
@@ -35,32 +36,33 @@ class FileConverter:
             raise 
 
     def _convert_image(self, input_path, output_format, options):
-        """转换图片"""
+        """转换图片，超出内存上限的大图按条带处理"""
         try:
-            with Image.open(input_path) as img:
-                # 应用质量选项
-                if options.get('quality') == 'high':
-                    dpi = options.get('dpi', 300)
-                    img.info['dpi'] = (dpi, dpi)
-                    
-                # 调整大小
-                if 'resize' in options:
-                    width = options['resize'].get('width')
-                    height = options['resize'].get('height')
-                    if width and height:
-                        img = img.resize((width, height), Image.LANCZOS)
-                
-                # 保存转换后的图片
-                output_path = self._get_output_path(input_path, output_format)
-                img.save(
-                    output_path,
-                    format=output_format.upper(),
-                    quality=options.get('jpeg_quality', 95),
-                    optimize=True
-                )
-                
-                return output_path
-                
+            image_options = dict(options)
+            # 应用质量选项
+            if options.get('quality') == 'high':
+                image_options.setdefault('dpi', 300)
+            else:
+                image_options.pop('dpi', None)
+
+            # 调整大小
+            size = None
+            if 'resize' in options:
+                width = options['resize'].get('width')
+                height = options['resize'].get('height')
+                if width and height:
+                    size = (width, height)
+
+            # 保存转换后的图片
+            output_path = self._get_output_path(input_path, output_format)
+            return convert_image(
+                input_path,
+                output_path,
+                output_format,
+                size=size,
+                options=image_options
+            )
+
         except Exception as e:
             logger.error(f"Image conversion failed: {str(e)}")
             raise
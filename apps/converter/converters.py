@@ -1,41 +1,79 @@
-"""文件格式转换器集合"""
-from PIL import Image
-import fitz  # PyMuPDF
-from docx import Document
-from openpyxl import load_workbook
-from pptx import Presentation
+"""文件格式转换器集合
+
+转换器通过 register_converter 声明注册，PyMuPDF、pdf2docx、svglib、
+reportlab 等重量级依赖只在实际转换时导入，Web进程导入本模块不会加载它们。
+"""
 import os
 import io
+import csv
+import logging
+import zipfile
 import tempfile
-from pdf2docx import Converter
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPM
+import itertools
+import collections
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+_registry = []
+
+def register_converter(cls):
+    """注册转换器类"""
+    _registry.append(cls)
+    return cls
+
 class BaseConverter:
     """转换器基类"""
-    def __init__(self):
-        self.supported_formats = set()
+    # 支持的格式组合
+    supported_formats = frozenset()
+    # 可按工作单元（页、行、瓦片）流式处理的格式组合
+    streaming_formats = frozenset()
+    # 输出结果变化时递增，使已缓存的转换结果失效
+    version = 1
 
     def can_convert(self, source_format, target_format):
         """检查是否支持转换"""
         return (source_format, target_format) in self.supported_formats
 
+    def can_stream(self, source_format, target_format):
+        """检查是否支持流式转换"""
+        return (source_format, target_format) in self.streaming_formats
+
+    def get_output_format(self, source_format, target_format):
+        """获取输出文件格式，多页结果打包输出时与目标格式不同"""
+        return target_format
+
     def convert(self, input_path, output_path):
         """执行转换"""
         raise NotImplementedError
 
+    def iter_convert(self, input_path, output_path, options=None):
+        """逐个工作单元执行转换，每完成一个单元产出 (已完成数, 总数)
+
+        不支持流式处理的格式整体转换一次，作为单个工作单元上报。
+        """
+        self.convert(input_path, output_path)
+        yield 1, 1
+
+    def _get_formats(self, input_path, output_path):
+        """根据文件扩展名获取源格式和目标格式"""
+        source_ext = os.path.splitext(input_path)[1][1:].lower()
+        target_ext = os.path.splitext(output_path)[1][1:].lower()
+        return source_ext, target_ext
+
+@register_converter
 class ImageConverter(BaseConverter):
     """图片格式转换器"""
-    def __init__(self):
-        super().__init__()
-        self.supported_formats = {
-            ('jpg', 'png'), ('jpg', 'bmp'), ('jpg', 'gif'),
-            ('png', 'jpg'), ('png', 'bmp'), ('png', 'gif'),
-            ('bmp', 'jpg'), ('bmp', 'png'), ('bmp', 'gif'),
-            ('gif', 'jpg'), ('gif', 'png'), ('gif', 'bmp'),
-            ('svg', 'png'), ('svg', 'jpg')
-        }
+    supported_formats = frozenset({
+        ('jpg', 'png'), ('jpg', 'bmp'), ('jpg', 'gif'),
+        ('png', 'jpg'), ('png', 'bmp'), ('png', 'gif'),
+        ('bmp', 'jpg'), ('bmp', 'png'), ('bmp', 'gif'),
+        ('gif', 'jpg'), ('gif', 'png'), ('gif', 'bmp'),
+        ('svg', 'png'), ('svg', 'jpg')
+    })
+    streaming_formats = frozenset(
+        formats for formats in supported_formats if formats[0] != 'svg'
+    )
 
     def convert(self, input_path, output_path):
         """转换图片格式"""
@@ -44,6 +82,9 @@ class ImageConverter(BaseConverter):
 
         # SVG特殊处理
         if source_ext == 'svg':
+            from svglib.svglib import svg2rlg
+            from reportlab.graphics import renderPM
+
             drawing = svg2rlg(input_path)
             if target_ext == 'png':
                 renderPM.drawToFile(drawing, output_path, fmt='PNG')
@@ -52,92 +93,350 @@ class ImageConverter(BaseConverter):
             return
 
         # 其他图片格式转换
-        with Image.open(input_path) as img:
-            # 转换颜色模式
-            if img.mode in ('RGBA', 'LA') and target_ext == 'jpg':
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            elif img.mode == 'P':
-                img = img.convert('RGB')
-
-            # 保存转换后的图片
-            img.save(output_path, quality=95, optimize=True)
+        for _ in self.iter_convert(input_path, output_path):
+            pass
+
+    def iter_convert(self, input_path, output_path, options=None):
+        """转换图片，超出内存上限的大图按条带处理"""
+        source_ext, target_ext = self._get_formats(input_path, output_path)
+        if source_ext == 'svg':
+            yield from super().iter_convert(input_path, output_path, options)
+            return
+
+        from .imaging import iter_convert_image
 
+        options = options or {}
+        resize = options.get('resize') or {}
+        size = None
+        if resize.get('width') and resize.get('height'):
+            size = (resize['width'], resize['height'])
+        yield from iter_convert_image(input_path, output_path, target_ext, size, options)
+
+@register_converter
 class DocumentConverter(BaseConverter):
     """文档格式转换器"""
-    def __init__(self):
-        super().__init__()
-        self.supported_formats = {
-            ('pdf', 'docx'), ('docx', 'pdf'),
-            ('pdf', 'jpg'), ('pdf', 'png')
-        }
+    supported_formats = frozenset({
+        ('pdf', 'docx'), ('docx', 'pdf'),
+        ('pdf', 'jpg'), ('pdf', 'png'), ('pdf', 'tiff'),
+        ('txt', 'pdf')
+    })
+    streaming_formats = frozenset({
+        ('pdf', 'jpg'), ('pdf', 'png'), ('pdf', 'tiff'),
+        ('txt', 'pdf')
+    })
+    # PDF转图片时每页一张图片，打包为单个ZIP文件输出
+    package_formats = {
+        ('pdf', 'jpg'): 'zip',
+        ('pdf', 'png'): 'zip'
+    }
+
+    def get_output_format(self, source_format, target_format):
+        """获取输出文件格式"""
+        return self.package_formats.get((source_format, target_format), target_format)
+
+    def iter_convert(self, input_path, output_path, options=None):
+        """流式转换：PDF逐页渲染，文本逐行排版"""
+        source_ext, target_ext = self._get_formats(input_path, output_path)
+
+        if source_ext == 'pdf' and target_ext == 'zip':
+            yield from self._iter_pdf_to_zip(input_path, output_path, options)
+        elif source_ext == 'pdf' and target_ext == 'tiff':
+            yield from self._iter_pdf_to_tiff(input_path, output_path, options)
+        elif source_ext == 'pdf' and target_ext in ['jpg', 'png']:
+            yield from self._iter_pdf_to_image(input_path, output_path, target_ext, options)
+        elif source_ext == 'txt' and target_ext == 'pdf':
+            yield from self._iter_text_to_pdf(input_path, output_path)
+        else:
+            yield from super().iter_convert(input_path, output_path, options)
+
+    def _iter_pdf_to_zip(self, input_path, output_path, options=None):
+        """渲染的页面直接写入ZIP，不产生中间文件"""
+        options = options or {}
+        page_format = options.get('target_format', 'png')
+        pages = self._get_render_pages(input_path, options)
+
+        # 图片已压缩，ZIP中直接存储
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as zf:
+            for done, (page_num, data) in enumerate(
+                self._iter_rendered_pages(input_path, pages, page_format, options), 1
+            ):
+                zf.writestr(f'page_{page_num + 1:04d}.{page_format}', data)
+                yield done, len(pages)
+
+    def _iter_pdf_to_tiff(self, input_path, output_path, options=None):
+        """渲染的页面按页码顺序逐帧追加到多页TIFF"""
+        from PIL import Image, TiffImagePlugin
+
+        options = options or {}
+        pages = self._get_render_pages(input_path, options)
+        page_order = iter(pages)
+        next_page = next(page_order)
+        # 并行渲染时页面乱序完成，先缓存尚未轮到的页面
+        waiting = {}
+
+        with TiffImagePlugin.AppendingTiffWriter(output_path, new=True) as tf:
+            for done, (page_num, data) in enumerate(
+                self._iter_rendered_pages(input_path, pages, 'png', options), 1
+            ):
+                waiting[page_num] = data
+                while next_page in waiting:
+                    with Image.open(io.BytesIO(waiting.pop(next_page))) as frame:
+                        frame.save(tf, format='TIFF', compression='tiff_deflate')
+                    tf.newFrame()
+                    next_page = next(page_order, None)
+                yield done, len(pages)
+
+    def _iter_pdf_to_image(self, input_path, output_path, target_ext, options=None):
+        """渲染页码范围内的第一页到单个图片文件"""
+        options = options or {}
+        pages = self._get_render_pages(input_path, options)[:1]
+
+        for page_num, data in self._iter_rendered_pages(input_path, pages, target_ext, options):
+            with open(output_path, 'wb') as f:
+                f.write(data)
+        yield 1, 1
+
+    def _get_render_pages(self, input_path, options):
+        """获取需要渲染的页索引"""
+        import fitz  # PyMuPDF
+
+        with fitz.open(input_path) as doc:
+            return parse_page_range(options.get('page_range'), len(doc))
+
+    def _iter_rendered_pages(self, input_path, pages, page_format, options):
+        """渲染PDF页面，按页段顺序产出 (页索引, 图片数据)
+
+        页数较多时按页段分配到多个进程并行渲染，每个进程自行打开文档。
+        """
+        config = settings.CONVERSION_SETTINGS['pdf_render']
+        max_workers = config['max_workers'] or os.cpu_count() or 1
+        dpi = options.get('dpi') or config['default_dpi']
+        # 选项只能降低配置的上限
+        max_pixels = min(options.get('max_pixels') or config['max_pixels'], config['max_pixels'])
+        workers = min(options.get('workers') or max_workers, max_workers)
+        render_args = (input_path, page_format, dpi, max_pixels)
+
+        if workers > 1 and len(pages) >= config['parallel_min_pages']:
+            yield from self._iter_parallel_render(render_args, pages, workers)
+            return
+
+        for page_num in pages:
+            yield from render_pdf_pages(*render_args, [page_num])
+
+    def _iter_parallel_render(self, render_args, pages, workers):
+        """在进程池中按页段渲染
+
+        使用Celery自带的billiard进程池：Celery prefork子进程是守护进程，
+        标准库的进程池在其中不能创建子进程，billiard没有这个限制。
+        """
+        from billiard import Pool
+
+        batches = iter(split_pages(pages, workers * 4))
+        pool = Pool(processes=workers)
+        try:
+            # 限制在途页段数量，避免渲染结果在内存中堆积
+            pending = collections.deque(
+                pool.apply_async(render_pdf_pages, (*render_args, batch))
+                for batch in itertools.islice(batches, workers * 2)
+            )
+            while pending:
+                yield from pending.popleft().get()
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.append(pool.apply_async(render_pdf_pages, (*render_args, batch)))
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
+    def _iter_text_to_pdf(self, input_path, output_path):
+        """逐行排版文本到PDF"""
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+
+        total = _count_lines(input_path)
+        width, height = A4
+        margin = 72
+        line_height = 14
+
+        c = canvas.Canvas(output_path, pagesize=A4)
+        y = height - margin
+        with open(input_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line_num, line in enumerate(f, 1):
+                if y < margin:
+                    c.showPage()
+                    y = height - margin
+                c.drawString(margin, y, line.rstrip('\r\n'))
+                y -= line_height
+                yield line_num, max(total, line_num)
+        c.save()
 
     def convert(self, input_path, output_path):
         """转换文档格式"""
-        source_ext = os.path.splitext(input_path)[1][1:].lower()
-        target_ext = os.path.splitext(output_path)[1][1:].lower()
+        source_ext, target_ext = self._get_formats(input_path, output_path)
 
         if source_ext == 'pdf' and target_ext == 'docx':
             # PDF转Word
+            from pdf2docx import Converter
+
             cv = Converter(input_path)
             cv.convert(output_path)
             cv.close()
 
         elif source_ext == 'docx' and target_ext == 'pdf':
             # Word转PDF
+            from docx import Document
+
             doc = Document(input_path)
             # 使用python-docx-replace保持格式
             temp_path = tempfile.mktemp(suffix='.pdf')
             doc.save(temp_path)
             os.rename(temp_path, output_path)
 
-        elif source_ext == 'pdf' and target_ext in ['jpg', 'png']:
-            # PDF转图片
-            doc = fitz.open(input_path)
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x缩放以提高质量
-                if target_ext == 'jpg':
-                    pix.save(output_path.replace('.jpg', f'_{page_num+1}.jpg'))
-                else:
-                    pix.save(output_path.replace('.png', f'_{page_num+1}.png'))
+        elif (source_ext, target_ext) in self.streaming_formats or target_ext == 'zip':
+            # PDF转图片、文本转PDF
+            for _ in self.iter_convert(input_path, output_path):
+                pass
 
+@register_converter
 class SpreadsheetConverter(BaseConverter):
     """电子表格转换器"""
-    def __init__(self):
-        super().__init__()
-        self.supported_formats = {
-            ('xlsx', 'pdf'), ('xlsx', 'csv'),
-            ('csv', 'xlsx')
-        }
+    supported_formats = frozenset({
+        ('xlsx', 'pdf'), ('xlsx', 'csv'),
+        ('csv', 'xlsx')
+    })
+    streaming_formats = frozenset({
+        ('xlsx', 'csv'), ('csv', 'xlsx')
+    })
 
     def convert(self, input_path, output_path):
         """转换电子表格格式"""
-        source_ext = os.path.splitext(input_path)[1][1:].lower()
-        target_ext = os.path.splitext(output_path)[1][1:].lower()
+        source_ext, target_ext = self._get_formats(input_path, output_path)
 
-        if source_ext == 'xlsx':
-            wb = load_workbook(input_path)
-            if target_ext == 'pdf':
-                # Excel转PDF
-                # 使用win32com或其他库实现
+        if source_ext == 'xlsx' and target_ext == 'pdf':
+            # Excel转PDF
+            # 使用win32com或其他库实现
+            pass
+        else:
+            for _ in self.iter_convert(input_path, output_path):
                 pass
-            elif target_ext == 'csv':
-                # Excel转CSV
-                sheet = wb.active
-                with open(output_path, 'w', newline='', encoding='utf-8') as f:
-                    for row in sheet.rows:
-                        f.write(','.join(str(cell.value or '') for cell in row) + '\n')
+
+    def iter_convert(self, input_path, output_path, options=None):
+        """逐行转换电子表格，内存占用与文件大小无关"""
+        source_ext, target_ext = self._get_formats(input_path, output_path)
+
+        if source_ext == 'xlsx' and target_ext == 'csv':
+            yield from self._iter_xlsx_to_csv(input_path, output_path)
+        elif source_ext == 'csv' and target_ext == 'xlsx':
+            yield from self._iter_csv_to_xlsx(input_path, output_path)
+        else:
+            yield from super().iter_convert(input_path, output_path, options)
+
+    def _iter_xlsx_to_csv(self, input_path, output_path):
+        """Excel转CSV（只读模式逐行读取）"""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(input_path, read_only=True)
+        try:
+            sheet = wb.active
+            total = sheet.max_row or 0
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                for row_num, row in enumerate(sheet.iter_rows(values_only=True), 1):
+                    writer.writerow('' if value is None else value for value in row)
+                    yield row_num, max(total, row_num)
+        finally:
+            wb.close()
+
+    def _iter_csv_to_xlsx(self, input_path, output_path):
+        """CSV转Excel（只写模式逐行写入）"""
+        from openpyxl import Workbook
+
+        total = _count_lines(input_path)
+        wb = Workbook(write_only=True)
+        sheet = wb.create_sheet()
+        with open(input_path, 'r', newline='', encoding='utf-8') as f:
+            for row_num, row in enumerate(csv.reader(f), 1):
+                sheet.append(row)
+                yield row_num, max(total, row_num)
+        wb.save(output_path)
+
+def parse_page_range(page_range, page_count):
+    """解析页码范围（如 "1-3,5"，页码从1开始），返回从0开始的页索引列表"""
+    if not page_range:
+        return list(range(page_count))
+
+    pages = []
+    for part in str(page_range).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else page_count
+        else:
+            start = end = int(part)
+        if start < 1 or end < start:
+            raise ValueError(f'Invalid page range: {part}')
+        pages.extend(range(start - 1, min(end, page_count)))
+
+    pages = sorted(set(pages))
+    if not pages:
+        raise ValueError(f'Page range {page_range} is outside the document')
+    return pages
+
+def split_pages(pages, batch_count):
+    """将页索引切分为不超过 batch_count 个连续页段"""
+    batch_size = max(1, -(-len(pages) // batch_count))
+    return [pages[i:i + batch_size] for i in range(0, len(pages), batch_size)]
+
+def get_page_matrix(page, dpi, max_pixels=None):
+    """计算页面渲染矩阵，单页像素总数超出预算时按比例降低分辨率"""
+    import fitz  # PyMuPDF
+
+    zoom = dpi / 72
+    if max_pixels:
+        pixels = page.rect.width * zoom * page.rect.height * zoom
+        if pixels > max_pixels:
+            zoom *= (max_pixels / pixels) ** 0.5
+    return fitz.Matrix(zoom, zoom)
+
+def render_pdf_pages(input_path, page_format, dpi, max_pixels, pages):
+    """渲染一组PDF页面，返回 [(页索引, 编码后的图片数据)]
+
+    在进程池中运行时每个进程自行打开文档，不共享文档对象。
+    """
+    import fitz  # PyMuPDF
+
+    results = []
+    with fitz.open(input_path) as doc:
+        for page_num in pages:
+            page = doc.load_page(page_num)
+            pix = page.get_pixmap(matrix=get_page_matrix(page, dpi, max_pixels))
+            if page_format == 'jpg':
+                data = pix.tobytes('jpg', jpg_quality=95)
+            else:
+                data = pix.tobytes('png')
+            results.append((page_num, data))
+    return results
+
+def _count_lines(path):
+    """统计文本行数，用于计算流式转换的总工作量"""
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            count += block.count(b'\n')
+    return max(count, 1)
 
 class ConversionFactory:
     """转换器工厂"""
     def __init__(self):
-        self.converters = [
-            ImageConverter(),
-            DocumentConverter(),
-            SpreadsheetConverter()
-        ]
+        # 转换器构造时不导入依赖，可以直接实例化全部已注册的转换器
+        self.converters = [converter_class() for converter_class in _registry]
 
     def get_converter(self, source_format, target_format):
         """获取合适的转换器"""
@@ -151,4 +450,13 @@ class ConversionFactory:
         formats = set()
         for converter in self.converters:
             formats.update(converter.supported_formats)
-        return formats 
\ No newline at end of file
+        return formats
+
+_factory = None
+
+def get_conversion_factory():
+    """获取进程内共享的转换器工厂，避免每个任务重复创建转换器"""
+    global _factory
+    if _factory is None:
+        _factory = ConversionFactory()
+    return _factory 
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""转换耗时预测
+
+按 (源格式, 目标格式, 文件大小档位) 统计最近已完成任务的平均 processing_time，
+样本不足时依次退回到 (源格式, 目标格式) 和全部任务的平均值，都没有时使用默认值。
+只统计实际执行的转换，结果缓存命中和耗时为0的记录不计入。
+统计结果保存在共享缓存中，过期后由一个进程取得锁重新统计，其余进程继续使用过期的统计，
+并发的缓存未命中不会同时统计；预测本身不访问数据库。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, IntegerField, Q, Value, When
+from django.utils import timezone
+from datetime import timedelta
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'conversion_cost_model'
+LOCK_KEY = 'conversion_cost_model:lock'
+REFRESH_LOCK_TIMEOUT = 60  # 统计锁的有效期，持有锁的进程崩溃后最多这么久由其它进程接手（秒）
+FALLBACK_TTL = 10  # 未取得锁时暂用的过期或空统计在本进程缓存的时间（秒）
+STALE_FACTOR = 6  # 过期的统计在共享缓存中保留 refresh_interval 的倍数，供刷新期间使用
+
+def empty_table():
+    """空统计"""
+    return {'buckets': {}, 'pairs': {}, 'all': [0.0, 0], 'built_at': 0}
+
+def size_bucket(file_size, buckets):
+    """文件大小所在的档位序号"""
+    for index, limit in enumerate(buckets):
+        if file_size < limit:
+            return index
+    return len(buckets)
+
+class CostModel:
+    """转换耗时模型"""
+
+    def __init__(self):
+        self.settings = settings.CONVERSION_SETTINGS['cost_model']
+        self._table = None
+        self._expires_at = 0
+
+    def build(self):
+        """从最近已完成的任务统计平均耗时"""
+        from .models import ConversionTask
+
+        buckets = self.settings['size_buckets']
+        bucket = Case(
+            *[When(file_size__lt=limit, then=Value(index)) for index, limit in enumerate(buckets)],
+            default=Value(len(buckets)),
+            output_field=IntegerField()
+        )
+        rows = ConversionTask.objects.filter(
+            status='completed',
+            cache_hit=False,
+            processing_time__gt=timedelta(0),
+            completed_at__gte=timezone.now() - timedelta(days=self.settings['history_days'])
+        ).annotate(bucket=bucket).values(
+            'original_format', 'target_format', 'bucket'
+        ).annotate(avg=Avg('processing_time'), count=Count('id'))
+
+        # 各级统计保存为 键 -> [总秒数, 样本数]，键用字符串以便序列化
+        table = empty_table()
+        table['built_at'] = time.time()
+        for row in rows:
+            total = row['avg'].total_seconds() * row['count']
+            pair = f"{row['original_format'].lower()}:{row['target_format'].lower()}"
+            table['buckets'][f"{pair}:{row['bucket']}"] = [total, row['count']]
+            stats = table['pairs'].setdefault(pair, [0.0, 0])
+            stats[0] += total
+            stats[1] += row['count']
+            table['all'][0] += total
+            table['all'][1] += row['count']
+        return table
+
+    def refresh(self):
+        """重新统计并写入共享缓存"""
+        table = self.build()
+        cache.set(CACHE_KEY, table, timeout=self.settings['refresh_interval'] * STALE_FACTOR)
+        self._set_table(table)
+        logger.info(f"Cost model refreshed from {table['all'][1]} completed tasks")
+        return table
+
+    def table(self):
+        """当前统计，本进程最多缓存 refresh_interval 秒"""
+        if self._table is None or time.monotonic() >= self._expires_at:
+            table = cache.get(CACHE_KEY)
+            if table is None or time.time() >= table.get('built_at', 0) + self.settings['refresh_interval']:
+                table = self._refresh_once(table)
+            else:
+                self._set_table(table)
+        return self._table
+
+    def _refresh_once(self, stale):
+        """只有取得锁的进程重新统计，其余进程暂用过期的统计，没有时使用空统计"""
+        if cache.add(LOCK_KEY, True, timeout=REFRESH_LOCK_TIMEOUT):
+            try:
+                return self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to build cost model: {str(e)}")
+            finally:
+                cache.delete(LOCK_KEY)
+        table = stale or empty_table()
+        self._set_table(table, FALLBACK_TTL)
+        return table
+
+    def invalidate(self):
+        """丢弃统计，下一次预测时重新统计"""
+        cache.delete(CACHE_KEY)
+        self._table = None
+
+    def predict(self, task):
+        """预计处理耗时（秒）"""
+        table = self.table()
+        min_samples = self.settings['min_samples']
+        pair = f"{(task.original_format or '').lower()}:{(task.target_format or '').lower()}"
+        bucket = size_bucket(task.file_size or 0, self.settings['size_buckets'])
+
+        for stats in (table['buckets'].get(f'{pair}:{bucket}'), table['pairs'].get(pair), table['all']):
+            if stats and stats[1] >= min_samples:
+                return stats[0] / stats[1]
+        return float(self.settings['default_seconds'])
+
+    def is_heavy(self, task):
+        """是否为预计耗时较长的任务"""
+        return self.predict(task) >= self.settings['heavy_seconds']
+
+    def predict_completion(self, task, ahead=None):
+        """预计完成时间，已结束的任务返回 None
+
+        排队中的任务加上前面排队任务的等待时间：按先创建的排队任务数、
+        平均耗时和最大并发数估算，不区分各任务的优先级和预计耗时。
+        ahead 为 pending_ahead() 已算出的排队数，未给出时单独查询。
+        """
+        if task.status not in ('pending', 'processing'):
+            return None
+        now = timezone.now()
+        duration = timedelta(seconds=self.predict(task))
+        if task.status == 'processing' and task.started_at:
+            return max(task.started_at + duration, now)
+        return now + self.queue_wait(task, ahead) + duration
+
+    def queue_wait(self, task, ahead=None):
+        """排队任务预计要等待的时间"""
+        from .models import ConversionTask
+
+        if ahead is None:
+            ahead = ConversionTask.objects.filter(status='pending', created_at__lt=task.created_at).count()
+        if not ahead:
+            return timedelta(0)
+        total, count = self.table()['all']
+        average = total / count if count >= self.settings['min_samples'] else self.settings['default_seconds']
+        slots = max(getattr(settings, 'MAX_CONCURRENT_TASKS', 5), 1)
+        return timedelta(seconds=ahead * average / slots)
+
+    def pending_ahead(self, tasks):
+        """用一次查询统计各排队任务前面的排队任务数，返回 {任务ID: 排队数}"""
+        from .models import ConversionTask
+
+        pending = [task for task in tasks if task.status == 'pending']
+        if not pending:
+            return {}
+        counts = ConversionTask.objects.filter(status='pending').aggregate(**{
+            f'ahead_{index}': Count('id', filter=Q(created_at__lt=task.created_at))
+            for index, task in enumerate(pending)
+        })
+        return {task.pk: counts[f'ahead_{index}'] for index, task in enumerate(pending)}
+
+    def poll_after(self, task, completion=None):
+        """建议客户端下次查询状态的间隔（秒），completion 为已算出的预计完成时间"""
+        if completion is None:
+            completion = self.predict_completion(task)
+        if completion is None:
+            return None
+        remaining = (completion - timezone.now()).total_seconds()
+        return int(min(max(remaining / 4, 1), self.settings['max_poll_interval']))
+
+    def _set_table(self, table, ttl=None):
+        self._table = table
+        self._expires_at = time.monotonic() + (ttl or self.settings['refresh_interval'])
+
+cost_model = CostModel()
@@ -0,0 +1,60 @@
+"""转换引擎"""
+from django.conf import settings
+import os
+import logging
+from .converters import get_conversion_factory
+
+logger = logging.getLogger(__name__)
+
+class ConversionEngine:
+    """转换引擎
+
+    按转换器实际完成的工作单元（页、行、瓦片）计算进度，
+    流式转换器在整个过程中只持有单个工作单元的数据。
+    """
+
+    def __init__(self, factory=None, progress_callback=None):
+        self.factory = factory or get_conversion_factory()
+        self.progress_callback = progress_callback
+        self.settings = settings.CONVERSION_SETTINGS
+
+    def get_output_path(self, name, source_format, target_format):
+        """获取临时输出文件路径，多页结果打包时使用打包格式的扩展名"""
+        converter = self.factory.get_converter(source_format, target_format)
+        output_format = converter.get_output_format(source_format.lower(), target_format.lower())
+
+        temp_dir = self.settings['temp_dir']
+        os.makedirs(temp_dir, exist_ok=True)
+        return os.path.join(temp_dir, f"{name}.{output_format}")
+
+    def run(self, input_path, output_path, source_format, target_format, options=None):
+        """执行转换并上报进度"""
+        converter = self.factory.get_converter(source_format, target_format)
+        if not converter.can_stream(source_format.lower(), target_format.lower()):
+            logger.info(
+                f"{converter.__class__.__name__} does not stream "
+                f"{source_format}->{target_format}, converting in one pass"
+            )
+
+        # 输出被打包时转换器据此得知每页的目标格式
+        options = dict(options or {})
+        options.setdefault('target_format', target_format.lower())
+
+        last_progress = None
+        for done, total in converter.iter_convert(input_path, output_path, options):
+            # 完成前最多上报99%，100%留给结果保存之后
+            progress = min(int(done * 100 / total), 99) if total else 0
+            if progress != last_progress:
+                last_progress = progress
+                self._report(progress)
+
+        return output_path
+
+    def _report(self, progress):
+        """上报进度"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(progress)
+        except Exception as e:
+            logger.error(f"Failed to report progress: {str(e)}")
@@ -91,8 +91,8 @@ class ErrorRecoveryManager:
                 task.save()
                 
                 # 重新提交任务
-                from .tasks import convert_file_task
-                convert_file_task.delay(task_id)
+                from .workers import dispatch_conversion
+                dispatch_conversion(task)
                 
                 logger.logger.info(f'Task {task_id} has been recovered')
                 return True
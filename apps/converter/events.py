@@ -0,0 +1,98 @@
+"""转换任务生命周期事件
+
+任务入队、开始处理、结束时发布事件，调度器订阅后立即派发或更新运行中任务计数，
+不再按固定间隔查询数据库。事件通过Redis发布/订阅在节点间传递，缓存后端不是Redis时只在本进程内传递。
+事件只用于唤醒调度器，丢失的事件由调度器定期与数据库对账弥补。
+"""
+from django.db import transaction
+from django_redis import get_redis_connection
+import json
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SUBMITTED = 'submitted'
+STARTED = 'started'
+FINISHED = 'finished'
+
+class RedisSubscription:
+    """Redis频道订阅"""
+
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.pubsub.subscribe(channel)
+
+    def get(self, timeout):
+        """等待下一个事件，超时返回 None"""
+        message = self.pubsub.get_message(timeout=timeout)
+        return json.loads(message['data']) if message else None
+
+    def close(self):
+        self.pubsub.close()
+
+class LocalSubscription:
+    """进程内订阅"""
+
+    def __init__(self, events):
+        self.events = events
+        self.messages = queue.Queue()
+
+    def get(self, timeout):
+        try:
+            return self.messages.get(timeout=timeout) if timeout > 0 else self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.events.unsubscribe_local(self)
+
+class TaskEvents:
+    """任务事件的发布和订阅"""
+    CHANNEL = 'converter:task_events'
+
+    def __init__(self):
+        self._local = []
+        self._lock = threading.Lock()
+
+    def publish(self, event, task):
+        """发布任务事件，失败只记录日志"""
+        from .cost_model import cost_model
+
+        message = {
+            'event': event,
+            'task_id': str(task.id),
+            'heavy': cost_model.is_heavy(task)
+        }
+        try:
+            get_redis_connection('default').publish(self.CHANNEL, json.dumps(message))
+        except NotImplementedError:
+            with self._lock:
+                subscriptions = list(self._local)
+            for subscription in subscriptions:
+                subscription.messages.put(message)
+        except Exception as e:
+            logger.warning(f"Failed to publish task event {event} for {task.id}: {str(e)}")
+
+    def publish_on_commit(self, event, task):
+        """当前事务提交后发布，订阅方读到的任务状态已经生效"""
+        transaction.on_commit(lambda: self.publish(event, task))
+
+    def subscribe(self):
+        """订阅任务事件，返回带 get(timeout) 和 close() 的订阅对象"""
+        try:
+            pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+        except NotImplementedError:
+            subscription = LocalSubscription(self)
+            with self._lock:
+                self._local.append(subscription)
+            return subscription
+        return RedisSubscription(pubsub, self.CHANNEL)
+
+    def unsubscribe_local(self, subscription):
+        with self._lock:
+            if subscription in self._local:
+                self._local.remove(subscription)
+
+task_events = TaskEvents()
@@ -0,0 +1,536 @@
+"""大图片转换
+
+每个转换任务受像素上限和内存上限约束，Pillow 只在确实需要时解码像素：
+
+- JPEG 缩小时用 draft() 在DCT阶段按 1/2~1/8 解码，预览和优化器的缩略图
+  也通过 downscale_image() 走这条路径；
+- 整数倍缩小由 resize(reducing_gap=...) 先走 reduce()；
+- 整图解码超出内存上限时，可按行定位数据的未压缩格式（BMP、未压缩TIFF、PPM）
+  和非隔行扫描的PNG按条带逐段解码、转换颜色模式和缩放，PNG输出同样逐条带写入；
+  PNG按顺序解压IDAT数据流，每个条带的过滤数据连同上一行的原始数据交给Pillow反过滤；
+- 无法按条带解码（隔行扫描的PNG、每像素超过4字节的16位彩色PNG、GIF、压缩的TIFF）
+  且超出上限的图片直接拒绝，而不是让工作进程被OOM杀死。
+"""
+import io
+import math
+import functools
+import zlib
+import struct
+import logging
+import warnings
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 原始数据每像素位数，用于计算未给出行跨度的数据块
+_RAW_BITS = {
+    '1': 1, 'L': 8, 'P': 8, 'LA': 16,
+    'RGB': 24, 'BGR': 24, 'RGBA': 32, 'RGBX': 32, 'BGRA': 32, 'BGRX': 32,
+    'CMYK': 32, 'I': 32, 'F': 32, 'I;16': 16, 'I;16B': 16,
+}
+
+# 可逐条带写入的PNG颜色类型
+_PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+
+# PNG颜色类型的通道数
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# 按条带反过滤时使用的8位颜色类型，键为过滤器的字节步长（每像素字节数，至少为1），
+# 解码结果的字节与原始数据逐字节相同
+_PNG_BYTE_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+_bomb_limit_lock = threading.Lock()
+
+class ImageTooLargeError(ValueError):
+    """图片超出像素上限或内存上限"""
+
+def get_image_limits(options=None):
+    """获取图片处理上限，转换选项只能调低配置的上限"""
+    limits = dict(settings.CONVERSION_SETTINGS['image'])
+    for key in ('max_pixels', 'max_memory'):
+        if options and options.get(key):
+            limits[key] = min(options[key], limits[key])
+    return limits
+
+def estimate_memory(size, mode):
+    """估算解码后的内存占用（Pillow 内部多通道8位图按每像素4字节存储）"""
+    width, height = size
+    if mode in ('1', 'L', 'P'):
+        bytes_per_pixel = 1
+    elif mode.startswith('I;16'):
+        bytes_per_pixel = 2
+    else:
+        bytes_per_pixel = 4
+    return width * height * bytes_per_pixel
+
+@contextmanager
+def _bomb_limit(max_pixels):
+    """临时放宽 Pillow 的解压炸弹上限
+
+    像素上限由本模块检查。Pillow 的解压炸弹上限是进程级全局设置，
+    只在读取文件头期间放宽到同一上限，随后恢复，预览、优化器等其他调用方仍受原上限保护。
+    """
+    from PIL import Image
+
+    with _bomb_limit_lock:
+        previous = Image.MAX_IMAGE_PIXELS
+        if previous and previous < max_pixels:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                yield
+        finally:
+            Image.MAX_IMAGE_PIXELS = previous
+
+def open_image(path, max_pixels):
+    """只读取文件头打开图片，超出像素上限时抛出 ImageTooLargeError"""
+    from PIL import Image
+
+    try:
+        with _bomb_limit(max_pixels):
+            img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLargeError(
+            f"Image of {width}x{height} exceeds pixel limit of {max_pixels}"
+        )
+    return img
+
+def get_output_mode(mode, target_format):
+    """获取目标格式使用的颜色模式"""
+    if mode in ('RGBA', 'LA') and target_format in ('jpg', 'jpeg'):
+        return 'RGB'
+    if mode == 'P':
+        return 'RGB'
+    return mode
+
+def to_output_mode(img, target_format):
+    """转换颜色模式，透明图片转JPEG时铺白色背景"""
+    from PIL import Image
+
+    if img.mode in ('RGBA', 'LA') and target_format in ('jpg', 'jpeg'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode == 'P':
+        return img.convert('RGB')
+    return img
+
+def get_save_options(target_format, options=None):
+    """获取保存参数"""
+    options = options or {}
+    save_options = {
+        'format': 'JPEG' if target_format in ('jpg', 'jpeg') else target_format.upper(),
+        'quality': options.get('jpeg_quality', 95),
+        'optimize': True
+    }
+    if options.get('dpi'):
+        save_options['dpi'] = (options['dpi'], options['dpi'])
+    return save_options
+
+def fit_size(size, max_size):
+    """按比例缩小到 max_size 以内的尺寸，不放大"""
+    ratio = min(max_size[0] / size[0], max_size[1] / size[1])
+    if ratio >= 1:
+        return tuple(size)
+    return tuple(max(1, int(dim * ratio)) for dim in size)
+
+def downscale_image(img, max_size, reducing_gap=2.0):
+    """按比例缩小图片到 max_size 以内
+
+    JPEG在DCT阶段按 1/2~1/8 解码到不小于目标尺寸 reducing_gap 倍的大小，
+    其余格式先用 reduce() 整数倍缩小，再用LANCZOS缩放到目标尺寸。
+    图片未解码时才能按比例解码，需在 load() 之前调用。
+    """
+    from PIL import Image
+
+    target_size = fit_size(img.size, max_size)
+    if target_size == img.size:
+        return img
+
+    if img.format == 'JPEG':
+        img.draft(None, tuple(int(dim * reducing_gap) for dim in target_size))
+    return img.resize(target_size, Image.LANCZOS, reducing_gap=reducing_gap)
+
+def convert_image(input_path, output_path, target_format, size=None, options=None):
+    """转换图片格式并按需缩放到指定尺寸"""
+    for _ in iter_convert_image(input_path, output_path, target_format, size, options):
+        pass
+    return output_path
+
+def iter_convert_image(input_path, output_path, target_format, size=None, options=None):
+    """转换图片，每完成一个条带产出 (已完成数, 总数)
+
+    整图能放进内存上限时一次完成，否则按条带处理。
+    """
+    from PIL import Image
+
+    target_format = target_format.lower()
+    limits = get_image_limits(options)
+    save_options = get_save_options(target_format, options)
+
+    with open_image(input_path, limits['max_pixels']) as img:
+        target_size = tuple(size) if size else img.size
+        out_mode = get_output_mode(img.mode, target_format)
+        output_memory = estimate_memory(target_size, out_mode)
+
+        # JPEG在解码阶段按比例缩小，解码出的尺寸不小于目标尺寸
+        if img.format == 'JPEG' and size:
+            img.draft(None, target_size)
+
+        source_memory = estimate_memory(img.size, img.mode)
+        if source_memory + output_memory <= limits['max_memory']:
+            img = to_output_mode(img, target_format)
+            if img.size != target_size:
+                img = img.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+            img.save(output_path, **save_options)
+            yield 1, 1
+            return
+
+        if not is_strip_decodable(img):
+            raise ImageTooLargeError(
+                f"Decoding {img.format} image of {img.width}x{img.height} needs "
+                f"{source_memory // (1024 * 1024)}MB, exceeding the limit of "
+                f"{limits['max_memory'] // (1024 * 1024)}MB"
+            )
+
+        logger.info(
+            f"Converting {img.width}x{img.height} {img.format} image in strips "
+            f"({source_memory // (1024 * 1024)}MB decoded)"
+        )
+        yield from _iter_strips(
+            img, output_path, target_format, target_size, save_options, limits['max_memory']
+        )
+
+def is_strip_decodable(img):
+    """检查图片能否按条带解码
+
+    未压缩的整行数据块可以按行定位，非隔行扫描的PNG可以顺序解压；
+    16位彩色PNG每像素超过4字节，没有逐字节相同的反过滤方式，不能按条带解码。
+    """
+    if img.format == 'PNG':
+        header = _read_png_header(img.filename)
+        return header is not None and header['interlace'] == 0 and header['bpp'] in _PNG_BYTE_TYPES
+    if not img.tile:
+        return False
+    for name, extents, _, args in img.tile:
+        if name != 'raw' or extents[0] != 0 or extents[2] != img.width:
+            return False
+        rawmode, stride, ystep = _raw_args(args)
+        if ystep not in (1, -1) or (not stride and rawmode not in _RAW_BITS):
+            return False
+    return True
+
+def _read_png_header(path):
+    """读取PNG文件头，返回位深、颜色类型、隔行方式、每像素字节数和每行字节数"""
+    with open(path, 'rb') as f:
+        head = f.read(8 + 8 + 13)
+    if len(head) < 29 or head[12:16] != b'IHDR':
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', head[16:29])
+    if color_type not in _PNG_CHANNELS:
+        return None
+    bits = _PNG_CHANNELS[color_type] * bit_depth
+    return {
+        'width': width,
+        'height': height,
+        'bit_depth': bit_depth,
+        'color_type': color_type,
+        'interlace': interlace,
+        'bpp': max(1, bits // 8),
+        'row_bytes': (width * bits + 7) // 8,
+    }
+
+def _raw_args(args):
+    """规范化 raw 解码参数为 (rawmode, stride, ystep)"""
+    if isinstance(args, str):
+        args = (args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    ystep = args[2] if len(args) > 2 else 1
+    return rawmode, stride, ystep
+
+def _band_tiles(tiles, width, top, bottom):
+    """截取 [top, bottom) 行对应的数据块，坐标换算到条带内"""
+    band_tiles = []
+    for name, (_, y0, _, y1), offset, args in tiles:
+        start, end = max(y0, top), min(y1, bottom)
+        if start >= end:
+            continue
+        rawmode, stride, ystep = _raw_args(args)
+        stride = stride or (width * _RAW_BITS[rawmode] + 7) // 8
+        if ystep == 1:
+            offset += (start - y0) * stride
+        else:
+            # 自底向上存储（BMP）
+            offset += (y1 - end) * stride
+        band_tiles.append(
+            (name, (0, start - top, width, end - top), offset, (rawmode, stride, ystep))
+        )
+    return band_tiles
+
+def _decode_rows(img, top, bottom):
+    """只解码 [top, bottom) 行"""
+    from PIL import Image
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        band = Image.open(img.filename)
+    band._size = (img.width, bottom - top)
+    band.tile = _band_tiles(img.tile, img.width, top, bottom)
+    band.load()
+    return band
+
+class PNGStripReader:
+    """按行顺序解码非隔行扫描的PNG
+
+    IDAT数据流用 zlib.decompressobj 按需解压，只持有当前条带的数据。
+    过滤器只依赖同一行的前 bpp 个字节和上一行，条带的过滤数据前面加上
+    上一行反过滤后的原始数据（过滤类型为 None），按每像素字节数相同的8位颜色类型
+    组成一个小PNG交给Pillow反过滤，再按原图的原始模式解包。
+    请求的行区间只能向后移动，与上一个条带重叠的行从缓存中取出。
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, img):
+        from PIL.PngImagePlugin import _MODES
+
+        self.header = _read_png_header(img.filename)
+        if self.header is None or self.header['interlace'] or self.header['bpp'] not in _PNG_BYTE_TYPES:
+            raise ImageTooLargeError(f"PNG image {img.filename} cannot be decoded in strips")
+        self.mode, self.rawmode = _MODES[(self.header['bit_depth'], self.header['color_type'])]
+        self.palette = img.getpalette() if img.mode == 'P' else None
+        self.transparency = img.info.get('transparency')
+        self.file = open(img.filename, 'rb')
+        self.file.seek(8)
+        self.decompressor = zlib.decompressobj()
+        self.chunk_left = 0
+        self.pending = b''
+        # 已解码到的行，以及 [cache_top, next_row) 行反过滤后的原始数据
+        self.next_row = 0
+        self.cache_top = 0
+        self.cache = b''
+
+    def read(self, top, bottom):
+        """解码 [top, bottom) 行，返回原图颜色模式的条带"""
+        from PIL import Image
+
+        row_bytes = self.header['row_bytes']
+        if top < self.cache_top:
+            raise ValueError('PNG strips must be read in order')
+        if bottom > self.next_row:
+            self.cache += self._unfilter(bottom - self.next_row)
+            self.next_row = bottom
+        # 丢弃之后不再需要的行，至少保留最后一行供下一个条带反过滤
+        drop = min(top, self.next_row - 1) - self.cache_top
+        self.cache = self.cache[drop * row_bytes:]
+        self.cache_top += drop
+        start = (top - self.cache_top) * row_bytes
+        data = self.cache[start:start + (bottom - top) * row_bytes]
+
+        band = Image.frombytes(self.mode, (self.header['width'], bottom - top), data, 'raw', self.rawmode)
+        if self.palette is not None:
+            band.putpalette(self.palette)
+        if self.transparency is not None:
+            band.info['transparency'] = self.transparency
+        return band
+
+    def close(self):
+        self.file.close()
+
+    def _unfilter(self, rows):
+        """反过滤接下来的 rows 行，返回原始数据"""
+        from PIL import Image
+
+        row_bytes = self.header['row_bytes']
+        bpp = self.header['bpp']
+        filtered = self._read_stream(rows * (row_bytes + 1))
+        previous = self.cache[-row_bytes:] if self.next_row else b''
+        if previous:
+            filtered = b'\x00' + previous + filtered
+
+        count = rows + (1 if previous else 0)
+        png = io.BytesIO()
+        png.write(b'\x89PNG\r\n\x1a\n')
+        _write_png_chunk(png, b'IHDR', struct.pack(
+            '>IIBBBBB', row_bytes // bpp, count, 8, _PNG_BYTE_TYPES[bpp], 0, 0, 0
+        ))
+        # 数据已在内存中，不再压缩
+        _write_png_chunk(png, b'IDAT', zlib.compress(filtered, 0))
+        _write_png_chunk(png, b'IEND', b'')
+        png.seek(0)
+        with _bomb_limit(row_bytes // bpp * count):
+            decoded = Image.open(png)
+        with decoded:
+            raw = decoded.tobytes()
+        return raw[row_bytes:] if previous else raw
+
+    def _read_stream(self, size):
+        """从IDAT数据流中解压 size 字节"""
+        parts = [self.pending]
+        length = len(self.pending)
+        while length < size:
+            if self.decompressor.unconsumed_tail:
+                data = self.decompressor.unconsumed_tail
+            else:
+                data = self._read_idat()
+                if not data:
+                    raise ValueError('Truncated PNG image data')
+            chunk = self.decompressor.decompress(data, size - length)
+            parts.append(chunk)
+            length += len(chunk)
+        data = b''.join(parts)
+        self.pending = data[size:]
+        return data[:size]
+
+    def _read_idat(self):
+        """读取下一段IDAT数据，数据流结束时返回空字节串"""
+        while not self.chunk_left:
+            header = self.file.read(8)
+            if len(header) < 8:
+                return b''
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IDAT':
+                self.chunk_left = length
+            elif chunk_type == b'IEND':
+                return b''
+            else:
+                self.file.seek(length + 4, io.SEEK_CUR)
+                continue
+            if not length:
+                self.file.seek(4, io.SEEK_CUR)
+        data = self.file.read(min(self.chunk_left, self.READ_SIZE))
+        self.chunk_left -= len(data)
+        if not self.chunk_left:
+            # 跳过CRC
+            self.file.seek(4, io.SEEK_CUR)
+        return data
+
+def _write_png_chunk(file, chunk_type, data):
+    """写入一个PNG数据块"""
+    file.write(struct.pack('>I', len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+def _iter_strips(img, output_path, target_format, target_size, save_options, max_memory):
+    """按条带解码、转换颜色模式和缩放
+
+    PNG输出逐条带压缩写入，其他格式的编码器需要完整图像，输出图像须在内存上限内。
+    """
+    from PIL import Image
+
+    width, height = img.size
+    target_width, target_height = target_size
+    out_mode = get_output_mode(img.mode, target_format)
+    stream_png = target_format == 'png' and out_mode in _PNG_COLOR_TYPES
+
+    available = max_memory
+    if not stream_png:
+        available -= estimate_memory(target_size, out_mode)
+    # 条带解码、颜色转换和缩放各持有一份数据
+    row_memory = estimate_memory((width, 1), img.mode) * 3
+    if available < row_memory:
+        raise ImageTooLargeError(
+            f"Output image of {target_width}x{target_height} does not fit "
+            f"in the memory limit of {max_memory // (1024 * 1024)}MB"
+        )
+
+    scale = height / target_height
+    resized = target_size != img.size
+    # 缩放时多解码LANCZOS滤波半径内的行，避免条带接缝
+    margin = math.ceil(3 * max(scale, 1)) + 1 if resized else 0
+    source_rows = max(1, available // row_memory - 2 * margin)
+    out_rows = max(1, int(source_rows / scale))
+    total = math.ceil(target_height / out_rows) + 1
+
+    if img.format == 'PNG':
+        reader = PNGStripReader(img)
+        decode_rows = reader.read
+    else:
+        reader = None
+        decode_rows = functools.partial(_decode_rows, img)
+    if stream_png:
+        writer = PNGStripWriter(output_path, target_size, out_mode)
+    else:
+        output = Image.new(out_mode, target_size)
+
+    try:
+        for index, out_top in enumerate(range(0, target_height, out_rows), 1):
+            out_bottom = min(out_top + out_rows, target_height)
+            box_top, box_bottom = out_top * scale, out_bottom * scale
+            top = max(0, int(box_top) - margin)
+            bottom = min(height, math.ceil(box_bottom) + margin)
+
+            with decode_rows(top, bottom) as band:
+                strip = to_output_mode(band, target_format)
+                if resized:
+                    strip = strip.resize(
+                        (target_width, out_bottom - out_top), Image.LANCZOS,
+                        box=(0, box_top - top, width, box_bottom - top)
+                    )
+                if stream_png:
+                    writer.write(strip)
+                else:
+                    output.paste(strip, (0, out_top))
+            yield index, total
+
+        if stream_png:
+            writer.close()
+        else:
+            output.save(output_path, **save_options)
+    finally:
+        if stream_png:
+            writer.abort()
+        if reader is not None:
+            reader.close()
+    yield total, total
+
+class PNGStripWriter:
+    """逐条带写入PNG，任何时刻只持有一个条带的数据"""
+
+    def __init__(self, path, size, mode):
+        self.width, self.height = size
+        self.mode = mode
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(6)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', self.width, self.height, 8, _PNG_COLOR_TYPES[mode], 0, 0, 0
+        ))
+
+    def write(self, strip):
+        """写入一个条带，每行使用 None 过滤"""
+        data = strip.tobytes()
+        row_bytes = len(data) // strip.height
+        raw = b''.join(
+            b'\x00' + data[offset:offset + row_bytes]
+            for offset in range(0, len(data), row_bytes)
+        )
+        compressed = self.compressor.compress(raw)
+        if compressed:
+            self._write_chunk(b'IDAT', compressed)
+
+    def close(self):
+        """结束压缩流并写入文件尾"""
+        if self.file.closed:
+            return
+        self._write_chunk(b'IDAT', self.compressor.flush())
+        self._write_chunk(b'IEND', b'')
+        self.file.close()
+
+    def abort(self):
+        """异常时关闭文件"""
+        if not self.file.closed:
+            self.file.close()
+
+    def _write_chunk(self, chunk_type, data):
+        _write_png_chunk(self.file, chunk_type, data)
@@ -123,10 +123,12 @@ class LogAnalyzer:
         
         # 获取每日任务数量
         daily_counts = []
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
         for i in range(7):
-            date = timezone.now().date() - timedelta(days=i)
+            start = today - timedelta(days=i)
             count = ConversionTask.objects.filter(
-                created_at__date=date,
+                created_at__gte=start,
+                created_at__lt=start + timedelta(days=1),
                 status='completed'
             ).count()
             daily_counts.append(count)
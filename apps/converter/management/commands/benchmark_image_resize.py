@@ -0,0 +1,85 @@
+"""JPEG缩略图基准测试"""
+from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+import shutil
+import resource
+import tempfile
+
+# 测试照片尺寸（像素）
+PHOTO_SIZES = {
+    '12MP': (4000, 3000),
+    '48MP': (8000, 6000),
+}
+
+def _full_decode(path, max_size):
+    """全分辨率解码后缩放"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.load()
+        img.thumbnail(max_size, Image.LANCZOS, reducing_gap=None)
+        return img.size
+
+def _draft_decode(path, max_size):
+    """按比例解码后缩放"""
+    from PIL import Image
+    from apps.converter.imaging import downscale_image
+
+    with Image.open(path) as img:
+        return downscale_image(img, max_size).size
+
+def _measure(func, path, max_size, repeat):
+    """在独立进程中测量平均耗时和峰值内存增量"""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(path, max_size)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下 ru_maxrss 单位为KB
+    return elapsed, (peak - baseline) / 1024
+
+class Command(BaseCommand):
+    help = '比较JPEG全分辨率解码与按比例解码生成缩略图的耗时和峰值内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=800, help='缩略图最大边长')
+        parser.add_argument('--repeat', type=int, default=3, help='每种方式重复次数')
+
+    def handle(self, *args, **options):
+        max_size = (options['size'], options['size'])
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.stdout.write(
+                f"{'photo':>6} {'method':>8} {'ms':>10} {'peak(MB)':>10} {'speedup':>8}"
+            )
+            for label, size in PHOTO_SIZES.items():
+                path = self._create_photo(temp_dir, label, size)
+                baseline = None
+                for method, func in (('full', _full_decode), ('draft', _draft_decode)):
+                    # 每种方式使用新进程，峰值内存互不影响
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        elapsed, peak_mb = executor.submit(
+                            _measure, func, path, max_size, options['repeat']
+                        ).result()
+                    baseline = baseline or elapsed
+                    self.stdout.write(
+                        f"{label:>6} {method:>8} {elapsed * 1000:>10.1f} "
+                        f"{peak_mb:>10.1f} {baseline / elapsed:>7.2f}x"
+                    )
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _create_photo(self, temp_dir, label, size):
+        """生成带渐变和噪点的测试照片"""
+        from PIL import Image
+
+        gradient = Image.linear_gradient('L').resize(size)
+        noise = Image.effect_noise(size, 40)
+        img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+
+        path = os.path.join(temp_dir, f'{label}.jpg')
+        img.save(path, 'JPEG', quality=90)
+        return path
@@ -0,0 +1,63 @@
+"""PDF并行渲染基准测试"""
+from django.core.management.base import BaseCommand
+from apps.converter.converters import DocumentConverter
+import os
+import time
+import shutil
+import tempfile
+
+class Command(BaseCommand):
+    help = '测量PDF转图片在不同进程数下的耗时和加速比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdf', nargs='?', help='PDF文件路径，未指定时生成测试文档')
+        parser.add_argument('--pages', type=int, default=60, help='生成测试文档的页数')
+        parser.add_argument('--workers', default='1,2,4,8', help='要测试的进程数，逗号分隔')
+        parser.add_argument('--dpi', type=int, default=144)
+        parser.add_argument('--format', default='png', choices=['png', 'jpg', 'tiff'])
+
+    def handle(self, *args, **options):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input_path = options['pdf'] or self._create_sample(temp_dir, options['pages'])
+            worker_counts = [int(w) for w in options['workers'].split(',')]
+
+            self.stdout.write(f"CPU cores: {os.cpu_count()}")
+            self.stdout.write(f"{'workers':>8} {'seconds':>10} {'pages/s':>10} {'speedup':>8}")
+
+            baseline = None
+            for workers in worker_counts:
+                converter = DocumentConverter()
+                output_format = converter.get_output_format('pdf', options['format'])
+                output_path = os.path.join(temp_dir, f'out_{workers}.{output_format}')
+
+                start = time.perf_counter()
+                pages = 0
+                for pages, _ in converter.iter_convert(
+                    input_path, output_path,
+                    {'dpi': options['dpi'], 'workers': workers, 'target_format': options['format']}
+                ):
+                    pass
+                elapsed = time.perf_counter() - start
+
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f"{workers:>8} {elapsed:>10.2f} {pages / elapsed:>10.1f} {baseline / elapsed:>7.2f}x"
+                )
+                os.remove(output_path)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _create_sample(self, temp_dir, page_count):
+        """生成包含文字和图形的测试文档"""
+        import fitz  # PyMuPDF
+
+        path = os.path.join(temp_dir, 'sample.pdf')
+        with fitz.open() as doc:
+            for i in range(page_count):
+                page = doc.new_page()
+                for row in range(40):
+                    page.insert_text((50, 60 + row * 18), f'Page {i + 1} line {row + 1} ' * 3)
+                page.draw_circle((300, 420), 150, color=(0, 0, 1), fill=(0.8, 0.9, 1))
+            doc.save(path)
+        return path
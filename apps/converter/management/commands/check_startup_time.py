@@ -0,0 +1,94 @@
+"""Web进程启动时间检查"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import sys
+import subprocess
+
+def parse_import_times(output):
+    """解析 python -X importtime 的输出
+
+    返回 [(模块名, 自身耗时us, 累计耗时us, 嵌套深度)]。
+    """
+    results = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # 表头行
+            continue
+        # 模块名前固定一个空格，之后每层嵌套缩进两个空格
+        name = parts[2].rstrip()[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        results.append((name.strip(), self_us, cumulative_us, depth))
+    return results
+
+class Command(BaseCommand):
+    help = '统计Web进程启动时各模块的导入耗时，超出预算时失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=float,
+            help='导入总耗时预算（毫秒），默认读取 STARTUP_TIME_BUDGET'
+        )
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='显示耗时最多的模块数量'
+        )
+
+    def handle(self, *args, **options):
+        config = settings.STARTUP_TIME_BUDGET
+        budget_ms = options['budget'] or config['max_import_ms']
+
+        output = self._run_import(config['modules'])
+        results = parse_import_times(output)
+        if not results:
+            raise CommandError('Failed to collect import times')
+
+        # 顶层导入的累计耗时之和即为总导入耗时
+        total_ms = sum(cumulative for _, _, cumulative, depth in results if depth == 0) / 1000
+
+        self.stdout.write(f"{'module':<60} {'self(ms)':>10} {'total(ms)':>10}")
+        slowest = sorted(results, key=lambda r: r[2], reverse=True)[:options['top']]
+        for name, self_us, cumulative_us, _ in slowest:
+            self.stdout.write(f"{name:<60} {self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}")
+        self.stdout.write(f"Total import time: {total_ms:.1f}ms (budget {budget_ms:.0f}ms)")
+
+        errors = []
+        imported = {name for name, _, _, _ in results}
+        forbidden = sorted(
+            module for module in config['forbidden_modules']
+            if module in imported
+        )
+        if forbidden:
+            errors.append(f"Heavy modules imported at boot: {', '.join(forbidden)}")
+        if total_ms > budget_ms:
+            errors.append(f"Import time {total_ms:.1f}ms exceeds budget of {budget_ms:.0f}ms")
+
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('Startup time within budget'))
+
+    def _run_import(self, modules):
+        """在全新的子进程中导入Web进程模块"""
+        code = 'import django; django.setup(); ' + '; '.join(
+            f'import {module}' for module in modules
+        )
+        env = os.environ.copy()
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Failed to import web modules:\n{result.stderr[-2000:]}")
+        return result.stderr
@@ -0,0 +1,23 @@
+"""运行任务调度器"""
+from django.core.management.base import BaseCommand
+from apps.converter.scheduler import TaskScheduler
+import signal
+import threading
+
+class Command(BaseCommand):
+    help = '运行任务调度器进程，从共享队列派发转换任务（需要设置 CONVERTER_SCHEDULER_ENABLED=1）'
+
+    def handle(self, *args, **options):
+        stopped = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopped.set())
+
+        scheduler = TaskScheduler()
+        scheduler.start()
+        self.stdout.write(f'Scheduler {scheduler.node_id} started')
+        try:
+            stopped.wait()
+        finally:
+            # 主动让出领导权，备用节点下次续约时即可接任
+            scheduler.stop()
+        self.stdout.write(f'Scheduler {scheduler.node_id} stopped')
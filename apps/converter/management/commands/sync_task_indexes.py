@@ -0,0 +1,48 @@
+"""转换任务索引同步"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.converter.models import ConversionTask
+
+class Command(BaseCommand):
+    help = '在已有的转换任务表上创建模型中声明但缺失的索引，PostgreSQL上不锁表创建'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只列出需要变更的索引')
+
+    def handle(self, *args, **options):
+        model = ConversionTask
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, table)
+
+        missing = [index for index in model._meta.indexes if index.name not in existing]
+        # user 外键的单列索引已由 (user, created_at) 复合索引覆盖
+        user_column = model._meta.get_field('user').column
+        redundant = [
+            name for name, info in existing.items()
+            if info['index'] and not info['primary_key'] and not info['unique']
+            and info['columns'] == [user_column]
+        ]
+
+        for index in missing:
+            self.stdout.write(f'create {index.name}')
+        for name in redundant:
+            self.stdout.write(f'drop {name}')
+        if options['dry_run']:
+            return
+
+        concurrently = connection.vendor == 'postgresql'
+        # 并发建索引不能在事务中执行
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for index in missing:
+                if concurrently:
+                    schema_editor.add_index(model, index, concurrently=True)
+                else:
+                    schema_editor.add_index(model, index)
+            for name in redundant:
+                keyword = 'CONCURRENTLY ' if concurrently else ''
+                schema_editor.execute(f'DROP INDEX {keyword}IF EXISTS {schema_editor.quote_name(name)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{table}: {len(missing)} indexes created, {len(redundant)} dropped'
+        ))
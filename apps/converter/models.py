@@ -18,7 +18,8 @@ class ConversionTask(models.Model):
         ('failed', _('Failed')),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('User'))
+    # 由 (user, created_at) 复合索引覆盖
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name=_('User'))
     original_file = models.FileField(upload_to='uploads/%Y/%m/%d/', verbose_name=_('Original File'))
     converted_file = models.FileField(upload_to='converted/%Y/%m/%d/', null=True, blank=True, verbose_name=_('Converted File'))
     original_format = models.CharField(max_length=10, verbose_name=_('Original Format'))
@@ -27,9 +28,14 @@ class ConversionTask(models.Model):
     error_message = models.TextField(null=True, blank=True, verbose_name=_('Error Message'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Created At'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Updated At'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Started At'))
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Completed At'))
     processing_time = models.DurationField(null=True, blank=True, verbose_name=_('Processing Time'))
     file_size = models.BigIntegerField(default=0, verbose_name=_('File Size'))
+    file_hash = models.CharField(max_length=64, blank=True, default='', verbose_name=_('File Hash'))
     retry_count = models.IntegerField(default=0, verbose_name=_('Retry Count'))
+    options = models.JSONField(default=dict, blank=True, verbose_name=_('Options'))
+    cache_hit = models.BooleanField(default=False, verbose_name=_('Served From Cache'))
     progress = models.IntegerField(
         default=0,
         verbose_name=_('Progress')
@@ -39,6 +45,24 @@ class ConversionTask(models.Model):
         verbose_name = _('Conversion Task')
         verbose_name_plural = _('Conversion Tasks')
         ordering = ['-created_at']
+        indexes = [
+            # 用户历史列表、每日限额和用户统计；包含列使计数和求和只读索引
+            models.Index(
+                fields=['user', '-created_at'],
+                include=['status', 'file_size'],
+                name='conv_task_user_created_idx'
+            ),
+            # 调度器的并发计数和超时恢复，只索引未结束的少量任务
+            models.Index(
+                fields=['status', 'started_at'],
+                condition=models.Q(status__in=['pending', 'processing']),
+                name='conv_task_active_idx'
+            ),
+            # 按状态的统计和最近失败任务
+            models.Index(fields=['status', '-created_at'], name='conv_task_status_created_idx'),
+            # 按时间范围的统计和清理
+            models.Index(fields=['created_at'], name='conv_task_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.original_format} -> {self.target_format} ({self.status})"
@@ -1,10 +1,8 @@
 """文件优化器集合"""
 from PIL import Image
 import os
-from pdf2image import convert_from_path
-import img2pdf
-import PyPDF2
 from io import BytesIO
+from .imaging import downscale_image
 
 class FileOptimizer:
     """文件优化基类"""
@@ -42,11 +40,8 @@ class ImageOptimizer(FileOptimizer):
     def resize_image(self, file_path, output_path, max_size):
         """调整图片大小"""
         with Image.open(file_path) as img:
-            # 计算新尺寸
-            ratio = min(max_size[0]/img.size[0], max_size[1]/img.size[1])
-            if ratio < 1:
-                new_size = tuple(int(dim * ratio) for dim in img.size)
-                img = img.resize(new_size, Image.LANCZOS)
+            # 按比例缩小，JPEG在解码阶段先缩小
+            img = downscale_image(img, max_size)
             
             img.save(output_path, quality=95, optimize=True)
 
@@ -65,6 +60,9 @@ class PDFOptimizer(FileOptimizer):
         }
         dpi = dpi_settings[quality]
 
+        from pdf2image import convert_from_path
+        import img2pdf
+
         # 将PDF转换为图片
         images = convert_from_path(file_path, dpi=dpi)
         
@@ -85,6 +83,8 @@ class PDFOptimizer(FileOptimizer):
 
     def merge_pdfs(self, file_paths, output_path):
         """合并多个PDF文件"""
+        import PyPDF2
+
         merger = PyPDF2.PdfMerger()
         
         for path in file_paths:
@@ -95,6 +95,8 @@ class PDFOptimizer(FileOptimizer):
 
     def split_pdf(self, file_path, output_dir):
         """拆分PDF文件"""
+        import PyPDF2
+
         reader = PyPDF2.PdfReader(file_path)
         
         for i in range(len(reader.pages)):
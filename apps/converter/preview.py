@@ -4,9 +4,9 @@ from django.core.exceptions import ValidationError
 import os
 import logging
 from PIL import Image
-import fitz  # PyMuPDF
 import tempfile
 from .utils import get_file_type
+from .imaging import downscale_image
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +39,8 @@ class PreviewGenerator:
 
     def _generate_document_preview(self, file_path):
         """生成文档预览"""
+        import fitz  # PyMuPDF
+
         try:
             with fitz.open(file_path) as doc:
                 page = doc[0]  # 获取第一页
@@ -60,9 +62,9 @@ class PreviewGenerator:
         """生成图片预览"""
         try:
             with Image.open(file_path) as img:
-                # 计算预览尺寸
+                # 计算预览尺寸，JPEG按比例解码
                 max_size = (800, 800)
-                img.thumbnail(max_size, Image.LANCZOS)
+                img = downscale_image(img, max_size)
                 
                 # 保存预览
                 with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
@@ -72,5 +74,3 @@ class PreviewGenerator:
         except Exception as e:
             logger.error(f"Image preview generation failed: {str(e)}")
             raise
-</```
-rewritten_file>
\ No newline at end of file
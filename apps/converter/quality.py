@@ -3,7 +3,6 @@ from django.conf import settings
 import os
 import logging
 from PIL import Image
-import fitz
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +45,8 @@ class QualityOptimizer:
             
     def optimize_pdf(self, pdf_path, options):
         """优化PDF"""
+        import fitz
+
         try:
             doc = fitz.open(pdf_path)
             
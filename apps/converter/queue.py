@@ -1,123 +1,619 @@
-"""任务队列实现"""
+"""任务队列实现
+
+队列保存在Redis中，所有调度节点共享。任务按优先级分到几个通道，每个通道是按排序时间排序的有序集合，
+每个用户的排队任务数保存在哈希中，入队、出队和确认都是一次Lua脚本调用，在服务端原子完成。
+
+出队时才计算有效优先级：各通道按权重做加权公平选择（权重越大分到的出队次数越多），
+出队任务等待越久，所在通道的有效权重越大，积压的低优先级通道会分到更多出队次数，
+不会被一直饿死，也不需要重排已入队的任务。
+
+通道内按预计耗时做短任务优先：排序时间 = 创建时间 + 预计耗时 * cost_weight，
+推后量不超过 max_cost_delay，长任务最多被推后这么久，不会被源源不断的短任务饿死。
+由于所有任务的等待时间随时间同步增长，这个排序与出队时按“等待时间 - 预计耗时折算”比较一致。
+
+出队采用租约：claim 把任务从通道移到租约集合并记下到期时间，
+调度节点启动任务后 ack 删除；节点在 ack 前崩溃时，租约到期后任务回到原通道。
+多个节点同时出队不会拿到同一个任务。
+
+调度节点通过同一Redis中的租约选出唯一的领导者负责派发。每次取得领导权时防护令牌加一，
+领导者出队时带上令牌，令牌已不是最新的（租约过期后已有新领导者）的出队请求会被拒绝。
+
+启用调度器（CONVERSION_SETTINGS['scheduler']）时，新提交的任务经 workers.submit_conversion 入队；
+未启用时任务直接投递到Celery，不经过队列。
+
+缓存后端不是Redis时使用进程内的等价实现，只适用于单进程开发环境。
+"""
 from django.core.cache import cache
-from django.utils import timezone
-from django.db import transaction
-from apps.core.exceptions import *
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from apps.core.exceptions import (
+    QueueFullError, UserTaskLimitError, TaskDependencyError, LeadershipLostError
+)
+import zlib
 import heapq
-import json
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 所有脚本共用的键和参数布局
+# KEYS: 租约, 任务所属用户, 任务排序时间, 任务所在通道, 通道进度, 用户任务数, 防护令牌, 各通道有序集合...
+# ARGV: 通道数N, N个通道名, N个权重, 脚本自己的参数...
+SCRIPT_PRELUDE = """
+local lane_count = tonumber(ARGV[1])
+local lanes, weights, lane_keys = {}, {}, {}
+for i = 1, lane_count do
+    local lane = ARGV[1 + i]
+    lanes[i] = lane
+    weights[lane] = tonumber(ARGV[1 + lane_count + i])
+    lane_keys[lane] = KEYS[7 + i]
+end
+local args = {}
+for i = 2 + 2 * lane_count, #ARGV do
+    args[#args + 1] = ARGV[i]
+end
+
+local function now_ms()
+    local time = redis.call('TIME')
+    return tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+end
+
+-- 放回原通道，通道已从配置中删除时放入最后一个通道
+local function requeue(id)
+    local lane = redis.call('HGET', KEYS[4], id)
+    local key = lane_keys[lane] or lane_keys[lanes[lane_count]]
+    redis.call('ZADD', key, redis.call('HGET', KEYS[3], id), id)
+end
+"""
+
+# args: 任务ID, 通道, 排序时间(毫秒), 用户ID, 队列容量, 每用户任务数上限
+# 返回 1 已入队，0 已在队列中，-1 队列已满，-2 用户任务数超限
+PUSH_SCRIPT = SCRIPT_PRELUDE + """
+if redis.call('HEXISTS', KEYS[2], args[1]) == 1 then
+    return 0
+end
+local total = 0
+for _, lane in ipairs(lanes) do
+    total = total + redis.call('ZCARD', lane_keys[lane])
+end
+if total >= tonumber(args[5]) then
+    return -1
+end
+if tonumber(redis.call('HGET', KEYS[6], args[4]) or '0') >= tonumber(args[6]) then
+    return -2
+end
+redis.call('ZADD', lane_keys[args[2]], args[3], args[1])
+redis.call('HSET', KEYS[2], args[1], args[4])
+redis.call('HSET', KEYS[3], args[1], args[3])
+redis.call('HSET', KEYS[4], args[1], args[2])
+redis.call('HINCRBY', KEYS[6], args[4], 1)
+return 1
+"""
+
+# args: 租约毫秒数, 出队数量, 老化间隔(毫秒), 防护令牌(空字符串表示不检查)
+# 先把到期的租约放回通道，再按加权公平选择通道，返回任务ID列表
+CLAIM_SCRIPT = SCRIPT_PRELUDE + """
+if args[4] ~= '' and redis.call('GET', KEYS[7]) ~= args[4] then
+    return redis.error_reply('STALE_TOKEN')
+end
+local now = now_ms()
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, 100)
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], id)
+    requeue(id)
+end
+
+local vtime = tonumber(redis.call('HGET', KEYS[5], '_vtime') or '0')
+local ids = {}
+for _ = 1, tonumber(args[2]) do
+    local best, best_pass, best_id, best_rank
+    for _, lane in ipairs(lanes) do
+        local head = redis.call('ZRANGE', lane_keys[lane], 0, 0, 'WITHSCORES')
+        if head[1] then
+            local pass = math.max(tonumber(redis.call('HGET', KEYS[5], lane) or '0'), vtime)
+            if not best or pass < best_pass then
+                best, best_pass, best_id, best_rank = lane, pass, head[1], tonumber(head[2])
+            end
+        end
+    end
+    if not best then
+        break
+    end
+    redis.call('ZREM', lane_keys[best], best_id)
+    redis.call('ZADD', KEYS[1], now + tonumber(args[1]), best_id)
+    vtime = best_pass
+    local weight = weights[best] * (1 + math.max(now - best_rank, 0) / tonumber(args[3]))
+    redis.call('HSET', KEYS[5], best, tostring(best_pass + 1 / weight))
+    ids[#ids + 1] = best_id
+end
+redis.call('HSET', KEYS[5], '_vtime', tostring(vtime))
+return ids
+"""
+
+# args: 任务ID, 延迟毫秒数
+# 延迟为 0 时立即放回原通道，否则保留租约到延迟结束
+RELEASE_SCRIPT = SCRIPT_PRELUDE + """
+if not redis.call('ZSCORE', KEYS[1], args[1]) then
+    return 0
+end
+if tonumber(args[2]) > 0 then
+    redis.call('ZADD', KEYS[1], now_ms() + tonumber(args[2]), args[1])
+else
+    redis.call('ZREM', KEYS[1], args[1])
+    requeue(args[1])
+end
+return 1
+"""
+
+# args: 任务ID
+REMOVE_SCRIPT = SCRIPT_PRELUDE + """
+local user = redis.call('HGET', KEYS[2], args[1])
+if not user then
+    return 0
+end
+local lane = redis.call('HGET', KEYS[4], args[1])
+if lane_keys[lane] then
+    redis.call('ZREM', lane_keys[lane], args[1])
+end
+redis.call('ZREM', KEYS[1], args[1])
+redis.call('HDEL', KEYS[2], args[1])
+redis.call('HDEL', KEYS[3], args[1])
+redis.call('HDEL', KEYS[4], args[1])
+if redis.call('HINCRBY', KEYS[6], user, -1) <= 0 then
+    redis.call('HDEL', KEYS[6], user)
+end
+return 1
+"""
+
+# KEYS: 调度节点, 领导者, 防护令牌
+# ARGV: 节点ID, 租约毫秒数
+# 登记节点心跳，领导者空缺时接任并递增令牌，本节点已是领导者时续约
+# 返回 {令牌(不是领导者时为0), 领导者, 存活节点...}
+ELECT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local ttl = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[1])
+local leader = redis.call('GET', KEYS[2])
+local token = 0
+if not leader then
+    leader = ARGV[1]
+    redis.call('SET', KEYS[2], leader, 'PX', ttl)
+    token = redis.call('INCR', KEYS[3])
+elseif leader == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[2], ttl)
+    token = tonumber(redis.call('GET', KEYS[3]))
+end
+local result = {token, leader}
+for _, node in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    result[#result + 1] = node
+end
+return result
+"""
+
+# KEYS: 调度节点, 领导者
+# ARGV: 节点ID
+RESIGN_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+"""
+
+def _decode(value):
+    """Redis返回的字节串解码为字符串"""
+    return value.decode() if isinstance(value, bytes) else value
+
+def in_shard(task_id, shard):
+    """任务是否属于分片 (序号, 分片数)，shard 为空表示全部"""
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(str(task_id).encode()) % count == index
+
+class FairLanes:
+    """按通道排队、出队时加权公平选择
+
+    每个通道记录一个进度值，总是选择进度值最小的通道，出队一次增加 1/有效权重。
+    有效权重 = 权重 * (1 + 出队任务等待时间 / aging_interval)，积压越久的通道分到的份额越大，
+    但高权重通道仍然保有按权重分到的份额。空闲的通道重新有任务时进度值对齐到当前虚拟时间，
+    不能靠空闲期间积攒的额度连续出队。时间单位由调用方决定，也用于调度模拟。
+    """
+
+    def __init__(self, weights, aging_interval):
+        self.weights = dict(weights)
+        self.aging_interval = aging_interval
+        self._heaps = {lane: [] for lane in self.weights}
+        self._entries = {}
+        self._passes = {lane: 0.0 for lane in self.weights}
+        self._vtime = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def push(self, task_id, lane, rank):
+        self._entries[task_id] = (lane, rank)
+        heapq.heappush(self._heaps[lane], (rank, task_id))
+
+    def remove(self, task_id):
+        return self._entries.pop(task_id, None) is not None
+
+    def lane_sizes(self):
+        sizes = {lane: 0 for lane in self.weights}
+        for lane, _ in self._entries.values():
+            sizes[lane] += 1
+        return sizes
+
+    def pop(self, now):
+        """选出下一个任务，没有任务时返回 None"""
+        best = None
+        for lane, lane_heap in self._heaps.items():
+            head = self._head(lane, lane_heap)
+            if head is None:
+                continue
+            current = max(self._passes[lane], self._vtime)
+            if best is None or current < best[0]:
+                best = (current, lane, head)
+        if best is None:
+            return None
+
+        current, lane, (rank, task_id) = best
+        heapq.heappop(self._heaps[lane])
+        del self._entries[task_id]
+        self._vtime = current
+        weight = self.weights[lane] * (1 + max(now - rank, 0) / self.aging_interval)
+        self._passes[lane] = current + 1 / weight
+        return task_id
+
+    def _head(self, lane, lane_heap):
+        # 跳过已删除或重新入队的旧条目
+        while lane_heap:
+            rank, task_id = lane_heap[0]
+            if self._entries.get(task_id) == (lane, rank):
+                return lane_heap[0]
+            heapq.heappop(lane_heap)
+        return None
+
+class RedisQueueStore:
+    """Redis队列存储"""
+
+    def __init__(self, redis, prefix, weights):
+        self.redis = redis
+        self.lanes = list(weights)
+        # 哈希标签保证集群模式下所有键在同一个槽
+        self.keys = {
+            name: cache.make_key(f'{{{prefix}}}:{name}')
+            for name in ('leases', 'owners', 'ranks', 'lanes', 'passes', 'users')
+        }
+        self.lane_keys = [cache.make_key(f'{{{prefix}}}:lane:{lane}') for lane in self.lanes]
+        # 选举相关的键不随 clear 删除，令牌必须单调递增
+        self.election_keys = [
+            cache.make_key(f'{{{prefix}}}:{name}') for name in ('nodes', 'leader', 'fence')
+        ]
+        self._layout = (
+            list(self.keys.values()) + [self.election_keys[2]] + self.lane_keys,
+            [len(self.lanes)] + self.lanes + [weights[lane] for lane in self.lanes]
+        )
+        self._push = redis.register_script(PUSH_SCRIPT)
+        self._claim = redis.register_script(CLAIM_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+        self._remove = redis.register_script(REMOVE_SCRIPT)
+        self._elect = redis.register_script(ELECT_SCRIPT)
+        self._resign = redis.register_script(RESIGN_SCRIPT)
+
+    def _call(self, script, *args):
+        keys, layout_args = self._layout
+        return script(keys=keys, args=layout_args + list(args))
+
+    def push(self, task_id, lane, rank, user_id, max_size, max_user_tasks):
+        return int(self._call(
+            self._push, task_id, lane, int(rank * 1000), user_id, max_size, max_user_tasks
+        ))
+
+    def claim(self, lease, count, aging_interval, token=None):
+        try:
+            ids = self._call(
+                self._claim, int(lease * 1000), count, int(aging_interval * 1000),
+                '' if token is None else token
+            )
+        except ResponseError as e:
+            if 'STALE_TOKEN' in str(e):
+                raise LeadershipLostError("Scheduler fencing token is stale")
+            raise
+        return [task_id.decode() if isinstance(task_id, bytes) else task_id for task_id in ids]
+
+    def release(self, task_id, delay=0):
+        return bool(self._call(self._release, task_id, int(delay * 1000)))
+
+    def remove(self, task_id):
+        return bool(self._call(self._remove, task_id))
+
+    def lane_sizes(self):
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.lane_keys:
+            pipe.zcard(key)
+        return dict(zip(self.lanes, pipe.execute()))
+
+    def user_count(self, user_id):
+        return int(self.redis.hget(self.keys['users'], user_id) or 0)
+
+    def task_ids(self):
+        return [task_id.decode() for task_id in self.redis.hkeys(self.keys['owners'])]
+
+    def elect(self, node_id, ttl):
+        token, leader, *nodes = self._elect(
+            keys=self.election_keys, args=[node_id, int(ttl * 1000)]
+        )
+        return int(token) or None, _decode(leader), sorted(_decode(node) for node in nodes)
+
+    def resign(self, node_id):
+        self._resign(keys=self.election_keys[:2], args=[node_id])
+
+    def clear(self):
+        self.redis.delete(*self.keys.values(), *self.lane_keys)
+
+class LocalQueueStore:
+    """进程内队列存储，与Redis脚本的语义一致"""
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._leader = None
+        self._leader_expires = 0
+        self._fence = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # 老化间隔由每次出队传入
+            self._lanes = FairLanes(self.weights, aging_interval=1)
+            self._leases = {}
+            self._owners = {}
+            self._tasks = {}
+            self._users = {}
+
+    def push(self, task_id, lane, rank, user_id, max_size, max_user_tasks):
+        with self._lock:
+            if task_id in self._owners:
+                return 0
+            if len(self._lanes) >= max_size:
+                return -1
+            if self._users.get(user_id, 0) >= max_user_tasks:
+                return -2
+            self._lanes.push(task_id, lane, rank)
+            self._owners[task_id] = user_id
+            self._tasks[task_id] = (lane, rank)
+            self._users[user_id] = self._users.get(user_id, 0) + 1
+            return 1
+
+    def claim(self, lease, count, aging_interval, token=None):
+        with self._lock:
+            if token is not None and token != self._fence:
+                raise LeadershipLostError("Scheduler fencing token is stale")
+            lanes = self._lanes
+            lanes.aging_interval = aging_interval
+            now = time.time()
+            for task_id, deadline in list(self._leases.items()):
+                if deadline <= now:
+                    del self._leases[task_id]
+                    lanes.push(task_id, *self._tasks[task_id])
+            ids = []
+            while len(ids) < count:
+                task_id = lanes.pop(now)
+                if task_id is None:
+                    break
+                self._leases[task_id] = now + lease
+                ids.append(task_id)
+            return ids
+
+    def release(self, task_id, delay=0):
+        with self._lock:
+            if task_id not in self._leases:
+                return False
+            if delay > 0:
+                self._leases[task_id] = time.time() + delay
+            else:
+                del self._leases[task_id]
+                self._lanes.push(task_id, *self._tasks[task_id])
+            return True
+
+    def remove(self, task_id):
+        with self._lock:
+            user_id = self._owners.pop(task_id, None)
+            if user_id is None:
+                return False
+            self._lanes.remove(task_id)
+            self._leases.pop(task_id, None)
+            self._tasks.pop(task_id, None)
+            self._users[user_id] -= 1
+            if self._users[user_id] <= 0:
+                del self._users[user_id]
+            return True
+
+    def lane_sizes(self):
+        return self._lanes.lane_sizes()
+
+    def user_count(self, user_id):
+        return self._users.get(user_id, 0)
+
+    def task_ids(self):
+        return list(self._owners)
+
+    def elect(self, node_id, ttl):
+        with self._lock:
+            now = time.time()
+            self._nodes = {node: expires for node, expires in self._nodes.items() if expires > now}
+            self._nodes[node_id] = now + ttl
+            if self._leader is None or self._leader_expires <= now:
+                self._leader = node_id
+                self._fence += 1
+            token = None
+            if self._leader == node_id:
+                self._leader_expires = now + ttl
+                token = self._fence
+            return token, self._leader, sorted(self._nodes)
+
+    def resign(self, node_id):
+        with self._lock:
+            self._nodes.pop(node_id, None)
+            if self._leader == node_id:
+                self._leader = None
 
 class TaskQueue:
     """任务队列"""
     MAX_SIZE = 1000  # 最大队列容量
     MAX_USER_TASKS = 10  # 每个用户最大任务数
-    CACHE_KEY = 'task_queue_state'
+    KEY_PREFIX = 'task_queue'
+    LEASE_TIMEOUT = 60  # 出队后未确认的任务重新入队的时间（秒）
+    DEPENDENCY_RETRY_DELAY = 5  # 父任务未完成时子任务推迟出队的时间（秒）
 
-    PRIORITY_WEIGHTS = {
-        'high': 0,
-        'medium': 50,
-        'low': 100
+    # 通道及权重：队列饱和时各通道分到的出队次数与权重成正比
+    LANE_WEIGHTS = {
+        'high': 6,
+        'medium': 3,
+        'low': 1
     }
+    DEFAULT_LANE = 'medium'
+    AGING_INTERVAL = 300  # 出队任务每等待这么久（秒），所在通道的有效权重增加一倍原权重
 
     def __init__(self):
-        self._queue = []
-        self._task_set = set()
-        self.restore_state()
+        self._store = None
+
+    @property
+    def store(self):
+        """队列存储，首次使用时获取；缓存后端不是Redis时使用进程内存储"""
+        if self._store is None:
+            try:
+                self._store = RedisQueueStore(
+                    get_redis_connection('default'), self.KEY_PREFIX, self.LANE_WEIGHTS
+                )
+            except NotImplementedError:
+                self._store = _local_store
+        return self._store
 
     def push(self, task):
-        """添加任务到队列"""
-        if len(self._queue) >= self.MAX_SIZE:
+        """添加任务到队列，任务已在队列中时返回 False"""
+        result = self.store.push(
+            str(task.id),
+            self.get_lane(task),
+            self.get_rank(task),
+            str(task.user_id),
+            self.MAX_SIZE,
+            self.MAX_USER_TASKS
+        )
+        if result == -1:
             raise QueueFullError("Queue capacity exceeded")
-
-        # 检查用户任务数限制
-        user_tasks = len([t for t in self._queue if t.user_id == task.user_id])
-        if user_tasks >= self.MAX_USER_TASKS:
+        if result == -2:
             raise UserTaskLimitError("User task limit exceeded")
+        if result == 1:
+            from .events import task_events, SUBMITTED
+            task_events.publish_on_commit(SUBMITTED, task)
+        return result == 1
 
-        # 计算优先级分数
-        score = self._calculate_priority(task)
+    def pop(self, token=None):
+        """领取下一个要处理的任务，处理启动后需要调用 ack
 
-        # 添加到队列
-        heapq.heappush(self._queue, (score, task.id, task))
-        self._task_set.add(task.id)
-        self._save_state()
+        token 为领导者的防护令牌，令牌过期时抛出 LeadershipLostError。
+        """
+        from apps.converter.models import ConversionTask
 
-    def pop(self):
-        """获取下一个要处理的任务"""
-        while self._queue:
-            score, task_id, task = heapq.heappop(self._queue)
-            self._task_set.remove(task_id)
+        while True:
+            task_ids = self.store.claim(self.LEASE_TIMEOUT, 1, self.AGING_INTERVAL, token)
+            if not task_ids:
+                return None
+            task_id = task_ids[0]
 
             # 检查任务是否仍然有效
-            task.refresh_from_db()
-            if task.status != 'pending':
+            task = ConversionTask.objects.filter(id=task_id).first()
+            if task is None or task.status != 'pending':
+                self.store.remove(task_id)
                 continue
 
-            # 检查依赖任务
-            if task.parent_task and task.parent_task.status != 'completed':
+            # 检查依赖任务，未完成时推迟出队，不阻塞后面的任务
+            parent_task = getattr(task, 'parent_task', None)
+            if parent_task and parent_task.status != 'completed':
+                self.store.release(task_id, self.DEPENDENCY_RETRY_DELAY)
                 raise TaskDependencyError("Parent task not completed")
 
             return task
 
-        return None
+    def ack(self, task):
+        """确认任务已启动，从队列中删除"""
+        return self.store.remove(str(task.id))
+
+    def release(self, task, delay=0):
+        """放弃领取的任务，delay 秒后放回队列，期间不会被其他节点领取"""
+        return self.store.release(str(task.id), delay)
 
-    def _calculate_priority(self, task):
-        """计算任务优先级分数"""
-        base_score = self.PRIORITY_WEIGHTS.get(task.priority, 50)
-        wait_time = (timezone.now() - task.created_at).total_seconds()
-        
-        # 等待时间越长，优先级越高
-        time_factor = max(0, wait_time / 3600)  # 每小时增加优先级
-        
-        return base_score - time_factor
+    def remove(self, task):
+        """从队列中删除任务"""
+        return self.store.remove(str(task.id))
+
+    def get_rank(self, task):
+        """通道内的排序时间：创建时间加上按预计耗时折算的推后量"""
+        from .cost_model import cost_model
+
+        config = cost_model.settings
+        delay = min(cost_model.predict(task) * config['cost_weight'], config['max_cost_delay'])
+        return task.created_at.timestamp() + delay
+
+    def get_lane(self, task):
+        """任务所在通道，按任务优先级划分"""
+        lane = getattr(task, 'priority', None)
+        return lane if lane in self.LANE_WEIGHTS else self.DEFAULT_LANE
 
     def is_empty(self):
         """检查队列是否为空"""
-        return len(self._queue) == 0
+        return self.size() == 0
 
-    def cleanup_timeouts(self):
-        """清理超时任务"""
-        from .state_machine import TaskStateMachine
+    def size(self):
+        """待处理任务数"""
+        return sum(self.store.lane_sizes().values())
 
-        new_queue = []
-        for score, task_id, task in self._queue:
-            state_machine = TaskStateMachine(task)
-            if state_machine.is_timed_out():
-                state_machine.handle_timeout()
-                self._task_set.remove(task_id)
-            else:
-                new_queue.append((score, task_id, task))
+    def lane_sizes(self):
+        """各通道的待处理任务数"""
+        return self.store.lane_sizes()
 
-        self._queue = new_queue
-        heapq.heapify(self._queue)
-        self._save_state()
+    def user_task_count(self, user_id):
+        """用户在队列中的任务数"""
+        return self.store.user_count(str(user_id))
 
-    def _save_state(self):
-        """保存队列状态"""
-        state = {
-            'tasks': [(s, tid) for s, tid, _ in self._queue],
-            'task_set': list(self._task_set)
-        }
-        cache.set(self.CACHE_KEY, json.dumps(state), timeout=None)
+    def clear(self):
+        """清空队列"""
+        self.store.clear()
 
     def restore_state(self):
-        """恢复队列状态"""
+        """队列状态保存在共享存储中，重启后无需恢复，保留以兼容原有调用"""
+
+    def elect(self, node_id, ttl):
+        """登记调度节点并竞选领导者
+
+        返回 (防护令牌, 领导者, 存活节点列表)，本节点不是领导者时令牌为 None。
+        """
+        return self.store.elect(node_id, ttl)
+
+    def resign(self, node_id):
+        """注销调度节点，是领导者时立即让出"""
+        self.store.resign(node_id)
+
+    def cleanup_timeouts(self, shard=None):
+        """清理超时任务，shard 为 (序号, 分片数) 时只处理该分片"""
         from apps.converter.models import ConversionTask
-        
-        state_data = cache.get(self.CACHE_KEY)
-        if not state_data:
-            return
-
-        state = json.loads(state_data)
-        self._task_set = set(state['task_set'])
-        
-        # 重建队列
-        tasks = ConversionTask.objects.filter(id__in=self._task_set)
-        task_map = {str(t.id): t for t in tasks}
-        
-        self._queue = [
-            (score, tid, task_map[tid])
-            for score, tid in state['tasks']
-            if tid in task_map
-        ]
-        heapq.heapify(self._queue)
- 
\ No newline at end of file
+        from .state_machine import TaskStateMachine
+
+        task_ids = [task_id for task_id in self.store.task_ids() if in_shard(task_id, shard)]
+        tasks = {str(task.id): task for task in ConversionTask.objects.filter(id__in=task_ids)}
+        for task_id in task_ids:
+            task = tasks.get(task_id)
+            if task is None:
+                self.store.remove(task_id)
+                continue
+            state_machine = TaskStateMachine(task)
+            if state_machine.is_timed_out():
+                state_machine.handle_timeout()
+                self.store.remove(task_id)
+
+_local_store = LocalQueueStore(TaskQueue.LANE_WEIGHTS)
@@ -0,0 +1,214 @@
+"""转换结果缓存
+
+按 (输入文件SHA-256, 源格式, 目标格式, 规范化选项, 转换器版本) 对转换结果做内容寻址：
+命中时把已有结果硬链接到新任务，不再投递Celery任务；
+结果文件保存在 MEDIA_ROOT 下的缓存目录，按最近使用时间淘汰，总大小不超过上限。
+
+查找在投递任务的请求中执行，只使用上传时流式计算的哈希，没有哈希的任务直接视为未命中；
+保存结果在工作进程中执行，必要时在那里补算哈希。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils import timezone
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from apps.security.cache import CacheManager
+from .converters import get_conversion_factory
+from .events import task_events, FINISHED
+
+logger = logging.getLogger(__name__)
+
+SIZE_CACHE_KEY = 'conversion_result_cache:size'
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_options(options):
+    """规范化转换选项：忽略空值，键和格式名统一小写，按键排序序列化"""
+    def normalize(value):
+        if isinstance(value, dict):
+            return {
+                str(key).lower(): normalize(item)
+                for key, item in value.items()
+                if item is not None
+            }
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        if isinstance(value, str):
+            return value.strip().lower()
+        return value
+
+    return json.dumps(normalize(options or {}), sort_keys=True, separators=(',', ':'))
+
+class ResultCache:
+    """转换结果缓存"""
+
+    def __init__(self):
+        self.settings = settings.CONVERSION_SETTINGS['result_cache']
+        self.enabled = self.settings['enabled']
+        self.max_size = self.settings['max_size']
+        self.cache_manager = CacheManager()
+
+    @property
+    def cache_dir(self):
+        """缓存目录，未配置时在运行时取 MEDIA_ROOT 下的目录，跟随测试等场景覆盖的 MEDIA_ROOT"""
+        return self.settings.get('dir') or os.path.join(settings.MEDIA_ROOT, 'result_cache')
+
+    def get_key(self, task):
+        """计算任务的缓存键，任务需已有文件哈希"""
+        source_format = task.original_format.lower()
+        target_format = task.target_format.lower()
+        converter = get_conversion_factory().get_converter(source_format, target_format)
+        parts = [
+            task.file_hash,
+            source_format,
+            target_format,
+            normalize_options(task.options),
+            f"{converter.__class__.__name__}:{converter.version}",
+        ]
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def lookup(self, key):
+        """查找缓存结果，命中时刷新最近使用时间"""
+        entry = self.cache_manager.get_conversion_result(key)
+        if not entry:
+            return None
+
+        path = self._entry_path(key, entry['output_format'])
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # 结果文件已被淘汰
+            self.cache_manager.delete_conversion_result(key)
+            return None
+        return dict(entry, path=path)
+
+    def apply(self, task):
+        """缓存命中时直接完成任务，返回是否命中"""
+        if not self.enabled or not task.file_hash:
+            return False
+        try:
+            key = self.get_key(task)
+            entry = self.lookup(key)
+            if entry is None:
+                return False
+
+            name = task.converted_file.field.generate_filename(
+                task, f"{task.id}.{entry['output_format']}"
+            )
+            name = default_storage.get_available_name(name)
+            _link_or_copy(entry['path'], default_storage.path(name))
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed for task {task.id}: {str(e)}")
+            return False
+
+        now = timezone.now()
+        task.converted_file.name = name
+        task.status = 'completed'
+        task.progress = 100
+        task.error_message = None
+        task.started_at = task.started_at or now
+        task.completed_at = now
+        # 没有实际执行转换，不记录处理耗时，避免计入耗时统计
+        task.processing_time = None
+        task.cache_hit = True
+        task.save()
+        task_events.publish_on_commit(FINISHED, task)
+
+        logger.info(f"Task {task.id} served from result cache")
+        return True
+
+    def store(self, task):
+        """保存已完成任务的结果，在工作进程中调用"""
+        if not self.enabled or not task.converted_file:
+            return
+        try:
+            if not task.file_hash:
+                task.file_hash = hash_file(task.original_file.path)
+                task.save(update_fields=['file_hash'])
+            key = self.get_key(task)
+            output_format = os.path.splitext(task.converted_file.name)[1][1:].lower()
+            path = self._entry_path(key, output_format)
+            if not os.path.exists(path):
+                _link_or_copy(task.converted_file.path, path)
+                self._add_size(os.path.getsize(path))
+
+            self.cache_manager.set_conversion_result(
+                key,
+                {'output_format': output_format},
+                self.settings['timeout']
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cache result of task {task.id}: {str(e)}")
+
+    def evict(self):
+        """按最近使用时间淘汰结果，直到总大小降到上限的90%"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_size:
+            target = self.max_size * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                key = os.path.splitext(os.path.basename(path))[0]
+                self.cache_manager.delete_conversion_result(key)
+                total -= size
+            logger.info(f"Result cache evicted to {total} bytes")
+
+        cache.set(SIZE_CACHE_KEY, total, None)
+        return total
+
+    def _add_size(self, size):
+        """累计缓存大小，超出上限时淘汰"""
+        try:
+            total = cache.incr(SIZE_CACHE_KEY, size)
+        except ValueError:
+            # 计数丢失时重新统计
+            total = self.evict()
+        if total > self.max_size:
+            self.evict()
+
+    def _entry_path(self, key, output_format):
+        """结果文件路径，按键前两位分目录"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{output_format}")
+
+def _link_or_copy(source, destination):
+    """硬链接文件，跨文件系统时复制，先写临时文件再原子替换"""
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    try:
+        os.replace(temp_path, destination)
+    except OSError:
+        os.remove(temp_path)
+        raise
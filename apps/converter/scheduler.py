@@ -1,10 +1,25 @@
-"""任务调度器"""
+"""任务调度器
+
+调度器由任务事件驱动：任务入队或结束时立即尝试派发，运行中任务数在内存中按事件增减，
+空闲时不访问数据库。卡住的任务恢复和运行中任务计数校正按较长的间隔与数据库对账，
+弥补订阅断开期间丢失的事件。
+
+每个进程都可以启动调度器，但同一时间只有通过队列租约选出的领导者派发任务，出队时带防护令牌，
+租约过期后旧领导者的出队请求会被拒绝。其余节点作为备用节点定期续约心跳，领导者失联后在一个租约周期内接任，
+并按节点列表分片处理卡住的任务和队列中的超时任务；没有备用节点时由领导者处理。
+"""
 from django.utils import timezone
 from django.db import transaction
 from django.conf import settings
+from apps.core.exceptions import TaskDependencyError, LeadershipLostError
 from .models import ConversionTask
-from .queue import TaskQueue
+from .queue import TaskQueue, in_shard
+from .cost_model import cost_model
+from .events import task_events, STARTED, FINISHED
 from .state_machine import TaskStateMachine
+import os
+import uuid
+import socket
 import threading
 import logging
 import psutil
@@ -15,13 +30,30 @@ logger = logging.getLogger(__name__)
 class TaskScheduler:
     """任务调度器"""
     MAX_CONCURRENT_TASKS = getattr(settings, 'MAX_CONCURRENT_TASKS', 5)
-    CHECK_INTERVAL = 1  # 检查间隔（秒）
+    IDLE_INTERVAL = 30  # 没有事件时检查队列的间隔，用于领取延迟放回和租约过期的任务（秒）
+    RECONCILE_INTERVAL = 300  # 与数据库对账的间隔（秒）
+    RESOURCE_RETRY_DELAY = 5  # 系统资源紧张时推迟派发的时间（秒）
+    HEAVY_RETRY_DELAY = 10  # 长任务槽位已满时推迟重新排队的时间（秒）
+    STOP_CHECK_INTERVAL = 1  # 等待事件时检查停止标志的间隔（秒）
+    RETRY_INTERVAL = 5  # 订阅失败后的重试间隔（秒）
+    LEASE_TTL = 10  # 领导者租约和节点心跳的有效期，每 1/3 有效期续约一次（秒）
 
     def __init__(self):
         self.queue = TaskQueue()
         self.running = False
         self.thread = None
         self._lock = threading.Lock()
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 领导者的防护令牌，备用节点为 None
+        self.token = None
+        # 本节点负责的恢复分片 (序号, 分片数)，不负责时为 None
+        self.shard = None
+        # 运行中的任务ID -> 是否为长任务，只在调度线程中读写
+        self._running = {}
+        self._dispatch_at = 0
+        self._reconcile_at = 0
+        self._maintain_at = 0
+        self._elect_at = 0
 
     def start(self):
         """启动调度器"""
@@ -42,18 +74,132 @@ class TaskScheduler:
             self.running = False
             if self.thread:
                 self.thread.join()
+            # 主动让出领导权，备用节点下次续约时即可接任
+            try:
+                self.queue.resign(self.node_id)
+            except Exception as e:
+                logger.warning("Failed to resign scheduler %s: %s", self.node_id, str(e))
+            self.token = None
             logger.info("Task scheduler stopped")
 
     def _run(self):
-        """调度器主循环"""
+        """调度器主循环：领导者等待任务事件，到期时派发和对账；备用节点只续约和处理分片"""
+        subscription = None
         while self.running:
             try:
-                self._check_resources()
-                self._recover_tasks()
-                self._process_tasks()
+                self._check_leadership()
+                if self.token is None:
+                    if subscription is not None:
+                        subscription.close()
+                        subscription = None
+                    self._maintain()
+                    timeout = min(self._elect_at, self._maintain_at) - time.monotonic()
+                    time.sleep(min(max(timeout, 0), self.STOP_CHECK_INTERVAL))
+                    continue
+
+                if subscription is None:
+                    subscription = task_events.subscribe()
+                    # 订阅建立前的事件可能已丢失
+                    self._reconcile_at = 0
+                    self._dispatch_at = 0
+                self._tick()
+                timeout = min(
+                    self._reconcile_at, self._dispatch_at, self._maintain_at, self._elect_at
+                ) - time.monotonic()
+                event = subscription.get(timeout=min(max(timeout, 0), self.STOP_CHECK_INTERVAL))
+                while event is not None:
+                    self._handle_event(event)
+                    event = subscription.get(timeout=0)
             except Exception as e:
                 logger.exception("Error in scheduler loop: %s", str(e))
-            time.sleep(self.CHECK_INTERVAL)
+                if subscription is not None:
+                    try:
+                        subscription.close()
+                    except Exception:
+                        pass
+                    subscription = None
+                time.sleep(self.RETRY_INTERVAL)
+        if subscription is not None:
+            subscription.close()
+
+    def _check_leadership(self):
+        """到期时续约心跳并竞选领导者"""
+        now = time.monotonic()
+        if now < self._elect_at:
+            return
+        self._elect_at = now + self.LEASE_TTL / 3
+        try:
+            token, leader, nodes = self.queue.elect(self.node_id, self.LEASE_TTL)
+        except Exception as e:
+            # 无法续约时不能确认仍是领导者，转为备用
+            logger.warning("Scheduler election failed: %s", str(e))
+            token, leader, nodes = None, None, []
+        self._set_leadership(token, leader, nodes)
+
+    def _set_leadership(self, token, leader, nodes):
+        """更新领导状态和本节点负责的分片"""
+        if token is not None and token != self.token:
+            logger.info("Scheduler %s became leader with token %s", self.node_id, token)
+            # 接任后先与数据库对账再派发
+            self._reconcile_at = 0
+            self._dispatch_at = 0
+        elif token is None and self.token is not None:
+            logger.warning("Scheduler %s lost leadership", self.node_id)
+            self._running = {}
+        self.token = token
+
+        standbys = [node for node in nodes if node != leader]
+        if self.node_id in standbys:
+            self.shard = (standbys.index(self.node_id), len(standbys))
+        elif token is not None and not standbys:
+            self.shard = (0, 1)
+        else:
+            self.shard = None
+
+    @property
+    def is_leader(self):
+        """本节点是否为领导者"""
+        return self.token is not None
+
+    def _maintain(self):
+        """到期时处理本节点分片内卡住的任务和队列中的超时任务"""
+        now = time.monotonic()
+        if now < self._maintain_at:
+            return
+        self._maintain_at = now + self.RECONCILE_INTERVAL
+        if self.shard is None:
+            return
+        self._recover_tasks(self.shard)
+        self.queue.cleanup_timeouts(self.shard)
+
+    def _tick(self):
+        """执行到期的维护、对账和派发"""
+        self._maintain()
+        now = time.monotonic()
+        if now >= self._reconcile_at:
+            self._reconcile()
+            self._reconcile_at = now + self.RECONCILE_INTERVAL
+        if now >= self._dispatch_at:
+            self._process_tasks()
+
+    def _handle_event(self, event):
+        """按任务事件更新运行中任务计数，入队和结束事件触发派发"""
+        task_id = event['task_id']
+        if event['event'] == STARTED:
+            self._running[task_id] = event['heavy']
+            return
+        if event['event'] == FINISHED:
+            self._running.pop(task_id, None)
+        self._dispatch_at = 0
+
+    def _dispatch_after(self, delay):
+        """最迟 delay 秒后再次派发"""
+        self._dispatch_at = min(self._dispatch_at, time.monotonic() + delay)
+
+    @property
+    def running_count(self):
+        """运行中的任务数"""
+        return len(self._running)
 
     def _check_resources(self):
         """检查系统资源"""
@@ -65,12 +211,20 @@ class TaskScheduler:
                 "System resources critical: CPU=%d%%, Memory=%d%%",
                 cpu_usage, memory_usage
             )
-            time.sleep(5)  # 等待资源释放
             return False
         return True
 
-    def _recover_tasks(self):
-        """恢复中断的任务"""
+    def _reconcile(self):
+        """按数据库校正运行中任务计数"""
+        self._running = {
+            str(task.id): cost_model.is_heavy(task)
+            for task in ConversionTask.objects.filter(status='processing').only(
+                'original_format', 'target_format', 'file_size'
+            )
+        }
+
+    def _recover_tasks(self, shard=None):
+        """恢复中断的任务，shard 为 (序号, 分片数) 时只处理该分片"""
         # 查找所有处理中但已超时的任务
         stuck_tasks = ConversionTask.objects.filter(
             status='processing',
@@ -78,6 +232,8 @@ class TaskScheduler:
         )
 
         for task in stuck_tasks:
+            if not in_shard(task.id, shard):
+                continue
             try:
                 state_machine = TaskStateMachine(task)
                 if state_machine.is_timed_out():
@@ -88,51 +244,97 @@ class TaskScheduler:
 
     def _process_tasks(self):
         """处理任务"""
-        # 检查当前处理中的任务数
-        processing_count = ConversionTask.objects.filter(
-            status='processing'
-        ).count()
+        # 没有事件时也定期检查队列
+        self._dispatch_at = time.monotonic() + self.IDLE_INTERVAL
+
+        available_slots = self.MAX_CONCURRENT_TASKS - self.running_count
+        if available_slots <= 0:
+            return
 
-        if processing_count >= self.MAX_CONCURRENT_TASKS:
+        if not self._check_resources():
+            # 等待资源释放，期间继续处理事件
+            self._dispatch_after(self.RESOURCE_RETRY_DELAY)
             return
 
-        # 获取可处理的任务数
-        available_slots = self.MAX_CONCURRENT_TASKS - processing_count
+        # 预计耗时长的任务最多占用一部分并发槽位，其余留给短任务
+        config = cost_model.settings
+        heavy_limit = max(1, int(self.MAX_CONCURRENT_TASKS * config['max_heavy_share']))
+        heavy_running = sum(self._running.values())
 
         # 处理任务
         for _ in range(available_slots):
-            if not self._check_resources():
-                break
-
             try:
-                task = self.queue.pop()
+                task = self.queue.pop(token=self.token)
                 if not task:
                     break
 
-                self._process_task(task)
+                heavy = cost_model.is_heavy(task)
+                if heavy and heavy_running >= heavy_limit:
+                    # 长任务槽位已满，推迟后重新排队，本轮继续领取其他任务
+                    self.queue.release(task, delay=self.HEAVY_RETRY_DELAY)
+                    self._dispatch_after(self.HEAVY_RETRY_DELAY)
+                    continue
+
+                try:
+                    started = self._process_task(task)
+                finally:
+                    # 任务状态已记录在数据库中，不再需要租约
+                    self.queue.ack(task)
+                if started:
+                    self._running[str(task.id)] = heavy
+                    heavy_running += heavy
 
+            except TaskDependencyError:
+                self._dispatch_after(self.queue.DEPENDENCY_RETRY_DELAY)
+            except LeadershipLostError:
+                # 租约已过期且有新领导者，停止派发并立即重新竞选
+                self._set_leadership(None, None, [])
+                self._elect_at = 0
+                break
             except Exception as e:
                 logger.exception("Error processing task: %s", str(e))
 
     @transaction.atomic
     def _process_task(self, task):
-        """处理单个任务"""
+        """处理单个任务，返回是否将投递到转换队列
+
+        投递在事务提交后进行，工作进程读到的任务状态已经是处理中；
+        事务回滚时不会投递。
+        """
         try:
             # 更新任务状态
             state_machine = TaskStateMachine(task)
             state_machine.transition_to('processing')
 
-            # 启动转换进程
-            from .tasks import convert_file_task
-            convert_file_task.delay(task.id)
+            # 结果已缓存时任务直接完成
+            from .result_cache import ResultCache
+            if ResultCache().apply(task):
+                return False
 
-            logger.info("Started processing task: %s", task.id)
+            transaction.on_commit(lambda: self._send_task(task))
+            return True
 
         except Exception as e:
             logger.error("Error starting task %s: %s", task.id, str(e))
             task.error_message = str(e)
             task.status = 'failed'
             task.save()
+            task_events.publish_on_commit(FINISHED, task)
+            return False
+
+    def _send_task(self, task):
+        """投递已标记为处理中的任务，失败时任务标记为失败，结束事件会释放运行槽位"""
+        from .workers import send_conversion
+
+        try:
+            send_conversion(task)
+            logger.info("Started processing task: %s", task.id)
+        except Exception as e:
+            logger.error("Error dispatching task %s: %s", task.id, str(e))
+            task.error_message = str(e)
+            task.status = 'failed'
+            task.save()
+            task_events.publish_on_commit(FINISHED, task)
 
     @staticmethod
     def get_cpu_usage():
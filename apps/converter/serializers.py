@@ -1,5 +1,38 @@
 from rest_framework import serializers
+from django.db.models import QuerySet
 from .models import ConversionTask, ConversionHistory, UploadSession
+from .cost_model import cost_model
+import json
+
+class CompletionEstimateMixin(serializers.Serializer):
+    """预计完成时间和建议轮询间隔，任务结束后为 null"""
+    predicted_completion_at = serializers.SerializerMethodField()
+    poll_after = serializers.SerializerMethodField()
+
+    def get_predicted_completion_at(self, obj):
+        completion = self._predict_completion(obj)
+        return completion.isoformat() if completion else None
+
+    def get_poll_after(self, obj):
+        return cost_model.poll_after(obj, self._predict_completion(obj))
+
+    def _predict_completion(self, obj):
+        """同一任务的两个字段共用一次预测，排队等待估算需要查询数据库"""
+        completions = self.__dict__.setdefault('_completions', {})
+        if obj.pk not in completions:
+            completions[obj.pk] = cost_model.predict_completion(obj, self._pending_ahead(obj))
+        return completions[obj.pk]
+
+    def _pending_ahead(self, obj):
+        """列表序列化时一次查询算出整页排队任务的排队数，避免每个任务一次 COUNT"""
+        if '_pending_counts' not in self.__dict__:
+            tasks = [obj]
+            parent = self.parent
+            if isinstance(parent, serializers.ListSerializer) and isinstance(parent.instance, (list, tuple, QuerySet)):
+                # 列表正在遍历的查询集已缓存结果，不会再次查询
+                tasks = list(parent.instance)
+            self._pending_counts = cost_model.pending_ahead(tasks)
+        return self._pending_counts.get(obj.pk)
 
 class ConversionTaskSerializer(serializers.ModelSerializer):
     """转换任务序列化器"""
@@ -17,11 +50,56 @@ class ConversionTaskSerializer(serializers.ModelSerializer):
             'processing_time', 'error_message', 'download_url'
         ]
 
+class ResizeOptionsSerializer(serializers.Serializer):
+    """图片缩放尺寸，不超过JPEG支持的最大边长"""
+    width = serializers.IntegerField(min_value=1, max_value=65535)
+    height = serializers.IntegerField(min_value=1, max_value=65535)
+
+class ConversionOptionsSerializer(serializers.Serializer):
+    """转换选项，像素、内存和进程数上限由转换器限制在配置范围内"""
+    dpi = serializers.IntegerField(min_value=36, max_value=600, required=False)
+    page_range = serializers.CharField(max_length=100, required=False)
+    max_pixels = serializers.IntegerField(min_value=1, required=False)
+    max_memory = serializers.IntegerField(min_value=1, required=False)
+    workers = serializers.IntegerField(min_value=1, required=False)
+    resize = ResizeOptionsSerializer(required=False)
+    jpeg_quality = serializers.IntegerField(min_value=1, max_value=100, required=False)
+
+    def validate_page_range(self, value):
+        from .converters import parse_page_range
+
+        try:
+            # 只检查语法，页数在转换时才知道
+            parse_page_range(value, 1 << 20)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+def validate_conversion_options(value):
+    """校验转换选项，表单上传时选项为JSON字符串"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value else {}
+        except ValueError:
+            raise serializers.ValidationError('Options must be a JSON object')
+    if not isinstance(value, dict):
+        raise serializers.ValidationError('Options must be a JSON object')
+    serializer = ConversionOptionsSerializer(data=value)
+    serializer.is_valid(raise_exception=True)
+    options = dict(serializer.validated_data)
+    if 'resize' in options:
+        options['resize'] = dict(options['resize'])
+    return options
+
 class ConversionRequestSerializer(serializers.Serializer):
     """转换请求序列化器"""
     file = serializers.FileField()
     original_format = serializers.CharField(max_length=10)
     target_format = serializers.CharField(max_length=10)
+    options = serializers.JSONField(required=False, default=dict)
+
+    def validate_options(self, value):
+        return validate_conversion_options(value)
 
     def validate(self, data):
         """验证转换格式"""
@@ -46,6 +124,10 @@ class BatchConversionSerializer(serializers.Serializer):
         max_length=20  # 最多20个文件
     )
     target_format = serializers.CharField(max_length=10)
+    options = serializers.JSONField(required=False, default=dict)
+
+    def validate_options(self, value):
+        return validate_conversion_options(value)
 
     def validate_target_format(self, value):
         """验证目标格式"""
@@ -73,14 +155,15 @@ class UploadSessionSerializer(serializers.ModelSerializer):
 from rest_framework import serializers
 from .models import ConversionTask
 
-class ConversionTaskSerializer(serializers.ModelSerializer):
+class ConversionTaskSerializer(CompletionEstimateMixin, serializers.ModelSerializer):
     """转换任务序列化器"""
     class Meta:
         model = ConversionTask
         fields = [
             'id', 'original_file', 'output_file',
             'target_format', 'status', 'progress',
-            'error_message', 'created_at', 'completed_at'
+            'error_message', 'created_at', 'completed_at',
+            'predicted_completion_at', 'poll_after'
         ]
         read_only_fields = [
             'status', 'progress', 'error_message',
@@ -104,8 +187,11 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         )
         return task
 
-class TaskStatusSerializer(serializers.ModelSerializer):
+class TaskStatusSerializer(CompletionEstimateMixin, serializers.ModelSerializer):
     """任务状态序列化器"""
     class Meta:
         model = ConversionTask
-        fields = ['id', 'status', 'progress', 'error_message']
\ No newline at end of file
+        fields = [
+            'id', 'status', 'progress', 'error_message',
+            'predicted_completion_at', 'poll_after'
+        ]
\ No newline at end of file
@@ -3,6 +3,7 @@ from django.utils import timezone
 from django.db import transaction
 from apps.core.exceptions import TaskStateError
 from django.utils.translation import gettext as _
+from .events import task_events, STARTED, FINISHED
 
 class TaskStateMachine:
     """任务状态机"""
@@ -51,6 +52,12 @@ class TaskStateMachine:
 
         self.task.save()
 
+        # 通知调度器更新运行中任务计数
+        if new_state == 'processing':
+            task_events.publish_on_commit(STARTED, self.task)
+        elif current_state == 'processing':
+            task_events.publish_on_commit(FINISHED, self.task)
+
     def retry(self):
         """重试失败的任务"""
         if self.task.status != 'failed':
@@ -1,54 +1,51 @@
 from celery import shared_task
 from django.core.cache import cache
 from django.conf import settings
+from django.core.files import File
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import ConversionTask
-from .converter import FileConverter
+from .engine import ConversionEngine
+from .result_cache import ResultCache
+from .events import task_events, STARTED, FINISHED
 import os
-import time
 import logging
 from django.utils import timezone
 from datetime import timedelta
-from django.db import transaction
-from functools import wraps
+from django.db import transaction, OperationalError, InterfaceError
+from kombu.exceptions import OperationalError as BrokerOperationalError
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 
 logger = logging.getLogger(__name__)
 
-def retry_on_error(max_retries=3, delay=60):
-    """错误重试装饰器"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_error = None
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    last_error = e
-                    logger.error(
-                        f"Task failed (attempt {attempt + 1}/{max_retries}): {e}"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(delay * (attempt + 1))
-                        continue
-            raise last_error
-        return wrapper
-    return decorator
+# 可以重试的临时错误：文件IO、消息代理、数据库和Redis连接。
+# 其他错误（格式不支持、页码范围无效、文件或图片过大等）重试也不会成功，直接标记失败
+TRANSIENT_ERRORS = (
+    OSError,
+    OperationalError,
+    InterfaceError,
+    BrokerOperationalError,
+    RedisConnectionError,
+    RedisTimeoutError,
+)
 
-@shared_task
-@retry_on_error()
+@shared_task(bind=True, max_retries=3)
 def convert_file(self, task_id):
-    """文件转换任务"""
+    """文件转换任务
+
+    临时错误由Celery延迟重试，不在工作进程中等待；重试期间任务保持处理中，
+    重试次数用完才标记为失败。永久错误不重试，直接标记为失败。
+    """
     channel_layer = get_channel_layer()
     task = ConversionTask.objects.get(id=task_id)
-    converter = FileConverter()
+    output_path = None
     
     try:
         # 更新任务状态
         task.status = 'processing'
         task.started_at = timezone.now()
         task.save()
+        task_events.publish(STARTED, task)
         
         # 设置初始进度
         cache.set(f'task_progress:{task_id}', 0)
@@ -59,73 +56,77 @@ def convert_file(self, task_id):
         if total_size > settings.CONVERSION_SETTINGS['max_file_size']:
             raise ValueError("File too large")
         
-        # 分块处理大文件
-        chunk_size = settings.CONVERSION_SETTINGS['chunk_size']
-        processed_size = 0
+        def report_progress(progress):
+            cache.set(f'task_progress:{task_id}', progress)
+            _notify_progress(channel_layer, task_id, progress, 'processing')
         
-        with open(task.original_file.path, 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                    
-                try:
-                    # 处理数据块
-                    converter.process_chunk(chunk)
-                    
-                    # 更新进度
-                    processed_size += len(chunk)
-                    progress = int((processed_size / total_size) * 100)
-                    cache.set(f'task_progress:{task_id}', progress)
-                    _notify_progress(channel_layer, task_id, progress, 'processing')
-                    
-                    # 防止CPU过载
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing chunk: {str(e)}")
-                    # 重试当前块
-                    time.sleep(1)
-                    continue
-        
-        # 完成转换
-        output_path = converter.complete_conversion(task.target_format)
+        # 按实际工作单元（页、行、瓦片）驱动转换
+        engine = ConversionEngine(progress_callback=report_progress)
+        output_path = engine.get_output_path(
+            task.id,
+            task.original_format,
+            task.target_format
+        )
+        engine.run(
+            task.original_file.path,
+            output_path,
+            task.original_format,
+            task.target_format,
+            options=task.options
+        )
         
         # 保存结果
         with open(output_path, 'rb') as f:
-            task.output_file.save(
-                f"{task.id}.{task.target_format}",
-                f
+            task.converted_file.save(
+                os.path.basename(output_path),
+                File(f),
+                save=False
             )
         
         # 更新任务状态
         task.status = 'completed'
+        task.progress = 100
         task.completed_at = timezone.now()
+        task.processing_time = task.completed_at - task.started_at
         task.save()
+        task_events.publish(FINISHED, task)
+        
+        # 缓存结果供相同输入复用
+        ResultCache().store(task)
         
-        # 清理缓存和临时文件
+        # 清理缓存
         cache.delete(f'task_progress:{task_id}')
-        _cleanup_temp_files(output_path)
         
         # 发送完成通知
         _notify_progress(channel_layer, task_id, 100, 'completed')
         
     except Exception as e:
         logger.exception(f"Conversion failed for task {task_id}: {str(e)}")
+        task.error_message = str(e)
+        
+        # 重试临时错误，任务仍占用调度槽位，不发布结束事件
+        if isinstance(e, TRANSIENT_ERRORS) and self.request.retries < self.max_retries:
+            task.save()
+            _notify_progress(channel_layer, task_id, 0, 'retrying', str(e))
+            raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
         
         # 更新任务状态
         task.status = 'failed'
-        task.error_message = str(e)
         task.save()
+        task_events.publish(FINISHED, task)
         
         # 发送错误通知
         _notify_progress(channel_layer, task_id, 0, 'failed', str(e))
         
-        # 重试任务
-        if self.request.retries < self.max_retries:
-            raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
-        
         raise
+    
+    finally:
+        # 清理临时文件
+        if output_path:
+            _cleanup_temp_files(output_path)
+
+# 兼容现有调用方
+convert_file_task = convert_file
 
 def _notify_progress(channel_layer, task_id, progress, status, message=None):
     """发送进度通知"""
@@ -1,125 +1,358 @@
 import os
+import math
 import uuid
 from datetime import datetime, timedelta
 from django.conf import settings
-from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+from django_redis import get_redis_connection
 import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
 class UploadSessionManager:
-    """上传会话管理器"""
+    """上传会话管理器
+
+    会话状态保存在Redis中：会话信息为哈希，已收到的分片为位图，分片哈希为另一个哈希。
+    每个分片只做一次 SETBIT/HSET，并发上传同一会话的分片不会互相覆盖，
+    也不必每次序列化整个会话。
+    """
     
     CHUNK_DIR = 'chunks'  # 分片存储目录
-    SESSION_TIMEOUT = 24 * 60 * 60  # 会话有效期24小时
+    KEY_PREFIX = 'upload_session'
     
     def __init__(self):
         # 确保分片存储目录存在
         self.chunk_path = os.path.join(settings.MEDIA_ROOT, self.CHUNK_DIR)
         if not os.path.exists(self.chunk_path):
             os.makedirs(self.chunk_path)
+        self.upload_settings = settings.CONVERSION_SETTINGS['upload']
+        self.session_timeout = self.upload_settings['session_timeout']
+        self._redis = None
+
+    @property
+    def redis(self):
+        """Redis连接，首次使用时获取"""
+        if self._redis is None:
+            self._redis = get_redis_connection('default')
+        return self._redis
+
+    def get_chunk_plan(self, file_size):
+        """按文件大小计算建议的分片大小和分片数"""
+        chunk_size = self.upload_settings['chunk_size']
+        # 分片数超出上限时按2的幂增大分片
+        while math.ceil(file_size / chunk_size) > self.upload_settings['max_chunks']:
+            chunk_size *= 2
+        chunk_size = min(chunk_size, self.upload_settings['max_chunk_size'])
+        return chunk_size, math.ceil(file_size / chunk_size)
+
+    def create_session(self, filename, file_size, total_chunks=None, chunk_size=None):
+        """创建上传会话
+
+        分片直接按位置写入单个上传文件，chunk_size 为除最后一片外
+        每个分片的大小。客户端未指定分片方案时使用服务端建议的方案；
+        只给出分片数时以收到的第一个分片为准。
+        上传文件在收到第一个分片时才预分配磁盘空间，创建会话本身不占用空间。
+        """
+        file_size = _positive_int(file_size, '文件大小')
+        if file_size > settings.CONVERSION_SETTINGS['max_file_size']:
+            raise ValueError('文件过大')
+
+        if chunk_size is not None:
+            chunk_size = _positive_int(chunk_size, '分片大小')
+            planned_chunks = math.ceil(file_size / chunk_size)
+            if total_chunks is not None and _positive_int(total_chunks, '分片数') != planned_chunks:
+                raise ValueError('分片数与分片大小不一致')
+            total_chunks = planned_chunks
+        elif total_chunks is not None:
+            total_chunks = _positive_int(total_chunks, '分片数')
+            if total_chunks == 1:
+                chunk_size = file_size
+        else:
+            chunk_size, total_chunks = self.get_chunk_plan(file_size)
+
+        if total_chunks > min(self.upload_settings['max_chunks'], file_size):
+            raise ValueError('分片数无效')
+        if chunk_size:
+            self._check_chunk_plan(file_size, total_chunks, chunk_size)
 
-    def create_session(self, filename, file_size, total_chunks):
-        """创建上传会话"""
         session_id = str(uuid.uuid4())
         session = {
             'id': session_id,
             'filename': filename,
             'file_size': file_size,
             'total_chunks': total_chunks,
-            'uploaded_chunks': set(),
             'created_at': datetime.now().isoformat(),
-            'chunk_dir': os.path.join(self.chunk_path, session_id)
+            'upload_path': os.path.join(self.chunk_path, f'{session_id}.part')
         }
+        if chunk_size:
+            session['chunk_size'] = chunk_size
         
-        # 创建分片存储目录
-        os.makedirs(session['chunk_dir'])
+        # 只创建空文件，磁盘空间在收到第一个分片后再分配
+        os.close(os.open(session['upload_path'], os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
         
-        # 缓存会话信息
-        cache.set(f'upload_session_{session_id}', session, self.SESSION_TIMEOUT)
+        # 保存会话信息
+        info_key = self._key(session_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(info_key, mapping=session)
+        pipe.expire(info_key, self.session_timeout)
+        pipe.execute()
         
-        return session
+        return dict(session, chunk_size=session.get('chunk_size'), uploaded_chunks=set())
 
     def get_session(self, session_id):
-        """获取上传会话"""
-        return cache.get(f'upload_session_{session_id}')
-
-    def update_session(self, session_id, chunk_index):
-        """更新会话状态"""
-        session = self.get_session(session_id)
+        """获取上传会话，包括已上传的分片序号"""
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._key(session_id))
+        pipe.get(self._key(session_id, 'chunks'))
+        info, bitmap = pipe.execute()
+        
+        session = self._decode_session(info)
         if session:
-            session['uploaded_chunks'].add(chunk_index)
-            cache.set(f'upload_session_{session_id}', session, self.SESSION_TIMEOUT)
+            session['uploaded_chunks'] = decode_bitmap(bitmap, session['total_chunks'])
         return session
 
-    def save_chunk(self, session_id, chunk_index, chunk_file):
-        """保存分片文件"""
+    def get_resumable_session(self, session_id, filename, file_size):
+        """获取可续传的会话，文件名或大小不一致时返回 None"""
         session = self.get_session(session_id)
+        if (
+            session
+            and session['filename'] == filename
+            and session['file_size'] == int(file_size)
+            and os.path.exists(session['upload_path'])
+        ):
+            return session
+        return None
+
+    def get_upload_status(self, session_id):
+        """获取上传状态，missing 为缺失分片位图（置位表示缺失，位序与Redis一致）"""
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._key(session_id))
+        pipe.get(self._key(session_id, 'chunks'))
+        info, bitmap = pipe.execute()
+
+        session = self._decode_session(info)
+        if not session:
+            return None
+        total_chunks = session['total_chunks']
+        missing = missing_bitmap(bitmap, total_chunks)
+        return {
+            'id': session_id,
+            'file_size': session['file_size'],
+            'chunk_size': session['chunk_size'],
+            'total_chunks': total_chunks,
+            'uploaded_count': total_chunks - sum(bin(byte).count('1') for byte in missing),
+            'missing': missing
+        }
+
+    def update_session(self, session_id, chunk_index, chunk_hash=None):
+        """原子地记录已收到的分片，返回已收到的分片数
+
+        每收到一个分片都会延长会话有效期，长时间的上传不会中途过期。
+        """
+        chunks_key = self._key(session_id, 'chunks')
+        hashes_key = self._key(session_id, 'hashes')
+        
+        pipe = self.redis.pipeline()
+        pipe.setbit(chunks_key, chunk_index, 1)
+        if chunk_hash:
+            pipe.hset(hashes_key, chunk_index, chunk_hash)
+        for key in (self._key(session_id), chunks_key, hashes_key):
+            pipe.expire(key, self.session_timeout)
+        pipe.bitcount(chunks_key)
+        return pipe.execute()[-1]
+
+    def save_chunk(self, session_id, chunk_index, chunk_file):
+        """把分片写入上传文件中的对应位置，返回已收到的分片数"""
+        session = self._decode_session(self.redis.hgetall(self._key(session_id)))
         if not session:
             raise ValueError('上传会话不存在或已过期')
             
-        chunk_filename = f'chunk_{chunk_index}'
-        chunk_path = os.path.join(session['chunk_dir'], chunk_filename)
+        offset = self._get_chunk_offset(session, chunk_index, chunk_file.size)
         
-        with open(chunk_path, 'wb') as f:
+        # 第一个通过校验的分片负责预分配，之后的写入不会再扩展文件
+        if self.redis.hsetnx(self._key(session_id), 'allocated', 1):
+            self._allocate(session['upload_path'], session['file_size'])
+            
+        # 写入时同步计算分片哈希，完成上传时无需再读一遍文件
+        hasher = hashlib.sha256()
+        fd = os.open(session['upload_path'], os.O_WRONLY)
+        try:
             for chunk in chunk_file.chunks():
-                f.write(chunk)
+                hasher.update(chunk)
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    offset += written
+                    view = view[written:]
+        finally:
+            os.close(fd)
                 
-        return self.update_session(session_id, chunk_index)
+        return self.update_session(session_id, chunk_index, hasher.hexdigest())
 
     def merge_chunks(self, session_id):
-        """合并分片文件"""
-        session = self.get_session(session_id)
+        """完成上传，分片已按位置写入，只需把上传文件移动到目标位置"""
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._key(session_id))
+        pipe.bitcount(self._key(session_id, 'chunks'))
+        pipe.hgetall(self._key(session_id, 'hashes'))
+        info, uploaded_count, chunk_hashes = pipe.execute()
+        
+        session = self._decode_session(info)
         if not session:
             raise ValueError('上传会话不存在或已过期')
             
-        if len(session['uploaded_chunks']) != session['total_chunks']:
+        if uploaded_count != session['total_chunks']:
             raise ValueError('还有分片未上传完成')
             
-        # 创建目标文件目录
-        target_dir = os.path.join(settings.MEDIA_ROOT, 'uploads', 
-                                datetime.now().strftime('%Y/%m/%d'))
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-            
-        # 合并文件
-        target_path = os.path.join(target_dir, session['filename'])
-        with open(target_path, 'wb') as target_file:
-            for i in range(session['total_chunks']):
-                chunk_path = os.path.join(session['chunk_dir'], f'chunk_{i}')
-                with open(chunk_path, 'rb') as chunk_file:
-                    target_file.write(chunk_file.read())
+        # 客户端给出的文件名只作参考，清理后由存储生成不冲突的文件名
+        file_path = default_storage.get_available_name(os.path.join(
+            'uploads', datetime.now().strftime('%Y/%m/%d'),
+            get_valid_filename(os.path.basename(session['filename']))
+        ))
+        target_path = default_storage.path(file_path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(session['upload_path'], target_path)
+        
+        # 分片树哈希为各分片SHA-256按顺序拼接后的SHA-256，只用于校验分片，
+        # 与文件内容的SHA-256不同
+        chunk_hashes = {int(index): value for index, value in chunk_hashes.items()}
+        chunk_tree_hash = hashlib.sha256()
+        for i in range(session['total_chunks']):
+            chunk_tree_hash.update(bytes.fromhex(chunk_hashes[i].decode()))
+
+        # 分片乱序到达，无法在上传时按顺序累计，合并后顺序读取一遍计算文件哈希，
+        # 与普通上传的 sha256 一致，可直接作为 ConversionTask.file_hash 用于结果缓存
+        file_hash = hashlib.sha256()
+        with open(target_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(chunk)
                     
-        # 清理分片文件
+        # 清理会话
         self.cleanup_session(session_id)
         
-        # 返回相对路径
-        return os.path.relpath(target_path, settings.MEDIA_ROOT)
+        session['file_path'] = file_path
+        session['chunk_tree_hash'] = chunk_tree_hash.hexdigest()
+        session['file_hash'] = file_hash.hexdigest()
+        return session
 
     def cleanup_session(self, session_id):
         """清理会话数据"""
-        session = self.get_session(session_id)
-        if session and os.path.exists(session['chunk_dir']):
-            # 删除分片文件和目录
-            for chunk_file in os.listdir(session['chunk_dir']):
-                os.remove(os.path.join(session['chunk_dir'], chunk_file))
-            os.rmdir(session['chunk_dir'])
+        upload_path = self.redis.hget(self._key(session_id), 'upload_path')
+        if upload_path and os.path.exists(upload_path.decode()):
+            # 删除未完成的上传文件
+            os.remove(upload_path.decode())
             
-        # 删除缓存
-        cache.delete(f'upload_session_{session_id}')
+        # 删除会话状态
+        self.redis.delete(
+            self._key(session_id),
+            self._key(session_id, 'chunks'),
+            self._key(session_id, 'hashes')
+        )
 
     def cleanup_expired_sessions(self):
-        """清理过期的会话"""
-        expired_time = datetime.now() - timedelta(hours=24)
+        """清理过期会话遗留的上传文件，会话状态由Redis过期删除"""
+        expired_time = (datetime.now() - timedelta(seconds=self.session_timeout)).timestamp()
         
-        # 遍历分片目录
-        for session_id in os.listdir(self.chunk_path):
-            session = self.get_session(session_id)
-            if session:
-                created_at = datetime.fromisoformat(session['created_at'])
-                if created_at < expired_time:
-                    self.cleanup_session(session_id) 
+        # 遍历上传文件
+        for filename in os.listdir(self.chunk_path):
+            path = os.path.join(self.chunk_path, filename)
+            if os.path.getmtime(path) < expired_time:
+                self.cleanup_session(filename[:-len('.part')])
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _key(self, session_id, suffix=None):
+        """会话状态的Redis键"""
+        key = f'{self.KEY_PREFIX}:{session_id}'
+        return f'{key}:{suffix}' if suffix else key
+
+    def _decode_session(self, info):
+        """解码Redis哈希中的会话信息"""
+        if not info:
+            return None
+        session = {key.decode(): value.decode() for key, value in info.items()}
+        for field in ('file_size', 'total_chunks', 'chunk_size'):
+            if field in session:
+                session[field] = int(session[field])
+        session.setdefault('chunk_size', None)
+        return session
+
+    def _get_chunk_offset(self, session, chunk_index, length):
+        """计算分片在文件中的偏移，分片长度必须与其序号对应的长度完全一致"""
+        file_size = session['file_size']
+        total_chunks = session['total_chunks']
+        if not 0 <= chunk_index < total_chunks:
+            raise ValueError('分片序号无效')
+        is_last = chunk_index == total_chunks - 1
+            
+        chunk_size = session['chunk_size']
+        if not chunk_size:
+            # 第一个到达的分片确定分片大小：非末尾分片即分片大小，
+            # 末尾分片的长度也唯一确定了其余分片的大小；并发时只有一个写入成功
+            if is_last:
+                chunk_size, remainder = divmod(file_size - length, total_chunks - 1)
+                if remainder:
+                    raise ValueError('分片大小不一致')
+            else:
+                chunk_size = length
+            self._check_chunk_plan(file_size, total_chunks, chunk_size)
+            info_key = self._key(session['id'])
+            pipe = self.redis.pipeline()
+            pipe.hsetnx(info_key, 'chunk_size', chunk_size)
+            pipe.hget(info_key, 'chunk_size')
+            chunk_size = int(pipe.execute()[-1])
+            
+        expected = file_size - (total_chunks - 1) * chunk_size if is_last else chunk_size
+        if length != expected:
+            raise ValueError('分片大小不一致')
+        return chunk_index * chunk_size
+
+    def _check_chunk_plan(self, file_size, total_chunks, chunk_size):
+        """校验分片方案：分片大小不超过上限，且恰好切分出 total_chunks 个非空分片"""
+        if not 0 < chunk_size <= self.upload_settings['max_chunk_size']:
+            raise ValueError('分片大小无效')
+        if math.ceil(file_size / chunk_size) != total_chunks:
+            raise ValueError('分片数与分片大小不一致')
+
+    def _allocate(self, path, file_size):
+        """按文件大小预分配磁盘空间，文件系统不支持时扩展为稀疏文件"""
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            try:
+                os.posix_fallocate(fd, 0, file_size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, file_size)
+        finally:
+            os.close(fd)
+
+def _positive_int(value, name):
+    """把客户端给出的数值转换为正整数"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name}无效')
+    if value <= 0:
+        raise ValueError(f'{name}无效')
+    return value
+
+def missing_bitmap(bitmap, size):
+    """计算缺失分片位图：对已收到的位图取反，只保留前 size 位"""
+    received = bytes(bitmap or b'').ljust((size + 7) // 8, b'\x00')
+    missing = bytearray(~byte & 0xFF for byte in received[:(size + 7) // 8])
+    if size % 8:
+        missing[-1] &= (0xFF << (8 - size % 8)) & 0xFF
+    return bytes(missing)
+
+def decode_bitmap(bitmap, size):
+    """解码Redis位图为已置位的序号集合（位偏移0为首字节最高位）"""
+    if not bitmap:
+        return set()
+    return {
+        index for index in range(min(size, len(bitmap) * 8))
+        if bitmap[index >> 3] & (0x80 >> (index & 7))
+    }
 
 class ChunkUploadHandler:
     def __init__(self):
@@ -1,24 +1,38 @@
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
-from django.core.exceptions import ValidationError
 from .upload import UploadSessionManager
 import json
+import base64
 
 upload_manager = UploadSessionManager()
 
 @require_http_methods(["POST"])
 def create_upload_session(request):
-    """创建上传会话"""
+    """创建上传会话
+
+    客户端带上之前的 uploadId 且文件一致时续传该会话，返回已收到的分片；
+    未指定分片方案时由服务端给出分片大小和建议并发数。
+    """
     try:
         data = json.loads(request.body)
-        session = upload_manager.create_session(
-            filename=data['filename'],
-            file_size=data['size'],
-            total_chunks=data['totalChunks']
-        )
+        session = None
+        if data.get('uploadId'):
+            session = upload_manager.get_resumable_session(
+                data['uploadId'], data['filename'], data['size']
+            )
+        if session is None:
+            session = upload_manager.create_session(
+                filename=data['filename'],
+                file_size=data['size'],
+                total_chunks=data.get('totalChunks'),
+                chunk_size=data.get('chunkSize')
+            )
         return JsonResponse({
             'uploadId': session['id'],
-            'uploadedChunks': list(session['uploaded_chunks'])
+            'chunkSize': session['chunk_size'],
+            'totalChunks': session['total_chunks'],
+            'parallelism': upload_manager.upload_settings['parallel_chunks'],
+            'uploadedChunks': sorted(session['uploaded_chunks'])
         })
     except Exception as e:
         return JsonResponse({
@@ -33,28 +47,55 @@ def upload_chunk(request):
         chunk_index = int(request.POST['chunkIndex'])
         upload_id = request.POST['uploadId']
         
-        session = upload_manager.save_chunk(upload_id, chunk_index, chunk_file)
+        uploaded_count = upload_manager.save_chunk(upload_id, chunk_index, chunk_file)
         
         return JsonResponse({
             'uploaded': True,
             'chunkIndex': chunk_index,
-            'uploadedChunks': list(session['uploaded_chunks'])
+            'uploadedCount': uploaded_count
         })
     except Exception as e:
         return JsonResponse({
             'error': str(e)
         }, status=400)
 
+@require_http_methods(["GET", "HEAD"])
+def upload_status(request, upload_id):
+    """查询上传状态
+
+    缺失分片位图以base64编码，第 i 位（首字节最高位为第0位）置位表示分片 i 未收到。
+    HEAD 请求只在响应头中返回同样的信息。
+    """
+    status = upload_manager.get_upload_status(upload_id)
+    if status is None:
+        return JsonResponse({'error': '上传会话不存在或已过期'}, status=404)
+        
+    missing = base64.b64encode(status['missing']).decode()
+    response = JsonResponse({
+        'uploadId': upload_id,
+        'chunkSize': status['chunk_size'],
+        'totalChunks': status['total_chunks'],
+        'uploadedCount': status['uploaded_count'],
+        'missingBitmap': missing
+    })
+    response['Upload-Chunks-Total'] = status['total_chunks']
+    response['Upload-Chunks-Received'] = status['uploaded_count']
+    response['Upload-Missing-Bitmap'] = missing
+    response['Cache-Control'] = 'no-store'
+    return response
+
 @require_http_methods(["POST"])
 def complete_upload(request):
     """完成上传"""
     try:
         data = json.loads(request.body)
-        file_path = upload_manager.merge_chunks(data['uploadId'])
+        session = upload_manager.merge_chunks(data['uploadId'])
         
         return JsonResponse({
             'status': 'success',
-            'file_path': file_path
+            'file_path': session['file_path'],
+            'file_hash': session['file_hash'],
+            'chunk_tree_hash': session['chunk_tree_hash']
         })
     except Exception as e:
         return JsonResponse({
@@ -11,7 +11,10 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 import os
 
 from .models import ConversionTask, ConversionHistory, UploadSession, PreviewTask
-from .tasks import convert_file_task
+from .workers import submit_conversion
+from .cost_model import cost_model
+from .serializers import validate_conversion_options
+from rest_framework import serializers
 from apps.security.validators import FileValidator, SecurityScanner
 from apps.security.decorators import check_conversion_limits
 from .error_handlers import handle_conversion_errors, FileValidationError, ConversionProcessError
@@ -25,12 +28,13 @@ def upload_file(request):
             file = request.FILES['file']
             target_format = request.POST.get('target_format')
             
-            # 验证文件
+            # 验证文件和转换选项
             try:
                 FileValidator.validate_file(file)
                 SecurityScanner.scan_file(file)
                 SecurityScanner.check_filename(file.name)
-            except ValidationError as e:
+                options = validate_conversion_options(request.POST.get('options', ''))
+            except (ValidationError, serializers.ValidationError) as e:
                 return JsonResponse({
                     'status': 'error',
                     'message': str(e)
@@ -42,7 +46,9 @@ def upload_file(request):
                 original_file=file,
                 original_format=os.path.splitext(file.name)[1][1:].lower(),
                 target_format=target_format,
-                file_size=file.size
+                file_size=file.size,
+                file_hash=getattr(file, 'sha256', ''),
+                options=options
             )
 
             # 记录转换历史
@@ -54,7 +60,7 @@ def upload_file(request):
             )
 
             # 启动异步转换任务
-            convert_file_task.delay(task.id)
+            submit_conversion(task)
 
             return JsonResponse({
                 'status': 'success',
@@ -87,6 +93,10 @@ def check_status(request, task_id):
             data['download_url'] = task.converted_file.url
         elif task.status == 'failed':
             data['error_message'] = task.error_message
+        else:
+            # 客户端按 poll_after 调整轮询间隔，不必固定频率查询
+            data['predicted_completion_at'] = cost_model.predict_completion(task)
+            data['poll_after'] = cost_model.poll_after(task, data['predicted_completion_at'])
 
         return JsonResponse(data)
 
@@ -270,10 +280,12 @@ def download_file(request, task_id):
 def create_upload_session(request):
     """创建上传会话"""
     # 检查每日转换限制
-    today = timezone.now().date()
+    # 用时间范围代替 __date，可以使用 (user, created_at) 索引
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
     daily_count = ConversionTask.objects.filter(
         user=request.user,
-        created_at__date=today
+        created_at__gte=today,
+        created_at__lt=today + timezone.timedelta(days=1)
     ).count()
     
     if daily_count >= request.user.daily_conversion_limit:
@@ -392,11 +404,13 @@ def generate_image_preview(file):
     import tempfile
     import os
     
+    from .imaging import downscale_image
+
     # 创建缩略图
     with Image.open(file.path) as img:
-        # 设置最大尺寸
+        # 设置最大尺寸，JPEG按比例解码
         max_size = (800, 800)
-        img.thumbnail(max_size)
+        img = downscale_image(img, max_size)
         
         # 保存预览
         with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
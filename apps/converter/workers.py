@@ -0,0 +1,129 @@
+"""按格式族划分的转换工作进程池"""
+from django.conf import settings
+from celery.signals import celeryd_init
+import os
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'svg'}
+
+def get_format_family(source_format, target_format):
+    """获取转换所属的格式族（image、pdf、office）"""
+    source_format = source_format.lower()
+    target_format = target_format.lower()
+
+    # 涉及PDF的转换依赖PyMuPDF/pdf2docx/reportlab，成本最高
+    if 'pdf' in (source_format, target_format):
+        return 'pdf'
+    if source_format in IMAGE_FORMATS and target_format in IMAGE_FORMATS:
+        return 'image'
+    return 'office'
+
+def get_conversion_queue(source_format, target_format):
+    """获取转换任务应路由到的Celery队列"""
+    family = get_format_family(source_format, target_format)
+    return settings.CONVERTER_WORKER_FAMILIES[family]['queue']
+
+def dispatch_conversion(task, **options):
+    """将转换任务投递到对应格式族的队列
+
+    转换结果已缓存时直接完成任务，不投递，返回 None。
+    """
+    from .result_cache import ResultCache
+
+    if ResultCache().apply(task):
+        return None
+    return send_conversion(task, **options)
+
+def send_conversion(task, **options):
+    """不检查结果缓存，直接把转换任务投递到对应格式族的队列"""
+    from .tasks import convert_file
+
+    queue = get_conversion_queue(task.original_format, task.target_format)
+    return convert_file.apply_async(args=[task.id], queue=queue, **options)
+
+def submit_conversion(task):
+    """提交新建的转换任务
+
+    启用调度器时任务进入共享队列，由调度器领导者按优先级和预计耗时派发；
+    未启用时直接投递到Celery。队列已满或用户排队任务数超限时任务标记为失败并抛出异常。
+    """
+    if not settings.CONVERSION_SETTINGS['scheduler']['enabled']:
+        return dispatch_conversion(task)
+
+    from .queue import TaskQueue
+    from apps.core.exceptions import QueueFullError, UserTaskLimitError
+
+    try:
+        TaskQueue().push(task)
+    except (QueueFullError, UserTaskLimitError) as e:
+        task.status = 'failed'
+        task.error_message = str(e)
+        task.save(update_fields=['status', 'error_message'])
+        raise
+    return None
+
+def get_worker_families(queues):
+    """根据工作进程监听的队列确定需要预热的格式族"""
+    families = settings.CONVERTER_WORKER_FAMILIES
+    env_family = os.environ.get('CONVERTER_WORKER_FAMILY')
+    if env_family:
+        return [family for family in env_family.split(',') if family in families]
+
+    queues = set(queues or [])
+    return [
+        family for family, config in families.items()
+        if config['queue'] in queues
+    ]
+
+def warm_up(family):
+    """预先导入格式族依赖的模块并初始化字体等状态"""
+    config = settings.CONVERTER_WORKER_FAMILIES[family]
+    for module_name in config['modules']:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(f"Failed to warm up {module_name} for {family} workers: {e}")
+
+    warmer = _WARMERS.get(family)
+    if warmer:
+        try:
+            warmer()
+        except Exception as e:
+            logger.warning(f"Failed to warm up {family} libraries: {e}")
+
+    # 复用同一个转换器工厂实例
+    from .converters import get_conversion_factory
+    get_conversion_factory()
+    logger.info(f"Converter worker warmed up for family: {family}")
+
+def _warm_image():
+    """加载Pillow全部编解码插件"""
+    from PIL import Image
+    Image.init()
+
+def _warm_pdf():
+    """打开一个空文档并加载基础字体"""
+    import fitz
+    from reportlab.pdfbase import pdfmetrics
+
+    with fitz.open() as doc:
+        doc.new_page()
+    pdfmetrics.getFont('Helvetica')
+
+_WARMERS = {
+    'image': _warm_image,
+    'pdf': _warm_pdf,
+}
+
+@celeryd_init.connect
+def warm_worker(sender=None, conf=None, options=None, **kwargs):
+    """工作进程启动时预热，预热结果在prefork子进程间共享"""
+    queues = (options or {}).get('queues')
+    if isinstance(queues, str):
+        queues = queues.split(',')
+
+    for family in get_worker_families(queues):
+        warm_up(family)
@@ -48,4 +48,20 @@ class LockAcquisitionError(ConcurrencyError):
 
 class DeadlockError(ConcurrencyError):
     """死锁错误"""
-    pass 
\ No newline at end of file
+    pass
+
+class QueueFullError(FileConversionError):
+    """任务队列已满"""
+    pass
+
+class UserTaskLimitError(FileConversionError):
+    """用户排队任务数超限"""
+    pass
+
+class TaskDependencyError(FileConversionError):
+    """依赖任务未完成"""
+    pass
+
+class LeadershipLostError(FileConversionError):
+    """调度节点已不是领导者"""
+    pass
@@ -108,11 +108,17 @@ class ErrorHandler:
         from django.utils import timezone
         from datetime import timedelta
         from apps.security.models import SecurityLog
+        from apps.security.partitions import LogPartitioner
         
         cutoff_date = timezone.now() - timedelta(days=days)
         total_deleted = 0
         
         try:
+            # 分区表直接删除过期分区
+            partitioner = LogPartitioner(SecurityLog)
+            if partitioner.is_partitioned():
+                return partitioner.drop_before(cutoff_date)
+
             # 分批删除旧记录
             while True:
                 ids = SecurityLog.objects.filter(
@@ -0,0 +1,170 @@
+"""异步审计日志
+
+请求线程只把审计记录放进进程内的有界缓冲区，由后台线程按批 bulk_create 写入数据库。
+缓冲区满时先短暂等待后台线程腾出空间（反压），仍然没有空间才丢弃并计数；
+进程正常退出时把缓冲区中剩余的记录全部写入，关闭后再产生的记录直接同步写入，
+写入失败的记录都计入丢弃数，不会留在无人处理的缓冲区里。
+"""
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from collections import deque
+import os
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class AuditSink:
+    """审计日志缓冲区"""
+
+    def __init__(self, autostart=True):
+        self.settings = settings.AUDIT_SINK
+        self.autostart = autostart
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        self._closed = False
+        self.dropped = 0
+        self.written = 0
+
+    def emit(self, **fields):
+        """加入一条审计记录，缓冲区满且等待超时后丢弃，返回是否已加入
+
+        关闭后不再有后台线程写入，记录直接同步写入。
+        """
+        fields.setdefault('created_at', timezone.now())
+        if self.autostart:
+            self._ensure_flusher()
+
+        with self._condition:
+            if not self._closed and len(self._buffer) >= self.settings['buffer_size']:
+                # 唤醒后台线程写入，等待空间
+                self._condition.notify_all()
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._buffer) < self.settings['buffer_size'],
+                    timeout=self.settings['block_timeout']
+                )
+                if not self._closed and len(self._buffer) >= self.settings['buffer_size']:
+                    self.dropped += 1
+                    return False
+
+            # 与 close() 在同一把锁下判断，关闭前加入的记录由 close() 写入
+            if not self._closed:
+                self._buffer.append(fields)
+                if len(self._buffer) >= self.settings['batch_size']:
+                    self._condition.notify_all()
+                return True
+
+        return self._write_now(fields)
+
+    def flush(self):
+        """写入缓冲区中的全部记录，返回写入条数"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    batch = [
+                        self._buffer.popleft()
+                        for _ in range(min(self.settings['batch_size'], len(self._buffer)))
+                    ]
+                    # 腾出空间，唤醒等待中的请求线程
+                    self._condition.notify_all()
+                if not batch:
+                    return total
+                total += self._write(batch)
+
+    def close(self):
+        """停止后台线程并写入剩余记录"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        try:
+            self.flush()
+        except Exception:
+            # 关闭后没有后台线程重试，剩余记录计入丢弃
+            with self._condition:
+                unwritten = len(self._buffer)
+                self._buffer.clear()
+                self.dropped += unwritten
+            logger.error(f"Audit sink closed with {unwritten} unwritten logs")
+        logger.info(f"Audit sink closed: {self.written} written, {self.dropped} dropped")
+
+    def stats(self):
+        """缓冲区状态"""
+        return {
+            'queued': len(self._buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+    def _write(self, batch):
+        """批量写入，失败时放回缓冲区头部等待重试，放不下的丢弃"""
+        from .models import AuditLog
+
+        try:
+            close_old_connections()
+            AuditLog.objects.bulk_create([AuditLog(**fields) for fields in batch])
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} audit logs: {str(e)}")
+            with self._condition:
+                room = max(self.settings['buffer_size'] - len(self._buffer), 0)
+                self._buffer.extendleft(reversed(batch[:room]))
+                self.dropped += len(batch) - min(room, len(batch))
+            raise
+        self.written += len(batch)
+        return len(batch)
+
+    def _write_now(self, fields):
+        """关闭后同步写入一条记录，失败时计入丢弃"""
+        from .models import AuditLog
+
+        try:
+            AuditLog.objects.bulk_create([AuditLog(**fields)])
+        except Exception as e:
+            logger.error(f"Failed to write audit log after close: {str(e)}")
+            with self._condition:
+                self.dropped += 1
+            return False
+        with self._condition:
+            self.written += 1
+        return True
+
+    def _ensure_flusher(self):
+        """每个进程启动一个后台写入线程"""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._condition:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            # fork 继承的缓冲区属于父进程
+            self._buffer.clear()
+            self._closed = False
+        threading.Thread(target=self._run, name='audit-sink', daemon=True).start()
+        atexit.register(self.close)
+
+    def _run(self):
+        """达到批量大小或超过刷新间隔时写入"""
+        reported = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._buffer) >= self.settings['batch_size'],
+                    timeout=self.settings['flush_interval']
+                )
+                if self._closed:
+                    break
+            try:
+                self.flush()
+            except Exception:
+                # 数据库暂时不可用，稍后重试
+                time.sleep(self.settings['flush_interval'])
+            if self.dropped > reported:
+                logger.warning(f"Audit sink dropped {self.dropped - reported} logs")
+                reported = self.dropped
+
+audit_sink = AuditSink()
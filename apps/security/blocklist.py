@@ -0,0 +1,159 @@
+"""进程内IP封禁名单
+
+每个进程在内存中保存一份有效封禁的快照（规范化IP -> 过期时间戳），请求检查只做一次字典查找，不访问数据库。
+封禁和解封在事务提交后通过Redis发布/订阅通知所有进程增量更新；
+后台线程还会定期全量刷新，弥补订阅断开期间丢失的消息。
+"""
+from django.conf import settings
+from django.db import connection
+from django_redis import get_redis_connection
+import os
+import json
+import time
+import logging
+import ipaddress
+import threading
+
+logger = logging.getLogger(__name__)
+
+PERMANENT = float('inf')
+
+def normalize_ip(ip):
+    """规范化IP地址，无效地址返回 None"""
+    try:
+        return ipaddress.ip_address(ip.strip()).compressed
+    except (AttributeError, ValueError):
+        return None
+
+class IPBlocklist:
+    """IP封禁名单快照"""
+
+    def __init__(self):
+        self.settings = settings.SECURITY_BLOCKLIST
+        self.channel = self.settings['channel']
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._pending = None
+        self._listener_pid = None
+
+    def is_blocked(self, ip):
+        """检查IP是否被封禁"""
+        expires_at = self._entries.get(normalize_ip(ip))
+        return expires_at is not None and expires_at > time.time()
+
+    def start(self):
+        """加载快照并启动订阅线程，每个进程只启动一次"""
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+
+        self.reload_safely()
+        threading.Thread(target=self._listen, name='ip-blocklist', daemon=True).start()
+
+    def reload(self):
+        """从数据库全量加载有效封禁"""
+        from .models import BlockedIP
+
+        with self._lock:
+            # 加载期间收到的变更在替换快照后重放
+            self._pending = []
+        try:
+            rows = list(BlockedIP.objects.get_active_blocks().values_list(
+                'ip_address', 'expires_at', 'is_permanent'
+            ))
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        entries = {
+            normalize_ip(ip): PERMANENT if is_permanent or expires_at is None else expires_at.timestamp()
+            for ip, expires_at, is_permanent in rows
+        }
+        with self._lock:
+            for change in self._pending:
+                self._apply_change(entries, change)
+            self._pending = None
+            self._entries = entries
+        logger.info(f"Loaded {len(entries)} blocked IPs")
+
+    def reload_safely(self):
+        """全量刷新，失败时保留旧快照"""
+        try:
+            self.reload()
+        except Exception as e:
+            logger.warning(f"Failed to load IP blocklist: {str(e)}")
+
+    def apply(self, change):
+        """应用一条封禁变更"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            entries = dict(self._entries)
+            self._apply_change(entries, change)
+            self._entries = entries
+
+    def publish(self, change):
+        """在本进程生效并通知其它进程"""
+        self.apply(change)
+        try:
+            get_redis_connection('default').publish(self.channel, json.dumps(change))
+        except Exception as e:
+            logger.warning(f"Failed to publish blocklist change: {str(e)}")
+
+    def publish_block(self, ip, expires_at=None):
+        """通知封禁IP，expires_at 为空表示永久"""
+        self.publish({
+            'action': 'block',
+            'ip': ip,
+            'expires_at': expires_at.timestamp() if expires_at else None
+        })
+
+    def publish_unblock(self, ip):
+        """通知解除IP封禁"""
+        self.publish({'action': 'unblock', 'ip': ip})
+
+    def _apply_change(self, entries, change):
+        ip = normalize_ip(change['ip'])
+        if change['action'] == 'block':
+            entries[ip] = change['expires_at'] or PERMANENT
+        else:
+            entries.pop(ip, None)
+
+    def _refresh(self):
+        """后台线程中全量刷新，用完关闭本线程的数据库连接"""
+        try:
+            self.reload_safely()
+        finally:
+            connection.close()
+
+    def _listen(self):
+        """订阅变更消息并定期全量刷新，连接断开后重新订阅"""
+        refresh_interval = self.settings['refresh_interval']
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # 订阅建立前的变更可能已丢失
+                self._refresh()
+                next_refresh = time.monotonic() + refresh_interval
+                while True:
+                    message = pubsub.get_message(timeout=max(next_refresh - time.monotonic(), 0))
+                    if message is not None:
+                        self.apply(json.loads(message['data']))
+                    if time.monotonic() >= next_refresh:
+                        self._refresh()
+                        next_refresh = time.monotonic() + refresh_interval
+            except Exception as e:
+                logger.warning(f"IP blocklist subscription failed: {str(e)}")
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                time.sleep(self.settings['retry_interval'])
+                self._refresh()
+
+ip_blocklist = IPBlocklist()
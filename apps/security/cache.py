@@ -11,19 +11,24 @@ class CacheManager:
         self.cache = cache
         self.default_timeout = 3600  # 1小时
         
-    def get_conversion_result(self, task_id):
+    def get_conversion_result(self, result_key):
         """获取转换结果缓存"""
-        cache_key = f'conversion_result:{task_id}'
+        cache_key = f'conversion_result:{result_key}'
         return self.cache.get(cache_key)
         
-    def set_conversion_result(self, task_id, result, timeout=None):
+    def set_conversion_result(self, result_key, result, timeout=None):
         """设置转换结果缓存"""
-        cache_key = f'conversion_result:{task_id}'
+        cache_key = f'conversion_result:{result_key}'
         self.cache.set(
             cache_key,
             result,
             timeout or self.default_timeout
         )
+
+    def delete_conversion_result(self, result_key):
+        """删除转换结果缓存"""
+        cache_key = f'conversion_result:{result_key}'
+        self.cache.delete(cache_key)
         
     def get_upload_session(self, session_id):
         """获取上传会话缓存"""
@@ -45,13 +50,9 @@ class CacheManager:
         self.cache.delete(cache_key)
         
     def increment_request_count(self, ip_address):
-        """增加请求计数"""
-        cache_key = f'request_count:{ip_address}'
-        try:
-            return self.cache.incr(cache_key)
-        except ValueError:
-            self.cache.set(cache_key, 1, 60)  # 1分钟过期
-            return 1
+        """增加请求计数，计数1分钟后过期"""
+        from .ratelimit import rate_limiter
+        return rate_limiter.count(f'request_count:{ip_address}', 60)
             
     def get_request_count(self, ip_address):
         """获取请求计数"""
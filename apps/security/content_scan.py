@@ -0,0 +1,345 @@
+"""上传内容扫描
+
+所有恶意代码特征合并为一个扫描器：先用字面量锚点（一个只含字面量的正则，小写文本上按首字符快速跳过）
+单遍定位候选位置，再在候选位置做带长度上限的锚定匹配，最坏情况下也与文件大小成线性关系。
+
+扫描按格式区分：
+- PNG/JPEG/GIF/WebP 跳过压缩的像素数据，只扫描元数据和结尾附加数据
+- PDF 跳过编码流和图片流的原始字节，扫描对象字典、未编码的文本流和 /FlateDecode 流解压后的内容
+- OOXML 只扫描解压后的 XML 部件
+- 其它文件和结构无法解析的文件扫描全部内容
+"""
+from django.conf import settings
+from contextlib import contextmanager
+import re
+import mmap
+import struct
+import logging
+import zlib
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# 恶意代码特征：(名称, 锚点字面量, 锚定正则, 必须出现的字面量, 最大匹配长度)
+# 匹配在小写文本上进行
+THREAT_RULES = [
+    ('script', (b'<script',), rb'<script\b[^>]{0,256}>.{0,4096}?</script>', b'</script>', 4370),  # JavaScript代码
+    ('eval', (b'eval',), rb'eval\s{0,16}\(', b'(', 21),  # eval函数
+    ('cookie', (b'document.cookie',), rb'document\.cookie', None, 15),  # Cookie操作
+    ('command', (b'exec', b'system', b'popen'), rb'(?:exec|system|popen)\s{0,16}\(', b'(', 23),  # 系统命令执行
+    ('sql', (b'select', b'insert', b'update', b'delete'),
+     rb'(?:select|insert|update|delete)\b.{0,256}?\bfrom\b', b'from', 266),  # SQL注入
+]
+
+# 任何特征的最大匹配长度，分块扫描时相邻块至少重叠这么多字节
+MAX_MATCH_LENGTH = max(rule[4] for rule in THREAT_RULES)
+
+# 分块扫描的块大小
+SCAN_WINDOW = 1024 * 1024
+
+_RULES_BY_LITERAL = {}
+for _name, _literals, _pattern, _required, _max_length in THREAT_RULES:
+    for _literal in _literals:
+        _RULES_BY_LITERAL.setdefault(_literal, []).append(
+            (_name, re.compile(_pattern, re.S), _required, _max_length)
+        )
+
+ANCHOR_PATTERN = re.compile(b'|'.join(re.escape(literal) for literal in _RULES_BY_LITERAL))
+
+# OOXML 中需要扫描的文本部件
+OOXML_TEXT_PARTS = ('.xml', '.rels', '.vml')
+
+_JPEG_MARKER = re.compile(rb'\xff[^\x00\xd0-\xd7]')
+_PDF_STREAM = re.compile(rb'(?<!end)stream(?:\r\n|\n|\r)')
+_PDF_FLATE = re.compile(rb'/Filter\s*(?:/FlateDecode|\[\s*/FlateDecode\s*\])')
+
+def find_threat(data):
+    """返回数据中命中的第一个特征名，未命中返回 None"""
+    text = bytes(data).lower()
+    for match in ANCHOR_PATTERN.finditer(text):
+        start = match.start()
+        for name, pattern, required, max_length in _RULES_BY_LITERAL[match.group()]:
+            # 先用字面量排除不可能的位置，避免逐字节尝试惰性匹配
+            if required is not None and text.find(required, start, start + max_length) == -1:
+                continue
+            if pattern.match(text, start):
+                return name
+    return None
+
+class StreamScanner:
+    """增量扫描恶意代码特征
+
+    每块数据与上一块末尾 MAX_MATCH_LENGTH 字节拼接后匹配，内存占用与文件大小无关。
+    """
+    def __init__(self):
+        self.tail = b''
+        self.threat = None
+
+    def feed(self, data):
+        """扫描一块数据，发现特征后不再扫描"""
+        if self.threat is not None:
+            return
+        window = self.tail + bytes(data)
+        self.threat = find_threat(window)
+        self.tail = window[-MAX_MATCH_LENGTH:]
+
+def detect_format(head):
+    """根据文件头识别需要按结构扫描的格式"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'
+    return None
+
+def _png_skips(buf):
+    """PNG 的像素数据块"""
+    pos = 8
+    while pos + 8 <= len(buf):
+        length, chunk_type = struct.unpack('>I4s', buf[pos:pos + 8])
+        end = pos + 8 + length
+        if end + 4 > len(buf):
+            raise ValueError('Truncated PNG chunk')
+        if chunk_type in (b'IDAT', b'fdAT'):
+            yield pos + 8, end
+        pos = end + 4
+        if chunk_type == b'IEND':
+            break
+
+def _jpeg_skips(buf):
+    """JPEG 的熵编码数据"""
+    pos = 2
+    while pos + 1 < len(buf):
+        if buf[pos] != 0xFF:
+            raise ValueError('Invalid JPEG marker')
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            # 填充字节
+            pos += 1
+            continue
+        if marker == 0xD9:
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+
+        end = pos + 2 + int.from_bytes(buf[pos + 2:pos + 4], 'big')
+        if marker == 0xDA:
+            match = _JPEG_MARKER.search(buf, end)
+            if match is None:
+                raise ValueError('Unterminated JPEG scan')
+            yield end, match.start()
+            end = match.start()
+        pos = end
+
+def _gif_skips(buf):
+    """GIF 的LZW图像数据"""
+    def skip_sub_blocks(pos):
+        while buf[pos]:
+            pos += buf[pos] + 1
+        return pos + 1
+
+    flags = buf[10]
+    pos = 13
+    if flags & 0x80:
+        pos += 3 << ((flags & 7) + 1)
+    while True:
+        block = buf[pos]
+        if block == 0x3B:
+            break
+        if block == 0x21:
+            # 扩展块（注释等）保留扫描
+            pos = skip_sub_blocks(pos + 2)
+        elif block == 0x2C:
+            flags = buf[pos + 9]
+            pos += 10
+            if flags & 0x80:
+                pos += 3 << ((flags & 7) + 1)
+            start = pos + 1
+            pos = skip_sub_blocks(start)
+            yield start, pos
+        else:
+            raise ValueError('Invalid GIF block')
+
+def _webp_skips(buf):
+    """WebP 的图像数据块"""
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_type = buf[pos:pos + 4]
+        size = int.from_bytes(buf[pos + 4:pos + 8], 'little')
+        end = pos + 8 + size
+        if end > len(buf):
+            raise ValueError('Truncated WebP chunk')
+        if chunk_type in (b'VP8 ', b'VP8L', b'ALPH', b'ANMF'):
+            yield pos + 8, end
+        pos = end + (size & 1)
+
+def _pdf_streams(buf):
+    """PDF 中的流，生成 (数据起点, 数据终点, 流字典)"""
+    pos = 0
+    while True:
+        match = _PDF_STREAM.search(buf, pos)
+        if match is None:
+            break
+        # 流字典位于上一个 obj 关键字之后
+        dict_start = buf.rfind(b'obj', max(pos, match.start() - 65536), match.start())
+        stream_dict = buf[max(dict_start, pos):match.start()]
+        end = buf.find(b'endstream', match.end())
+        if end == -1:
+            raise ValueError('Unterminated PDF stream')
+        yield match.end(), end, stream_dict
+        pos = end + len(b'endstream')
+
+def _pdf_skips(buf):
+    """PDF 中编码过的流和图片流"""
+    for start, end, stream_dict in _pdf_streams(buf):
+        if b'/Filter' in stream_dict or b'/Image' in stream_dict:
+            yield start, end
+
+def _inflate_scan(data, limit):
+    """有界解压 zlib 数据并扫描，返回 (命中的特征名, 解压后的字节数)
+
+    每次最多解压一个扫描窗口，内存占用与压缩比无关；解压量超过 limit 时立即停止。
+    """
+    scanner = StreamScanner()
+    decompressor = zlib.decompressobj()
+    inflated = 0
+    while data and not decompressor.eof:
+        chunk = decompressor.decompress(data, SCAN_WINDOW)
+        data = decompressor.unconsumed_tail
+        inflated += len(chunk)
+        if inflated > limit:
+            return 'archive_size', inflated
+        scanner.feed(chunk)
+        if scanner.threat is not None:
+            break
+    return scanner.threat, inflated
+
+def _scan_pdf_streams(buf):
+    """解压扫描 PDF 中只用 /FlateDecode 编码的非图片流
+
+    所有流解压后的总大小超过上限时视为压缩炸弹；无法解压的流与其它编码流一样跳过。
+    """
+    remaining = settings.UPLOAD_SCAN['max_inflated_size']
+    streams = _pdf_streams(buf)
+    while True:
+        try:
+            start, end, stream_dict = next(streams)
+        except (StopIteration, ValueError):
+            # 结构异常的 PDF 已经扫描过全部原始内容
+            return None
+        if b'/Image' in stream_dict or not _PDF_FLATE.search(stream_dict):
+            continue
+
+        try:
+            threat, inflated = _inflate_scan(buf[start:end], remaining)
+        except zlib.error as e:
+            logger.info(f"Skipping undecodable PDF stream: {str(e)}")
+            continue
+        if threat is not None:
+            return threat
+        remaining -= inflated
+
+_SKIP_PARSERS = {
+    'png': _png_skips,
+    'jpeg': _jpeg_skips,
+    'gif': _gif_skips,
+    'webp': _webp_skips,
+    'pdf': _pdf_skips,
+}
+
+def _scan_range(buf, start, end):
+    """分块扫描 [start, end) 区间"""
+    for pos in range(start, end, SCAN_WINDOW):
+        threat = find_threat(buf[pos:min(pos + SCAN_WINDOW + MAX_MATCH_LENGTH, end)])
+        if threat is not None:
+            return threat
+    return None
+
+def scan_buffer(buf, kind=None):
+    """按格式扫描内存或映射的文件内容"""
+    skips = []
+    parser = _SKIP_PARSERS.get(kind)
+    if parser is not None:
+        try:
+            skips = list(parser(buf))
+        except (ValueError, IndexError, struct.error) as e:
+            # 结构异常的文件扫描全部内容
+            logger.info(f"Falling back to full scan of malformed {kind}: {str(e)}")
+            skips = []
+
+    pos = 0
+    for start, end in skips:
+        threat = _scan_range(buf, pos, start)
+        if threat is not None:
+            return threat
+        pos = max(pos, end)
+    threat = _scan_range(buf, pos, len(buf))
+    if threat is None and kind == 'pdf':
+        threat = _scan_pdf_streams(buf)
+    return threat
+
+def _scan_ooxml(file):
+    """扫描 OOXML 文档中的 XML 部件，不是 OOXML 时抛出 ValueError"""
+    max_inflated_size = settings.UPLOAD_SCAN['max_inflated_size']
+    with zipfile.ZipFile(file) as archive:
+        if '[Content_Types].xml' not in archive.namelist():
+            raise ValueError('Not an OOXML document')
+
+        inflated = 0
+        for info in archive.infolist():
+            if not info.filename.lower().endswith(OOXML_TEXT_PARTS):
+                continue
+            scanner = StreamScanner()
+            with archive.open(info) as part:
+                for chunk in iter(lambda: part.read(SCAN_WINDOW), b''):
+                    inflated += len(chunk)
+                    if inflated > max_inflated_size:
+                        return 'archive_size'
+                    scanner.feed(chunk)
+                    if scanner.threat is not None:
+                        return scanner.threat
+    return None
+
+@contextmanager
+def _map_file(file):
+    """磁盘上的文件只读映射，内存中的文件直接读取"""
+    try:
+        buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # 内存文件没有文件描述符，空文件无法映射
+        buf = None
+
+    if buf is None:
+        yield file.read()
+        return
+    try:
+        yield buf
+    finally:
+        buf.close()
+
+def scan_file(file):
+    """按格式扫描上传文件，返回命中的特征名，未命中返回 None"""
+    file.seek(0)
+    kind = detect_format(file.read(16))
+    try:
+        if kind == 'zip':
+            try:
+                file.seek(0)
+                return _scan_ooxml(file)
+            except (ValueError, zipfile.BadZipFile):
+                # 普通压缩包按原始字节扫描
+                pass
+
+        file.seek(0)
+        with _map_file(file) as buf:
+            return scan_buffer(buf, kind)
+    finally:
+        file.seek(0)
@@ -4,6 +4,7 @@ from django.http import JsonResponse
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
 from .cache import CacheManager
+from .ratelimit import rate_limiter
 from .logging import FileConverterLogger
 
 cache_manager = CacheManager()
@@ -79,8 +80,9 @@ def rate_limit(key_prefix, limit=100, period=3600):
             else:
                 identifier = f"{key_prefix}:ip:{request.META.get('REMOTE_ADDR')}"
             
-            # 检查速率限制
-            if not cache_manager.check_rate_limit(identifier):
+            # 检查并消耗名额
+            allowed = rate_limiter.hit(f'rate_limit:{identifier}', limit, period)[0]
+            if not allowed:
                 logger.log_security_event(
                     'rate_limit_exceeded',
                     {'identifier': identifier},
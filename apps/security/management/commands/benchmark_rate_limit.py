@@ -0,0 +1,63 @@
+"""速率限制基准测试"""
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from apps.security.ratelimit import RateLimitEngine
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+
+def _legacy_hit(key, limit, period):
+    """原实现：读取、比较、写入分多次往返"""
+    current = cache.get(key, 0)
+    if current >= limit:
+        return False
+    if current == 0:
+        cache.set(key, 1, timeout=period)
+    else:
+        cache.incr(key)
+    return True
+
+class Command(BaseCommand):
+    help = '比较原 get/set 限流与Lua脚本限流的单进程吞吐量和并发准确性（需要Redis缓存）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='吞吐量测试的请求数')
+        parser.add_argument('--keys', type=int, default=1000, help='请求分散到的键数量')
+        parser.add_argument('--threads', type=int, default=16, help='并发准确性测试的线程数')
+        parser.add_argument('--limit', type=int, default=100, help='并发准确性测试的名额')
+
+    def handle(self, *args, **options):
+        engine = RateLimitEngine()
+        if engine.redis is None:
+            self.stderr.write('Default cache is not Redis')
+            return
+
+        run = uuid.uuid4().hex[:8]
+        methods = {
+            'legacy': lambda key: _legacy_hit(key, 10 ** 9, 3600),
+            'lua': lambda key: engine.hit(key, 10 ** 9, 3600)[0],
+        }
+
+        self.stdout.write(f"{'method':>8} {'req/s':>10} {'speedup':>8}")
+        baseline = None
+        for name, hit in methods.items():
+            keys = [f'bench:{run}:{name}:{i}' for i in range(options['keys'])]
+            start = time.perf_counter()
+            for i in range(options['requests']):
+                hit(keys[i % len(keys)])
+            rate = options['requests'] / (time.perf_counter() - start)
+            baseline = baseline or rate
+            self.stdout.write(f"{name:>8} {rate:>10.0f} {rate / baseline:>7.2f}x")
+
+        # 并发下同一个键通过的请求数，正确结果等于名额
+        limit = options['limit']
+        attempts = limit * 4
+        self.stdout.write(f"{'method':>8} {'allowed':>10} {'limit':>8}")
+        for name, hit in (
+            ('legacy', lambda key: _legacy_hit(key, limit, 3600)),
+            ('lua', lambda key: engine.hit(key, limit, 3600)[0]),
+        ):
+            key = f'bench:{run}:race:{name}'
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                allowed = sum(executor.map(lambda _: hit(key), range(attempts)))
+            self.stdout.write(f"{name:>8} {allowed:>10} {limit:>8}")
@@ -0,0 +1,128 @@
+"""上传内容扫描基准测试"""
+from django.core.management.base import BaseCommand
+from django.core.files import File
+from apps.security.content_scan import scan_file
+import os
+import re
+import time
+import shutil
+import zipfile
+import tempfile
+
+# 原扫描方式：五个正则分别对全部内容匹配
+LEGACY_PATTERNS = [
+    rb'<script.*?>.*?</script>',
+    rb'eval\s*\(',
+    rb'document\.cookie',
+    rb'(?:exec|system|popen)\s*\(',
+    rb'(?:SELECT|INSERT|UPDATE|DELETE).*?FROM',
+]
+
+# 测试语料中各类文件占总大小的比例
+CORPUS_SHARES = {
+    'photo.jpg': 0.3,
+    'scan.png': 0.3,
+    'report.pdf': 0.2,
+    'slides.docx': 0.1,
+    'table.csv': 0.1,
+}
+
+def _legacy_scan(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    return any(re.search(pattern, content, re.I | re.S) for pattern in LEGACY_PATTERNS)
+
+def _combined_scan(path):
+    with open(path, 'rb') as f:
+        return scan_file(File(f))
+
+class Command(BaseCommand):
+    help = '比较原逐个正则扫描与合并、按格式扫描的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='测试语料总大小（MB）')
+        parser.add_argument('--dense-size', type=int, default=32,
+                            help='包含大量SQL关键字、没有结尾的文本大小（KB）')
+
+    def handle(self, *args, **options):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            paths = self._create_corpus(temp_dir, options['size'] * 1024 * 1024)
+            paths.append(self._create_dense_text(temp_dir, options['dense_size'] * 1024))
+
+            self.stdout.write(f"{'file':>12} {'MB':>8} {'legacy(ms)':>12} {'combined(ms)':>13} {'speedup':>8}")
+            totals = [0, 0]
+            for path in paths:
+                timings = []
+                for func in (_legacy_scan, _combined_scan):
+                    start = time.perf_counter()
+                    func(path)
+                    timings.append(time.perf_counter() - start)
+                totals = [total + timing for total, timing in zip(totals, timings)]
+                self._report(os.path.basename(path), os.path.getsize(path), *timings)
+
+            size = sum(os.path.getsize(path) for path in paths)
+            self._report('total', size, *totals)
+            self.stdout.write(
+                f"throughput: legacy {size / totals[0] / 1024 / 1024:.1f} MB/s, "
+                f"combined {size / totals[1] / 1024 / 1024:.1f} MB/s"
+            )
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _report(self, name, size, legacy, combined):
+        self.stdout.write(
+            f"{name:>12} {size / 1024 / 1024:>8.1f} {legacy * 1000:>12.1f} "
+            f"{combined * 1000:>13.1f} {legacy / combined:>7.1f}x"
+        )
+
+    def _create_corpus(self, temp_dir, total_size):
+        """按比例生成图片、PDF、OOXML和CSV文件"""
+        from PIL import Image
+
+        paths = []
+        for name, share in CORPUS_SHARES.items():
+            size = int(total_size * share)
+            path = os.path.join(temp_dir, name)
+
+            if name.endswith(('.jpg', '.png')):
+                # 噪点图片几乎不可压缩，按目标大小估算边长
+                side = int((size / (1.0 if name.endswith('.jpg') else 3.0)) ** 0.5)
+                noise = Image.effect_noise((side, side), 80)
+                img = Image.merge('RGB', (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise))
+                if name.endswith('.jpg'):
+                    img.save(path, quality=95)
+                else:
+                    img.save(path, compress_level=1)
+            elif name.endswith('.pdf'):
+                # 20 个DCT编码的图片流
+                with open(path, 'wb') as f:
+                    f.write(b'%PDF-1.7\n')
+                    for number in range(1, 21):
+                        data = os.urandom(size // 20)
+                        f.write(
+                            f"{number} 0 obj\n<< /Type /XObject /Subtype /Image /Filter /DCTDecode "
+                            f"/Length {len(data)} >>\nstream\n".encode()
+                        )
+                        f.write(data)
+                        f.write(b'\nendstream\nendobj\n')
+                    f.write(b'%%EOF\n')
+            elif name.endswith('.docx'):
+                with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr('[Content_Types].xml', '<Types/>')
+                    archive.writestr('word/document.xml', '<w:p><w:t>Hello</w:t></w:p>' * 20000)
+                    archive.writestr('word/media/image1.bin', os.urandom(size), zipfile.ZIP_STORED)
+            else:
+                row = b'2024-01-01,order,42,shipped to warehouse,19.99\n'
+                with open(path, 'wb') as f:
+                    f.write(row * (size // len(row)))
+            paths.append(path)
+        return paths
+
+    def _create_dense_text(self, temp_dir, size):
+        """大量SQL关键字但没有 FROM 的文本，原正则在此退化为平方复杂度"""
+        line = b'please update the record and select one option\n'
+        path = os.path.join(temp_dir, 'dense.txt')
+        with open(path, 'wb') as f:
+            f.write(line * (size // len(line)))
+        return path
@@ -0,0 +1,25 @@
+"""日志表分区维护"""
+from django.core.management.base import BaseCommand, CommandError
+from apps.security.partitions import LogPartitioner, partitioned_log_models
+
+class Command(BaseCommand):
+    help = '把审计日志和安全日志转换为按时间分区的表，并创建未来的分区（需要PostgreSQL）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='把现有普通表转换为分区表（转换期间锁表）')
+        parser.add_argument('--keep-days', type=int, default=None, help='转换时只迁移最近N天的记录')
+
+    def handle(self, *args, **options):
+        for model in partitioned_log_models():
+            partitioner = LogPartitioner(model)
+            if not partitioner.is_partitioned():
+                if not options['convert']:
+                    raise CommandError(f'{partitioner.table} is not partitioned, run with --convert')
+                try:
+                    partitioner.convert(keep_days=options['keep_days'])
+                except RuntimeError as e:
+                    raise CommandError(str(e))
+                self.stdout.write(f'{partitioner.table}: converted')
+
+            names = partitioner.ensure_partitions()
+            self.stdout.write(f'{partitioner.table}: partitions ready up to {names[-1]}')
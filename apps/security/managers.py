@@ -1,5 +1,5 @@
 """安全管理器"""
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.cache import cache
 from datetime import timedelta
@@ -46,7 +46,8 @@ class BlockedIPManager(models.Manager):
         # 更新缓存
         cache_key = f'blocked_ip:{ip_address}'
         cache.set(cache_key, True, timeout=300)
-        
+
+        # 各进程的封禁名单由 post_save 信号在提交后通知
         return blocked_ip
 
     def unblock_ip(self, ip_address):
@@ -103,6 +104,12 @@ class AuditLogManager(models.Manager):
         ).order_by('-created_at')
 
     def cleanup_old_logs(self, days=90):
-        """清理旧日志"""
+        """清理旧日志，分区表直接删除过期分区"""
+        from .partitions import LogPartitioner
+
         cutoff_date = timezone.now() - timedelta(days=days)
+        partitioner = LogPartitioner(self.model)
+        if partitioner.is_partitioned():
+            deleted = partitioner.drop_before(cutoff_date)
+            return deleted, {self.model._meta.label: deleted}
         return self.filter(created_at__lt=cutoff_date).delete() 
\ No newline at end of file
@@ -1,9 +1,10 @@
 """安全中间件"""
 from django.http import HttpResponseForbidden
-from django.core.cache import cache
 from django.conf import settings
 from django.utils import timezone
-from .models import BlockedIP, AuditLog
+from .audit import audit_sink
+from .blocklist import ip_blocklist
+from .ratelimit import rate_limiter
 import re
 
 class SecurityMiddleware:
@@ -15,6 +16,8 @@ class SecurityMiddleware:
             re.compile(pattern)
             for pattern in getattr(settings, 'SECURITY_URL_WHITELIST', [])
         ]
+        # 启动时加载封禁名单并订阅变更
+        ip_blocklist.start()
 
     def __call__(self, request):
         # 检查IP是否被封禁
@@ -44,7 +47,7 @@ class SecurityMiddleware:
         if self._is_whitelisted(request):
             return False
             
-        return BlockedIP.objects.is_blocked(ip)
+        return ip_blocklist.is_blocked(ip)
 
     def _check_rate_limit(self, request):
         """检查请求频率"""
@@ -71,28 +74,16 @@ class SecurityMiddleware:
         limit = rate_limits.get(limit_key, rate_limits['default'])
         count, period = self._parse_rate_limit(limit)
         
-        # 检查频率
-        cache_key = f'rate_limit:{limit_key}:{ip}'
-        current = cache.get(cache_key, 0)
-        
-        if current >= count:
-            return False
-            
-        # 更新计数
-        if current == 0:
-            cache.set(cache_key, 1, timeout=period)
-        else:
-            cache.incr(cache_key)
-            
-        return True
+        # 检查并消耗名额
+        return rate_limiter.hit(f'rate_limit:{limit_key}:{ip}', count, period)[0]
 
     def _log_request(self, request):
         """记录请求"""
         if not self._should_log_request(request):
             return
             
-        AuditLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
+        audit_sink.emit(
+            user_id=request.user.pk if request.user.is_authenticated else None,
             action_type='request',
             action_detail=f'Request to {request.path}',
             ip_address=self._get_client_ip(request),
@@ -106,8 +97,8 @@ class SecurityMiddleware:
 
     def _log_error_response(self, request, response):
         """记录错误响应"""
-        AuditLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
+        audit_sink.emit(
+            user_id=request.user.pk if request.user.is_authenticated else None,
             action_type='error',
             action_detail=f'Error {response.status_code} on {request.path}',
             severity='error' if response.status_code >= 500 else 'warning',
@@ -0,0 +1,124 @@
+"""MIME类型识别
+
+常见格式直接按文件头签名识别，不调用libmagic；其它格式从进程级句柄池借用 libmagic 句柄。
+每个 libmagic 句柄加载一次魔数数据库后重复使用，同一时刻只被一个线程使用。
+"""
+from django.conf import settings
+from contextlib import contextmanager
+import queue
+import logging
+import threading
+import magic
+
+logger = logging.getLogger(__name__)
+
+# 文件头签名：(签名, MIME类型)
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'%PDF-', 'application/pdf'),
+]
+
+# OOXML 文档按包内部件目录区分
+OOXML_TYPES = {
+    b'word/': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    b'xl/': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    b'ppt/': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+OOXML_MARKERS = (b'[Content_Types].xml', b'_rels/', b'docProps/')
+
+# BMP 信息头长度
+BMP_HEADER_SIZES = (12, 40, 52, 56, 108, 124)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class MagicPool:
+    """libmagic 句柄池，按需创建，最多 max_size 个"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._handles = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """借用一个句柄，池满时等待其它线程归还"""
+        try:
+            handle = self._handles.get_nowait()
+        except queue.Empty:
+            handle = self._create() or self._handles.get()
+        try:
+            yield handle
+        finally:
+            self._handles.put(handle)
+
+    def _create(self):
+        with self._lock:
+            if self._created >= self.max_size:
+                return None
+            self._created += 1
+        try:
+            return magic.Magic(mime=True)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+def get_magic_pool():
+    """获取进程级句柄池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MagicPool(settings.UPLOAD_SCAN['magic_pool_size'])
+    return _pool
+
+def _sniff_bmp(head):
+    if (head.startswith(b'BM') and len(head) >= 18
+            and head[6:10] == b'\x00\x00\x00\x00'
+            and int.from_bytes(head[14:18], 'little') in BMP_HEADER_SIZES):
+        return 'image/bmp'
+    return None
+
+def _sniff_ooxml(head):
+    """遍历文件头中的ZIP本地文件头，根据部件名识别OOXML文档"""
+    pos = 0
+    is_package = False
+    while head[pos:pos + 4] == b'PK\x03\x04' and pos + 30 <= len(head):
+        compressed_size = int.from_bytes(head[pos + 18:pos + 22], 'little')
+        name_length = int.from_bytes(head[pos + 26:pos + 28], 'little')
+        extra_length = int.from_bytes(head[pos + 28:pos + 30], 'little')
+        name = head[pos + 30:pos + 30 + name_length]
+
+        is_package = is_package or name.startswith(OOXML_MARKERS)
+        for prefix, mime_type in OOXML_TYPES.items():
+            if is_package and name.startswith(prefix):
+                return mime_type
+        if head[pos + 6] & 0x08:
+            # 大小记录在数据之后，无法跳到下一个文件头
+            break
+        pos += 30 + name_length + extra_length + compressed_size
+    return None
+
+def sniff_signature(head):
+    """按文件头签名识别常见格式，无法识别时返回 None"""
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head.startswith(b'PK\x03\x04'):
+        return _sniff_ooxml(head)
+    return _sniff_bmp(head)
+
+def detect_mime(head):
+    """识别文件头的MIME类型"""
+    mime_type = sniff_signature(head)
+    if mime_type is None:
+        with get_magic_pool().acquire() as handle:
+            mime_type = handle.from_buffer(head)
+    return mime_type
@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.utils import timezone
+from .managers import BlockedIPManager, AuditLogManager
 
 User = get_user_model()
 
@@ -155,6 +156,8 @@ class BlockedIP(models.Model):
         verbose_name=_('Failed Attempts Count')
     )
 
+    objects = BlockedIPManager()
+
     class Meta:
         verbose_name = _('Blocked IP')
         verbose_name_plural = _('Blocked IPs')
@@ -236,8 +239,10 @@ class AuditLog(models.Model):
     user_agent = models.TextField(
         verbose_name=_('User Agent')
     )
+    # 异步写入时保留事件发生的时间
     created_at = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
+        editable=False,
         verbose_name=_('Created At')
     )
     status = models.CharField(
@@ -261,16 +266,19 @@ class AuditLog(models.Model):
         verbose_name=_('Extra Data')
     )
 
+    objects = AuditLogManager()
+
     class Meta:
         verbose_name = _('Audit Log')
         verbose_name_plural = _('Audit Logs')
         ordering = ['-created_at']
+        # 与管理器查询对应：按用户/IP/级别过滤后按时间范围和倒序取记录
         indexes = [
-            models.Index(fields=['user', 'action_type']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['ip_address', 'created_at']),
+            models.Index(fields=['severity', 'created_at']),
             models.Index(fields=['created_at']),
-            models.Index(fields=['ip_address']),
-            models.Index(fields=['severity']),
-            models.Index(fields=['resource_type', 'resource_id']),
+            models.Index(fields=['resource_type', 'resource_id', 'created_at']),
         ]
 
     def __str__(self):
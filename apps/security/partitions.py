@@ -0,0 +1,255 @@
+"""日志表按时间分区
+
+AuditLog 和 SecurityLog 在PostgreSQL中按 created_at 做原生范围分区（默认每天一个分区）。
+过期数据按分区整块 DROP，不再逐行 DELETE，不产生死元组也不长时间锁表；
+维护任务（Celery beat 每天运行）提前创建未来的分区。维护任务停止时写入落在默认分区，
+不会因为没有对应分区而失败，之后创建分区时再把这些记录移入。
+数据库不是PostgreSQL或表尚未转换时，调用方退回按行删除。
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUFFIX_FORMATS = {
+    'day': '%Y%m%d',
+    'month': '%Y%m',
+}
+
+class LogPartitioner:
+    """单个日志表的分区维护"""
+
+    def __init__(self, model, interval=None, premake=None):
+        config = settings.LOG_PARTITIONS
+        self.model = model
+        self.table = model._meta.db_table
+        self.interval = interval or config['interval']
+        self.premake = config['premake'] if premake is None else premake
+        if self.interval not in SUFFIX_FORMATS:
+            raise ValueError(f"Unsupported partition interval: {self.interval}")
+        self._name_pattern = re.compile(rf'^{re.escape(self.table)}_p(\d+)$')
+
+    def is_partitioned(self):
+        """表是否已经是PostgreSQL分区表"""
+        if connection.vendor != 'postgresql':
+            return False
+        return bool(self._fetch(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [self.table]
+        ))
+
+    def period_start(self, moment):
+        """moment 所在分区的起始时间（本地时区）"""
+        moment = timezone.localtime(moment)
+        start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.interval == 'month':
+            start = start.replace(day=1)
+        return timezone.make_aware(start.replace(tzinfo=None))
+
+    def next_period(self, start):
+        """下一个分区的起始时间"""
+        start = timezone.localtime(start).replace(tzinfo=None)
+        if self.interval == 'day':
+            start += timedelta(days=1)
+        elif start.month == 12:
+            start = start.replace(year=start.year + 1, month=1)
+        else:
+            start = start.replace(month=start.month + 1)
+        return timezone.make_aware(start)
+
+    def partition_name(self, start):
+        return f"{self.table}_p{timezone.localtime(start).strftime(SUFFIX_FORMATS[self.interval])}"
+
+    @property
+    def default_partition(self):
+        """默认分区名，接收没有对应范围分区的记录"""
+        return f"{self.table}_pdefault"
+
+    def partitions(self):
+        """现有分区，返回按起始时间排序的 (分区名, 起始时间, 估算行数) 列表，不含默认分区"""
+        rows = self._fetch(
+            "SELECT child.relname, child.reltuples FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [self.table]
+        )
+        result = []
+        for name, rows_estimate in rows:
+            match = self._name_pattern.match(name)
+            if not match:
+                continue
+            try:
+                start = datetime.strptime(match.group(1), SUFFIX_FORMATS[self.interval])
+            except ValueError:
+                continue
+            # 从未分析过的表 reltuples 为 -1
+            result.append((name, timezone.make_aware(start), max(int(rows_estimate), 0)))
+        return sorted(result, key=lambda item: item[1])
+
+    def create_default_partition(self):
+        """创建默认分区，已存在时跳过"""
+        self._execute(
+            f"CREATE TABLE IF NOT EXISTS {self._quote(self.default_partition)} "
+            f"PARTITION OF {self._quote(self.table)} DEFAULT"
+        )
+
+    def create_partition(self, start):
+        """创建从 start 开始的分区，已存在时跳过
+
+        默认分区中已有该范围的记录时不能直接创建分区，
+        先建独立的表，把记录从默认分区移入后再挂载为分区。
+        """
+        name = self.partition_name(start)
+        if self._fetch("SELECT to_regclass(%s)", [name])[0][0] is not None:
+            return name
+
+        table = self._quote(self.table)
+        partition = self._quote(name)
+        created_at = self._quote(self.model._meta.get_field('created_at').column)
+        bounds = [start.isoformat(), self.next_period(start).isoformat()]
+        with transaction.atomic():
+            self._execute(
+                f"CREATE TABLE IF NOT EXISTS {partition} "
+                f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            if self._fetch("SELECT to_regclass(%s)", [self.default_partition])[0][0] is not None:
+                self._execute(
+                    f"WITH moved AS (DELETE FROM {self._quote(self.default_partition)} "
+                    f"WHERE {created_at} >= %s AND {created_at} < %s RETURNING *) "
+                    f"INSERT INTO {partition} SELECT * FROM moved",
+                    bounds
+                )
+            self._execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)", bounds)
+        return name
+
+    def ensure_partitions(self, now=None):
+        """创建默认分区以及当前及之后 premake 个分区，返回范围分区名列表"""
+        self.create_default_partition()
+        start = self.period_start(now or timezone.now())
+        names = []
+        for _ in range(self.premake + 1):
+            names.append(self.create_partition(start))
+            start = self.next_period(start)
+        return names
+
+    def drop_before(self, cutoff):
+        """删除结束时间不晚于 cutoff 的分区，返回删除的记录数
+
+        保留期按分区粒度生效：cutoff 所在的分区要等整个分区过期后才会删除。
+        整块删除的分区不再逐个计数，记录数按统计信息估算；
+        默认分区中的过期记录按行删除，正常情况下默认分区为空。
+        """
+        deleted = 0
+        for name, start, rows_estimate in self.partitions():
+            if self.next_period(start) > cutoff:
+                break
+            self._execute(f"DROP TABLE {self._quote(name)}")
+            deleted += rows_estimate
+            logger.info(f"Dropped log partition {name}")
+
+        if self._fetch("SELECT to_regclass(%s)", [self.default_partition])[0][0] is not None:
+            created_at = self._quote(self.model._meta.get_field('created_at').column)
+            deleted += self._execute(
+                f"DELETE FROM {self._quote(self.default_partition)} WHERE {created_at} < %s",
+                [cutoff.isoformat()]
+            )
+        return deleted
+
+    def convert(self, keep_days=None):
+        """把现有普通表转换为分区表（一次性操作，期间锁表）
+
+        keep_days 指定时只迁移最近 keep_days 天的记录。
+        """
+        if connection.vendor != 'postgresql':
+            raise RuntimeError('Log partitioning requires PostgreSQL')
+        if self.is_partitioned():
+            return False
+
+        table = self._quote(self.table)
+        legacy = self._quote(f"{self.table}_legacy")
+        pk_column = self.model._meta.pk.column
+        pk = self._quote(pk_column)
+        created_at = self._quote(self.model._meta.get_field('created_at').column)
+
+        with transaction.atomic():
+            self._execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            # 改名前取出的定义仍指向原表名，数据迁移、删除旧表后按原定义重建
+            indexes = self._fetch(
+                "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+                "WHERE i.indrelid = %s::regclass AND NOT i.indisprimary",
+                [self.table]
+            )
+            foreign_keys = self._fetch(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [self.table]
+            )
+            old_sequence = self._fetch("SELECT pg_get_serial_sequence(%s, %s)", [self.table, pk_column])[0][0]
+
+            self._execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+            self._execute(
+                f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY "
+                f"INCLUDING CONSTRAINTS) PARTITION BY RANGE ({created_at})"
+            )
+
+            since = None
+            if keep_days is not None:
+                since = timezone.now() - timedelta(days=keep_days)
+            oldest = self._fetch(f"SELECT min({created_at}) FROM {legacy}")[0][0]
+            start = self.period_start(max(filter(None, [oldest, since]), default=timezone.now()))
+            end = self.period_start(timezone.now())
+            while start < end:
+                self.create_partition(start)
+                start = self.next_period(start)
+            self.ensure_partitions()
+
+            if since is None:
+                self._execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+            else:
+                self._execute(f"INSERT INTO {table} SELECT * FROM {legacy} WHERE {created_at} >= %s", [since])
+
+            # 自增序列：IDENTITY 列复制出新序列，serial 列沿用旧序列
+            new_sequence = self._fetch("SELECT pg_get_serial_sequence(%s, %s)", [self.table, pk_column])[0][0]
+            if new_sequence:
+                self._execute(
+                    f"SELECT setval(%s, (SELECT coalesce(max({pk}), 0) + 1 FROM {legacy}), false)",
+                    [new_sequence]
+                )
+            elif old_sequence:
+                self._execute(f"ALTER SEQUENCE {old_sequence} OWNED BY {table}.{pk}")
+
+            self._execute(f"DROP TABLE {legacy}")
+            # 分区表的唯一约束必须包含分区键，主键改为 (id, created_at)
+            self._execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({pk}, {created_at})")
+            for (definition,) in indexes:
+                self._execute(definition)
+            for name, definition in foreign_keys:
+                self._execute(f"ALTER TABLE {table} ADD CONSTRAINT {self._quote(name)} {definition}")
+
+        logger.info(f"Converted {self.table} to a partitioned table")
+        return True
+
+    def _quote(self, name):
+        return connection.ops.quote_name(name)
+
+    def _execute(self, sql, params=None):
+        """执行语句，返回影响的行数"""
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def _fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+def partitioned_log_models():
+    """按时间分区的日志模型"""
+    from .models import AuditLog, SecurityLog
+    return [AuditLog, SecurityLog]
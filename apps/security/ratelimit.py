@@ -0,0 +1,110 @@
+"""速率限制
+
+所有限流入口共用一个引擎：每次检查是一次Redis Lua脚本调用，读取、判断和写入在服务端原子完成，
+并发请求不会同时通过同一个名额。限流算法为GCRA：每个键只保存一个“理论到达时间”，
+period 内最多允许 limit 次请求，名额随时间平滑恢复。多个键的检查用一个管道一次发送。
+
+缓存后端不是Redis时退化为基于 cache.add/cache.incr 的固定窗口计数。
+"""
+from django.core.cache import cache
+from django_redis import get_redis_connection
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1]: 键；ARGV: 每次请求的间隔(整数毫秒)、名额数、消耗名额数
+# 返回 {是否允许, 剩余名额, 重试等待毫秒}
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = interval * tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local new_tat = tat + interval * cost
+if new_tat - now > period then
+    return {0, 0, math.ceil(new_tat - period - now)}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((period - (new_tat - now)) / interval), 0}
+"""
+
+# KEYS[1]: 键；ARGV[1]: 窗口(毫秒)。返回窗口内的计数
+COUNT_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+class RateLimitEngine:
+    """速率限制引擎"""
+
+    def __init__(self):
+        self._redis = None
+        self._gcra = None
+        self._count = None
+
+    @property
+    def redis(self):
+        """Redis连接，首次使用时获取；缓存后端不是Redis时为 None"""
+        if self._redis is None:
+            try:
+                self._redis = get_redis_connection('default')
+            except NotImplementedError:
+                self._redis = False
+            else:
+                self._gcra = self._redis.register_script(GCRA_SCRIPT)
+                self._count = self._redis.register_script(COUNT_SCRIPT)
+        return self._redis or None
+
+    def hit(self, key, limit, period, cost=1):
+        """消耗名额，返回 (是否允许, 剩余名额, 重试等待秒数)"""
+        return self.hit_many([(key, limit, period, cost)])[0]
+
+    def hit_many(self, checks):
+        """一次往返检查多个键，checks 为 (键, 次数, 周期秒数[, 消耗名额数]) 列表"""
+        if self.redis is None:
+            return [self._hit_cache(*check) for check in checks]
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, limit, period, *cost in checks:
+            # 间隔取整数毫秒，脚本中全部为整数运算
+            interval = max(math.ceil(period * 1000 / limit), 1)
+            self._gcra(
+                keys=[cache.make_key(key)],
+                args=[interval, limit, cost[0] if cost else 1],
+                client=pipe
+            )
+        return [
+            (bool(allowed), max(int(remaining), 0), int(retry_after) / 1000)
+            for allowed, remaining, retry_after in pipe.execute()
+        ]
+
+    def count(self, key, window):
+        """原子地增加窗口计数并返回当前计数"""
+        if self.redis is None:
+            cache.add(key, 0, window)
+            return cache.incr(key)
+        return int(self._count(keys=[cache.make_key(key)], args=[int(window * 1000)]))
+
+    def _hit_cache(self, key, limit, period, cost=1):
+        """固定窗口计数"""
+        cache.add(key, 0, period)
+        try:
+            used = cache.incr(key, cost)
+        except ValueError:
+            # 窗口恰好过期
+            cache.set(key, cost, period)
+            used = cost
+        if used > limit:
+            return False, 0, float(period)
+        return True, limit - used, 0.0
+
+rate_limiter = RateLimitEngine()
@@ -1,9 +1,11 @@
 """安全相关信号处理"""
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
 from django.conf import settings
-from .models import SecurityLog, SecurityAlert
+from django.utils import timezone
+from .models import SecurityLog, SecurityAlert, BlockedIP
 
 @receiver(post_save, sender=SecurityLog)
 def handle_security_log(sender, instance, created, **kwargs):
@@ -42,4 +44,27 @@ def handle_security_alert(sender, instance, created, **kwargs):
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[admin[1] for admin in settings.ADMINS],
             fail_silently=True
-        ) 
\ No newline at end of file
+        ) 
+
+@receiver(post_save, sender=BlockedIP)
+def handle_blocked_ip_saved(sender, instance, **kwargs):
+    """封禁记录保存后通知各进程的封禁名单，管理后台和直接保存模型同样生效"""
+    from .blocklist import ip_blocklist
+
+    ip_address = instance.ip_address
+    if instance.is_permanent:
+        transaction.on_commit(lambda: ip_blocklist.publish_block(ip_address))
+    elif instance.expires_at and instance.expires_at > timezone.now():
+        expires_at = instance.expires_at
+        transaction.on_commit(lambda: ip_blocklist.publish_block(ip_address, expires_at))
+    else:
+        # 改为已过期的封禁等同于解封
+        transaction.on_commit(lambda: ip_blocklist.publish_unblock(ip_address))
+
+@receiver(post_delete, sender=BlockedIP)
+def handle_blocked_ip_deleted(sender, instance, **kwargs):
+    """封禁记录删除后通知各进程解封"""
+    from .blocklist import ip_blocklist
+
+    ip_address = instance.ip_address
+    transaction.on_commit(lambda: ip_blocklist.publish_unblock(ip_address))
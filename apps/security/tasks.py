@@ -33,4 +33,25 @@ def clear_expired_cache():
         cache_manager.clear_expired_cache()
         logger.logger.info('Scheduled cache cleanup completed')
     except Exception as e:
-        logger.log_error('scheduled_cache_cleanup_error', str(e)) 
\ No newline at end of file
+        logger.log_error('scheduled_cache_cleanup_error', str(e))
+
+
+@shared_task
+def maintain_log_partitions():
+    """定时创建未来的日志分区并删除过期分区"""
+    from .models import AuditLog
+    from .partitions import LogPartitioner, partitioned_log_models
+    from apps.core.handlers import ErrorHandler
+
+    try:
+        for model in partitioned_log_models():
+            partitioner = LogPartitioner(model)
+            if partitioner.is_partitioned():
+                partitioner.ensure_partitions()
+        audit_deleted = AuditLog.objects.cleanup_old_logs()[0]
+        error_deleted = ErrorHandler().cleanup_old_errors()
+        logger.logger.info(
+            f'Scheduled log retention: removed {audit_deleted} audit logs, {error_deleted} security logs'
+        )
+    except Exception as e:
+        logger.log_error('scheduled_log_partition_error', str(e))
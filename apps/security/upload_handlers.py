@@ -0,0 +1,66 @@
+"""上传处理器
+
+在Django接收上传数据的同时计算SHA-256、根据文件头识别MIME类型并扫描恶意代码特征，
+每个字节只在接收时处理一次，内存占用与文件大小无关。结果附加在上传文件对象上：
+
+- sha256: 文件内容的SHA-256
+- sniffed_mime: 根据文件头识别的MIME类型
+- scanned: 是否已在接收时扫描；按结构扫描的格式（图片、PDF、压缩包）留给 SecurityScanner
+- scan_threat: 命中的恶意代码特征，未命中为 None
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler
+)
+import hashlib
+import logging
+from .content_scan import StreamScanner, detect_format
+from .mime import detect_mime
+
+logger = logging.getLogger(__name__)
+
+class InspectionMixin:
+    """在处理器实际保存数据时同步检查数据"""
+
+    def new_file(self, *args, **kwargs):
+        # 先初始化状态，父类接管文件时会抛出 StopFutureHandlers
+        self.sniff_bytes = settings.UPLOAD_SCAN['sniff_bytes']
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        self.scanner = StreamScanner()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # 数据由本处理器保存
+            self.hasher.update(raw_data)
+            if len(self.head) < self.sniff_bytes:
+                self.head += raw_data[:self.sniff_bytes - len(self.head)]
+                if start == 0 and detect_format(self.head) is not None:
+                    # 需要按文件结构扫描，接收完成后再处理
+                    self.scanner = None
+            if self.scanner is not None:
+                self.scanner.feed(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is None:
+            return None
+
+        file.sha256 = self.hasher.hexdigest()
+        file.sniffed_mime = detect_mime(self.head)
+        file.scanned = self.scanner is not None
+        file.scan_threat = self.scanner.threat if file.scanned else None
+        file.inspected = True
+        if file.scan_threat is not None:
+            logger.warning(f"Upload {file.name} matched malicious pattern {file.scan_threat!r}")
+        return file
+
+class InspectingMemoryFileUploadHandler(InspectionMixin, MemoryFileUploadHandler):
+    """小文件保存在内存中"""
+
+class InspectingTemporaryFileUploadHandler(InspectionMixin, TemporaryFileUploadHandler):
+    """大文件写入临时文件"""
@@ -1,41 +1,54 @@
 """安全验证器"""
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from django.core.cache import cache
 from django.conf import settings
 import re
-import magic
+from . import content_scan
+from .mime import detect_mime
+from .ratelimit import rate_limiter
 
 class FileValidator:
-    """文件验证器"""
-    def __init__(self):
-        self.mime = magic.Magic(mime=True)
-        self.max_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE
-        self.allowed_types = settings.ALLOWED_FILE_TYPES
+    """文件验证器
 
-    def validate_file_type(self, file):
+    不保存状态，既可以实例化后调用，也可以直接通过类调用。
+    """
+    @classmethod
+    def validate_file(cls, file):
+        """验证文件大小和类型"""
+        cls.validate_file_size(file)
+        cls.validate_file_type(file)
+
+    @classmethod
+    def validate_file_type(cls, file):
         """验证文件类型"""
-        mime_type = self.mime.from_buffer(file.read(1024))
-        file.seek(0)  # 重置文件指针
-        
+        allowed_types = settings.ALLOWED_FILE_TYPES
         extension = file.name.split('.')[-1].lower()
-        if extension not in self.allowed_types:
+        if extension not in allowed_types:
             raise ValidationError(_('Unsupported file type'))
-            
-        if mime_type != self.allowed_types[extension]:
+
+        # 上传时已识别过的文件不再读取
+        mime_type = getattr(file, 'sniffed_mime', None)
+        if mime_type is None:
+            mime_type = detect_mime(file.read(settings.UPLOAD_SCAN['sniff_bytes']))
+            file.seek(0)  # 重置文件指针
+
+        if mime_type != allowed_types[extension]:
             raise ValidationError(_('File type does not match extension'))
 
-    def validate_file_size(self, file):
+    @classmethod
+    def validate_file_size(cls, file):
         """验证文件大小"""
-        if file.size > self.max_size:
+        max_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        if file.size > max_size:
             raise ValidationError(
                 _('File size %(size)s exceeds limit of %(limit)s') % {
-                    'size': self._format_size(file.size),
-                    'limit': self._format_size(self.max_size)
+                    'size': cls._format_size(file.size),
+                    'limit': cls._format_size(max_size)
                 }
             )
 
-    def _format_size(self, size):
+    @staticmethod
+    def _format_size(size):
         """格式化文件大小"""
         for unit in ['B', 'KB', 'MB', 'GB']:
             if size < 1024:
@@ -53,42 +66,22 @@ class RateLimiter:
     def is_allowed(self, identifier):
         """检查是否允许请求"""
         cache_key = f"{self.cache_key_prefix}_{identifier}"
-        
-        # 获取当前计数
-        count = cache.get(cache_key, 0)
-        
-        if count >= self.max_requests:
-            return False
-            
-        # 增加计数
-        if count == 0:
-            cache.set(cache_key, 1, self.time_window)
-        else:
-            cache.incr(cache_key)
-            
-        return True
+        return rate_limiter.hit(cache_key, self.max_requests, self.time_window)[0]
 
 class SecurityScanner:
     """安全扫描器"""
     @staticmethod
     def scan_file(file):
         """扫描文件内容"""
-        # 读取文件内容
-        content = file.read()
-        file.seek(0)
+        # 上传时已扫描过的文件直接使用扫描结果
+        if getattr(file, 'scanned', False):
+            threat = file.scan_threat
+        else:
+            threat = content_scan.scan_file(file)
         
         # 检查恶意代码特征
-        patterns = [
-            rb'<script.*?>.*?</script>',  # JavaScript代码
-            rb'eval\s*\(',  # eval函数
-            rb'document\.cookie',  # Cookie操作
-            rb'(?:exec|system|popen)\s*\(',  # 系统命令执行
-            rb'(?:SELECT|INSERT|UPDATE|DELETE).*?FROM',  # SQL注入
-        ]
-        
-        for pattern in patterns:
-            if re.search(pattern, content, re.I | re.S):
-                raise ValidationError(_('File contains malicious code'))
+        if threat is not None:
+            raise ValidationError(_('File contains malicious code'))
 
     @staticmethod
     def check_filename(filename):
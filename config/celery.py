@@ -13,6 +13,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # 自动发现任务
 app.autodiscover_tasks()
 
+# 注册转换工作进程预热信号
+import apps.converter.workers  # noqa: E402,F401
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -4,6 +4,7 @@ Django项目配置
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 
 # 构建路径
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -116,6 +117,32 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Shanghai'
+# 转换任务耗时差异大，每个工作进程一次只预取一个任务
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# 定时任务，需要运行 celery -A config beat
+CELERY_BEAT_SCHEDULE = {
+    'maintain-log-partitions': {
+        'task': 'apps.security.tasks.maintain_log_partitions',
+        'schedule': crontab(hour=0, minute=30),  # 每天创建未来的日志分区并删除过期分区
+    },
+}
+
+# 按格式族划分的转换工作进程池
+# 启动示例: celery -A config worker -Q convert_pdf -n pdf@%h
+CONVERTER_WORKER_FAMILIES = {
+    'image': {
+        'queue': 'convert_image',
+        'modules': ['PIL.Image', 'apps.converter.imaging', 'svglib.svglib', 'reportlab.graphics.renderPM'],
+    },
+    'pdf': {
+        'queue': 'convert_pdf',
+        'modules': ['fitz', 'pdf2docx', 'docx', 'reportlab.pdfgen.canvas'],
+    },
+    'office': {
+        'queue': 'convert_office',
+        'modules': ['docx', 'openpyxl', 'pptx'],
+    },
+}
 
 # Channels配置
 CHANNEL_LAYERS = {
@@ -185,6 +212,17 @@ FILE_UPLOAD_MAX_FILES = 20
 FILE_UPLOAD_MAX_TOTAL_SIZE = 100 * 1024 * 1024  # 100MB
 FILE_UPLOAD_MAX_REQUESTS_PER_HOUR = 100
 
+# 上传时边接收边计算哈希、识别类型并扫描
+FILE_UPLOAD_HANDLERS = [
+    'apps.security.upload_handlers.InspectingMemoryFileUploadHandler',
+    'apps.security.upload_handlers.InspectingTemporaryFileUploadHandler',
+]
+UPLOAD_SCAN = {
+    'sniff_bytes': 2048,  # 识别文件类型读取的头部字节数
+    'magic_pool_size': 8,  # 每个进程最多创建的libmagic句柄数
+    'max_inflated_size': 256 * 1024 * 1024  # OOXML 文档和PDF压缩流解压扫描的数据上限
+}
+
 # 支持的文件格式
 ALLOWED_FILE_TYPES = {
     'jpg': 'image/jpeg',
@@ -192,6 +230,7 @@ ALLOWED_FILE_TYPES = {
     'png': 'image/png',
     'gif': 'image/gif',
     'bmp': 'image/bmp',
+    'tiff': 'image/tiff',
     'svg': 'image/svg+xml',
     'pdf': 'application/pdf',
     'doc': 'application/msword',
@@ -265,6 +304,27 @@ SECURE_HSTS_SECONDS = 31536000  # 1年
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
 
+# 异步审计日志
+AUDIT_SINK = {
+    'buffer_size': 10000,  # 缓冲区最多保存的记录数
+    'batch_size': 500,  # 每批写入的记录数
+    'flush_interval': 1.0,  # 最长写入间隔（秒）
+    'block_timeout': 0.05  # 缓冲区满时请求线程最多等待的时间（秒）
+}
+
+# 日志表分区（PostgreSQL）
+LOG_PARTITIONS = {
+    'interval': 'day',  # 分区粒度：'day' 或 'month'
+    'premake': 7  # 提前创建的分区数
+}
+
+# 进程内IP封禁名单
+SECURITY_BLOCKLIST = {
+    'channel': 'security:blocklist',  # 封禁变更的发布/订阅频道
+    'refresh_interval': 300,  # 全量刷新间隔（秒）
+    'retry_interval': 10  # 订阅断开后的重连间隔（秒）
+}
+
 # REST Framework配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -329,6 +389,45 @@ CONVERSION_SETTINGS = {
         'max_total_size': 500 * 1024 * 1024,  # 500MB
         'timeout': 3600  # 1小时
     },
+    'pdf_render': {
+        'default_dpi': 144,  # 相当于原先的2倍缩放
+        'max_pixels': 40 * 1000 * 1000,  # 单页像素上限
+        'max_workers': None,  # 默认使用全部CPU核心
+        'parallel_min_pages': 8  # 少于该页数时单进程渲染
+    },
+    'image': {
+        'max_pixels': 500 * 1000 * 1000,  # 单张图片像素上限
+        'max_memory': 256 * 1024 * 1024  # 单个任务解码图片的内存上限，超出时按条带处理
+    },
+    'scheduler': {
+        # 启用后提交的任务进入共享队列，由 run_scheduler 进程派发；未启用时直接投递到Celery
+        'enabled': os.environ.get('CONVERTER_SCHEDULER_ENABLED') == '1'
+    },
+    'upload': {
+        'chunk_size': 8 * 1024 * 1024,  # 服务端建议的分片大小
+        'max_chunk_size': 64 * 1024 * 1024,  # 单个分片上限
+        'max_chunks': 10000,  # 分片数上限，超大文件相应增大分片
+        'parallel_chunks': 4,  # 建议客户端并发上传的分片数
+        'session_timeout': 24 * 60 * 60  # 会话在最后一次上传分片后保留24小时
+    },
+    'result_cache': {
+        'enabled': True,
+        'dir': None,  # 默认为 MEDIA_ROOT/result_cache，运行时解析
+        'max_size': 5 * 1024 * 1024 * 1024,  # 5GB，超出后按最近使用时间淘汰
+        'timeout': 30 * 24 * 3600  # 索引保留30天
+    },
+    'cost_model': {
+        'history_days': 30,  # 统计最近30天完成的任务
+        'min_samples': 5,  # 样本数不足时退回到更粗的统计
+        'size_buckets': [1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024, 200 * 1024 * 1024],
+        'refresh_interval': 600,  # 统计结果刷新间隔（秒）
+        'default_seconds': 30,  # 没有历史数据时的预计耗时
+        'cost_weight': 4,  # 排序时每秒预计耗时相当于晚到达的秒数（短任务优先）
+        'max_cost_delay': 1800,  # 饥饿保护：长任务因耗时最多被推后的秒数
+        'heavy_seconds': 120,  # 预计耗时超过该值的为重任务
+        'max_heavy_share': 0.6,  # 重任务最多占用的并发槽位比例
+        'max_poll_interval': 30  # 建议客户端查询状态的最长间隔（秒）
+    },
     'quality': {
         'default_dpi': 300,
         'default_quality': 95,
@@ -341,6 +440,18 @@ CONVERSION_SETTINGS = {
     }
 }
 
+# Web进程启动时间预算（manage.py check_startup_time）
+STARTUP_TIME_BUDGET = {
+    'max_import_ms': 1500,
+    'modules': ['config.wsgi', 'config.urls'],
+    # Web进程不做转换，启动时不应导入的重量级依赖
+    'forbidden_modules': [
+        'fitz', 'pdf2docx', 'svglib', 'reportlab',
+        'pdf2image', 'img2pdf', 'PyPDF2',
+        'docx', 'openpyxl', 'pptx',
+    ],
+}
+
 # 配额设置
 QUOTA_SETTINGS = {
     'cache_timeout': 3600,  # 1小时
@@ -26,6 +26,7 @@ urlpatterns = [
     path('api/upload/create-session', upload_views.create_upload_session, name='create_upload_session'),
     path('api/upload/chunk', upload_views.upload_chunk, name='upload_chunk'),
     path('api/upload/complete', upload_views.complete_upload, name='complete_upload'),
+    path('api/upload/status/<str:upload_id>', upload_views.upload_status, name='upload_status'),
     
     # 文件预览
     path('api/preview/generate/', preview_views.generate_preview, name='generate_preview'),
@@ -4,11 +4,12 @@
 class ChunkUploader {
     constructor(file, options = {}) {
         this.file = file;
+        // 分片大小和并发数以服务端创建会话时给出的为准
         this.chunkSize = options.chunkSize || 2 * 1024 * 1024; // 默认2MB一片
         this.threads = options.threads || 3; // 默认3个并发上传线程
         this.retryTimes = options.retryTimes || 3; // 默认重试3次
         
-        this.chunks = this.createChunks();
+        this.chunks = [];
         this.uploadedChunks = new Set();
         this.failedChunks = new Map(); // 记录失败的分片及重试次数
         this.uploading = false;
@@ -20,6 +21,13 @@ class ChunkUploader {
         this.onError = options.onError || (() => {});
     }
 
+    /**
+     * 本地保存会话ID的键，同一文件再次上传时续传
+     */
+    get storageKey() {
+        return `chunk-upload:${this.file.name}:${this.file.size}:${this.file.lastModified}`;
+    }
+
     /**
      * 创建文件分片
      */
@@ -54,36 +62,39 @@ class ChunkUploader {
         try {
             // 获取或创建上传会话
             const session = await this.createUploadSession();
+            this.chunkSize = session.chunkSize || this.chunkSize;
+            this.threads = session.parallelism || this.threads;
+            this.chunks = this.createChunks();
+            this.uploadedChunks = new Set();
+            localStorage.setItem(this.storageKey, session.uploadId);
             
             // 恢复已上传的分片信息
-            if (session.uploadedChunks) {
-                session.uploadedChunks.forEach(index => {
-                    this.uploadedChunks.add(index);
-                    this.chunks[index].uploaded = true;
-                });
-            }
+            this.markUploaded(session.uploadedChunks || []);
 
-            // 开始并发上传
-            while (!this.paused && this.hasRemainingChunks()) {
-                const tasks = [];
-                let running = 0;
-
-                for (const chunk of this.chunks) {
-                    if (running >= this.threads) break;
-                    if (!chunk.uploaded && !this.failedChunks.has(chunk.index)) {
-                        tasks.push(this.uploadChunk(chunk, session.uploadId));
-                        running++;
-                    }
-                }
+            // 多个上传线程从队列中取分片，分片可以乱序到达
+            let rounds = 0;
+            while (!this.paused && this.hasRemainingChunks() && rounds < this.retryTimes) {
+                const queue = this.chunks.filter(chunk => !chunk.uploaded);
+                const workers = Array.from(
+                    { length: Math.min(this.threads, queue.length) },
+                    () => this.runWorker(queue, session.uploadId)
+                );
+                await Promise.all(workers);
 
-                if (tasks.length === 0) break;
-                await Promise.all(tasks);
+                // 以服务端收到的分片为准，补传缺失的分片
+                if (!this.paused) {
+                    await this.syncStatus(session.uploadId);
+                }
+                rounds++;
             }
 
-            if (!this.paused && this.uploadedChunks.size === this.chunks.length) {
-                // 所有分片上传完成，合并文件
-                await this.completeUpload(session.uploadId);
-                this.onComplete();
+            if (!this.paused && !this.hasRemainingChunks()) {
+                // 所有分片上传完成
+                const result = await this.completeUpload(session.uploadId);
+                localStorage.removeItem(this.storageKey);
+                this.onComplete(result);
+            } else if (!this.paused) {
+                throw new Error('部分分片上传失败');
             }
 
         } catch (error) {
@@ -94,7 +105,17 @@ class ChunkUploader {
     }
 
     /**
-     * 创建上传会话
+     * 上传线程：依次取出队列中的分片上传
+     */
+    async runWorker(queue, uploadId) {
+        while (!this.paused && queue.length > 0) {
+            const chunk = queue.shift();
+            await this.uploadChunk(chunk, uploadId);
+        }
+    }
+
+    /**
+     * 创建上传会话，本地保存过会话ID时请求续传
      */
     async createUploadSession() {
         const response = await fetch('/api/upload/create-session', {
@@ -103,9 +124,9 @@ class ChunkUploader {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
+                uploadId: localStorage.getItem(this.storageKey),
                 filename: this.file.name,
-                size: this.file.size,
-                totalChunks: this.chunks.length
+                size: this.file.size
             })
         });
 
@@ -117,40 +138,78 @@ class ChunkUploader {
     }
 
     /**
-     * 上传单个分片
+     * 查询服务端已收到的分片
      */
-    async uploadChunk(chunk, uploadId) {
-        const retryCount = this.failedChunks.get(chunk.index) || 0;
-        
-        try {
-            const formData = new FormData();
-            formData.append('chunk', this.file.slice(chunk.start, chunk.end));
-            formData.append('chunkIndex', chunk.index);
-            formData.append('uploadId', uploadId);
-
-            const response = await fetch('/api/upload/chunk', {
-                method: 'POST',
-                body: formData
-            });
+    async syncStatus(uploadId) {
+        const response = await fetch(`/api/upload/status/${uploadId}`);
+        if (!response.ok) {
+            throw new Error('查询上传状态失败');
+        }
 
-            if (!response.ok) {
-                throw new Error('分片上传失败');
+        const status = await response.json();
+        const missing = atob(status.missingBitmap);
+        const uploaded = [];
+        this.chunks.forEach(chunk => {
+            const byte = missing.charCodeAt(chunk.index >> 3);
+            if (!(byte & (0x80 >> (chunk.index & 7)))) {
+                uploaded.push(chunk.index);
             }
+        });
 
-            // 标记分片上传成功
-            chunk.uploaded = true;
-            this.uploadedChunks.add(chunk.index);
-            this.failedChunks.delete(chunk.index);
+        this.uploadedChunks = new Set();
+        this.chunks.forEach(chunk => { chunk.uploaded = false; });
+        this.markUploaded(uploaded);
+    }
 
-            // 更新进度
-            this.updateProgress();
+    /**
+     * 标记已上传的分片
+     */
+    markUploaded(indexes) {
+        indexes.forEach(index => {
+            if (this.chunks[index]) {
+                this.uploadedChunks.add(index);
+                this.chunks[index].uploaded = true;
+            }
+        });
+        this.updateProgress();
+    }
 
-        } catch (error) {
-            if (retryCount < this.retryTimes) {
-                // 记录失败次数，稍后重试
-                this.failedChunks.set(chunk.index, retryCount + 1);
-            } else {
-                throw new Error(`分片${chunk.index}上传失败，已超过最大重试次数`);
+    /**
+     * 上传单个分片，失败时指数退避重试
+     */
+    async uploadChunk(chunk, uploadId) {
+        for (let attempt = 0; attempt <= this.retryTimes; attempt++) {
+            try {
+                const formData = new FormData();
+                formData.append('chunk', this.file.slice(chunk.start, chunk.end));
+                formData.append('chunkIndex', chunk.index);
+                formData.append('uploadId', uploadId);
+
+                const response = await fetch('/api/upload/chunk', {
+                    method: 'POST',
+                    body: formData
+                });
+
+                if (!response.ok) {
+                    throw new Error('分片上传失败');
+                }
+
+                // 标记分片上传成功
+                chunk.uploaded = true;
+                this.uploadedChunks.add(chunk.index);
+                this.failedChunks.delete(chunk.index);
+
+                // 更新进度
+                this.updateProgress();
+                return;
+
+            } catch (error) {
+                this.failedChunks.set(chunk.index, attempt + 1);
+                if (this.paused || attempt === this.retryTimes) {
+                    // 留给上传状态同步后补传
+                    return;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
             }
         }
     }
@@ -0,0 +1,85 @@
+"""异步审计日志测试"""
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.utils import timezone
+from unittest.mock import patch
+from apps.security.audit import AuditSink
+from apps.security.models import AuditLog
+from datetime import timedelta
+
+def sink_settings(**values):
+    return override_settings(AUDIT_SINK=dict(settings.AUDIT_SINK, **values))
+
+class AuditSinkTest(TestCase):
+    def emit(self, sink, index=0, **fields):
+        return sink.emit(
+            action_type='request',
+            action_detail=f'Request {index}',
+            ip_address='127.0.0.1',
+            user_agent='test',
+            **fields
+        )
+
+    def test_batched_flush(self):
+        """测试按批写入并保留事件时间"""
+        with sink_settings(batch_size=2):
+            sink = AuditSink(autostart=False)
+        created_at = timezone.now() - timedelta(minutes=5)
+        for index in range(5):
+            self.emit(sink, index, created_at=created_at)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(sink.flush(), 5)
+        self.assertEqual(AuditLog.objects.filter(created_at=created_at).count(), 5)
+        self.assertEqual(sink.stats(), {'queued': 0, 'written': 5, 'dropped': 0})
+
+    def test_drop_when_full(self):
+        """测试缓冲区满且等待超时后丢弃并计数"""
+        with sink_settings(buffer_size=2, block_timeout=0.01):
+            sink = AuditSink(autostart=False)
+        self.assertEqual([self.emit(sink, index) for index in range(3)], [True, True, False])
+        self.assertEqual(sink.dropped, 1)
+
+        sink.flush()
+        self.assertTrue(self.emit(sink))
+
+    def test_failed_write_requeued(self):
+        """测试写入失败时记录放回缓冲区，关闭时写入"""
+        sink = AuditSink(autostart=False)
+        self.emit(sink, 1)
+        self.emit(sink, 2)
+
+        with patch.object(AuditLog.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                sink.flush()
+        self.assertEqual(sink.stats()['queued'], 2)
+
+        sink.close()
+        self.assertEqual(
+            list(AuditLog.objects.order_by('action_detail').values_list('action_detail', flat=True)),
+            ['Request 1', 'Request 2']
+        )
+
+    def test_emit_after_close(self):
+        """测试关闭后的记录同步写入，写入失败时计入丢弃"""
+        sink = AuditSink(autostart=False)
+        self.emit(sink, 1)
+        sink.close()
+
+        self.assertTrue(self.emit(sink, 2))
+        self.assertEqual(sink.stats(), {'queued': 0, 'written': 2, 'dropped': 0})
+        self.assertEqual(AuditLog.objects.count(), 2)
+
+        with patch.object(AuditLog.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            self.assertFalse(self.emit(sink, 3))
+        self.assertEqual(sink.stats(), {'queued': 0, 'written': 2, 'dropped': 1})
+
+    def test_close_failure_counted(self):
+        """测试关闭时写入失败的剩余记录计入丢弃，不留在缓冲区"""
+        sink = AuditSink(autostart=False)
+        self.emit(sink, 1)
+        self.emit(sink, 2)
+
+        with patch.object(AuditLog.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            sink.close()
+        self.assertEqual(sink.stats(), {'queued': 0, 'written': 0, 'dropped': 2})
@@ -0,0 +1,306 @@
+"""分片上传测试"""
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+from apps.converter.upload import UploadSessionManager, decode_bitmap, missing_bitmap
+from apps.converter import upload_views
+import os
+import json
+import base64
+import shutil
+import hashlib
+import tempfile
+
+def _bytes(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+class FakeRedis:
+    """测试用的内存Redis，只实现上传会话用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        for name, item in items.items():
+            fields[_bytes(name)] = _bytes(item)
+        return len(items)
+
+    def hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if _bytes(field) in fields:
+            return 0
+        fields[_bytes(field)] = _bytes(value)
+        return 1
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(_bytes(field))
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def setbit(self, key, offset, value):
+        bitmap = self.data.setdefault(key, bytearray())
+        if len(bitmap) <= offset >> 3:
+            bitmap.extend(bytes((offset >> 3) + 1 - len(bitmap)))
+        mask = 0x80 >> (offset & 7)
+        previous = int(bool(bitmap[offset >> 3] & mask))
+        bitmap[offset >> 3] = bitmap[offset >> 3] | mask if value else bitmap[offset >> 3] & ~mask
+        return previous
+
+    def get(self, key):
+        value = self.data.get(key)
+        return bytes(value) if value is not None else None
+
+    def bitcount(self, key):
+        return sum(bin(byte).count('1') for byte in self.data.get(key, b''))
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        results = [func(*args, **kwargs) for func, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+class ChunkUploadTestBase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        cache.clear()
+
+        media = override_settings(MEDIA_ROOT=self.temp_dir)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.redis = FakeRedis()
+        redis_patch = patch('apps.converter.upload.get_redis_connection', return_value=self.redis)
+        redis_patch.start()
+        self.addCleanup(redis_patch.stop)
+
+        self.manager = UploadSessionManager()
+        self.chunks = [os.urandom(1000), os.urandom(1000), os.urandom(10)]
+
+    def upload(self, order, chunk_size=None):
+        """按指定顺序上传分片"""
+        session = self.manager.create_session('data.bin', 2010, len(self.chunks), chunk_size)
+        for index in order:
+            self.manager.save_chunk(
+                session['id'], index, SimpleUploadedFile('blob', self.chunks[index])
+            )
+        return session
+
+class ChunkUploadTest(ChunkUploadTestBase):
+    def test_merge_chunks(self):
+        """测试合并分片，文件哈希为整个文件的SHA-256"""
+        session = self.upload([2, 0, 1])
+        result = self.manager.merge_chunks(session['id'])
+
+        with open(os.path.join(self.temp_dir, result['file_path']), 'rb') as f:
+            self.assertEqual(f.read(), b''.join(self.chunks))
+
+        self.assertEqual(result['file_hash'], hashlib.sha256(b''.join(self.chunks)).hexdigest())
+        expected = hashlib.sha256(b''.join(
+            hashlib.sha256(chunk).digest() for chunk in self.chunks
+        )).hexdigest()
+        self.assertEqual(result['chunk_tree_hash'], expected)
+        self.assertFalse(os.path.exists(session['upload_path']))
+        self.assertIsNone(self.manager.get_session(session['id']))
+
+    def test_merge_unique_filename(self):
+        """测试合并后的文件名经过清理且不覆盖已有文件"""
+        first = self.manager.merge_chunks(self.upload([0, 1, 2])['id'])
+        second = self.manager.merge_chunks(self.upload([0, 1, 2])['id'])
+        self.assertNotEqual(first['file_path'], second['file_path'])
+
+        session = self.manager.create_session('../../evil name.bin', 2010, 3)
+        for index, chunk in enumerate(self.chunks):
+            self.manager.save_chunk(session['id'], index, SimpleUploadedFile('blob', chunk))
+        result = self.manager.merge_chunks(session['id'])
+        self.assertEqual(os.path.dirname(result['file_path']), os.path.dirname(first['file_path']))
+        self.assertTrue(os.path.basename(result['file_path']).startswith('evil_name'))
+        for path in (first, second, result):
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir, path['file_path'])))
+
+    def test_merge_incomplete(self):
+        """测试分片未传完时不能合并"""
+        session = self.upload([0, 1])
+        with self.assertRaises(ValueError):
+            self.manager.merge_chunks(session['id'])
+
+    def test_preallocated_file(self):
+        """测试收到第一个分片后才按文件大小预分配"""
+        session = self.upload([], chunk_size=1000)
+        self.assertEqual(os.path.getsize(session['upload_path']), 0)
+
+        self.manager.save_chunk(session['id'], 2, SimpleUploadedFile('blob', self.chunks[2]))
+        self.assertEqual(os.path.getsize(session['upload_path']), 2010)
+
+        self.manager.cleanup_session(session['id'])
+        self.assertFalse(os.path.exists(session['upload_path']))
+
+    def test_invalid_chunk(self):
+        """测试分片大小与位置校验"""
+        session = self.upload([0])
+        with self.assertRaises(ValueError):
+            self.manager.save_chunk(session['id'], 1, SimpleUploadedFile('blob', b'x' * 999))
+        with self.assertRaises(ValueError):
+            self.manager.save_chunk(session['id'], 3, SimpleUploadedFile('blob', b'x'))
+        with self.assertRaises(ValueError):
+            self.manager.save_chunk(session['id'], 2, SimpleUploadedFile('blob', b'x' * 2011))
+
+    def test_chunk_length_must_match(self):
+        """测试每个分片的长度必须与其序号对应的长度一致"""
+        session = self.upload([], chunk_size=1000)
+        for index, data in [(0, b'x' * 10), (1, b'x' * 1001), (2, b'x' * 9), (2, b'x' * 1000)]:
+            with self.assertRaises(ValueError):
+                self.manager.save_chunk(session['id'], index, SimpleUploadedFile('blob', data))
+        self.assertEqual(self.manager.get_session(session['id'])['uploaded_chunks'], set())
+
+    def test_last_chunk_determines_chunk_size(self):
+        """测试未指定分片大小时末尾分片先到达也能确定分片大小"""
+        session = self.upload([2])
+        self.assertEqual(self.manager.get_session(session['id'])['chunk_size'], 1000)
+        with self.assertRaises(ValueError):
+            self.manager.save_chunk(session['id'], 0, SimpleUploadedFile('blob', b'x' * 999))
+
+        other = self.manager.create_session('data.bin', 2010, 3)
+        with self.assertRaises(ValueError):
+            # 2010 - 11 不能均分为两个分片
+            self.manager.save_chunk(other['id'], 2, SimpleUploadedFile('blob', b'x' * 11))
+
+    def test_create_session_validation(self):
+        """测试创建会话前校验文件大小和分片方案，不占用磁盘"""
+        max_size = settings.CONVERSION_SETTINGS['max_file_size']
+        max_chunk_size = self.manager.upload_settings['max_chunk_size']
+        for file_size, total_chunks, chunk_size in [
+            (0, None, None),
+            (-1, None, None),
+            ('abc', None, None),
+            (max_size + 1, None, None),
+            (2010, 0, None),
+            (2010, -3, None),
+            (2010, 2011, None),
+            (2010, None, -1),
+            (2010, None, max_chunk_size + 1),
+            (2010, 2, 1000),
+        ]:
+            with self.assertRaises(ValueError):
+                self.manager.create_session('data.bin', file_size, total_chunks, chunk_size)
+        self.assertEqual(os.listdir(self.manager.chunk_path), [])
+
+        session = self.manager.create_session('data.bin', 2010, None, 1000)
+        self.assertEqual((session['chunk_size'], session['total_chunks']), (1000, 3))
+
+    def test_session_state(self):
+        """测试分片状态保存在位图中"""
+        session = self.upload([2, 0])
+        state = self.manager.get_session(session['id'])
+
+        self.assertEqual(state['uploaded_chunks'], {0, 2})
+        self.assertEqual(state['chunk_size'], 1000)
+        self.assertEqual(state['file_size'], 2010)
+        self.assertEqual(
+            self.manager.save_chunk(session['id'], 1, SimpleUploadedFile('blob', self.chunks[1])),
+            3
+        )
+        # 重复上传同一分片不重复计数
+        self.assertEqual(
+            self.manager.save_chunk(session['id'], 1, SimpleUploadedFile('blob', self.chunks[1])),
+            3
+        )
+
+    def test_decode_bitmap(self):
+        """测试位图解码"""
+        self.assertEqual(decode_bitmap(None, 8), set())
+        self.assertEqual(decode_bitmap(bytes([0b10100000, 0b00000001]), 16), {0, 2, 15})
+        self.assertEqual(decode_bitmap(bytes([0b10100000, 0b00000001]), 10), {0, 2})
+
+    def test_missing_bitmap(self):
+        """测试缺失分片位图"""
+        self.assertEqual(missing_bitmap(None, 3), bytes([0b11100000]))
+        self.assertEqual(missing_bitmap(bytes([0b10100000]), 10), bytes([0b01011111, 0b11000000]))
+        self.assertEqual(missing_bitmap(bytes([0xFF]), 8), bytes([0]))
+
+    def test_chunk_plan(self):
+        """测试服务端分片方案"""
+        chunk_size = settings.CONVERSION_SETTINGS['upload']['chunk_size']
+        self.assertEqual(self.manager.get_chunk_plan(chunk_size * 3 + 1), (chunk_size, 4))
+
+        with patch.dict(self.manager.upload_settings, {'max_chunks': 4}):
+            self.assertEqual(self.manager.get_chunk_plan(chunk_size * 5), (chunk_size * 2, 3))
+
+class UploadProtocolTest(ChunkUploadTestBase):
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        manager_patch = patch.object(upload_views, 'upload_manager', self.manager)
+        manager_patch.start()
+        self.addCleanup(manager_patch.stop)
+
+    def create_session(self, **data):
+        request = self.factory.post(
+            '/api/upload/create-session',
+            json.dumps(dict({'filename': 'data.bin', 'size': 2010}, **data)),
+            content_type='application/json'
+        )
+        return json.loads(upload_views.create_upload_session(request).content)
+
+    def test_server_advertised_plan(self):
+        """测试服务端给出分片大小和并发数"""
+        session = self.create_session()
+        upload_settings = settings.CONVERSION_SETTINGS['upload']
+
+        self.assertEqual(session['chunkSize'], upload_settings['chunk_size'])
+        self.assertEqual(session['totalChunks'], 1)
+        self.assertEqual(session['parallelism'], upload_settings['parallel_chunks'])
+        self.assertEqual(session['uploadedChunks'], [])
+
+    def test_resume_session(self):
+        """测试续传返回已收到的分片和缺失分片位图"""
+        uploaded = self.upload([2, 0], chunk_size=1000)
+
+        session = self.create_session(uploadId=uploaded['id'])
+        self.assertEqual(session['uploadId'], uploaded['id'])
+        self.assertEqual(session['uploadedChunks'], [0, 2])
+
+        for method in ('get', 'head'):
+            request = getattr(self.factory, method)(f"/api/upload/status/{uploaded['id']}")
+            response = upload_views.upload_status(request, uploaded['id'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Upload-Chunks-Received'], '2')
+            self.assertEqual(
+                base64.b64decode(response['Upload-Missing-Bitmap']),
+                bytes([0b01000000])
+            )
+
+        # 文件不一致时创建新会话
+        other = self.create_session(uploadId=uploaded['id'], size=2011)
+        self.assertNotEqual(other['uploadId'], uploaded['id'])
+
+    def test_status_unknown_session(self):
+        """测试查询不存在的会话"""
+        request = self.factory.get('/api/upload/status/missing')
+        self.assertEqual(upload_views.upload_status(request, 'missing').status_code, 404)
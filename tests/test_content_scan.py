@@ -0,0 +1,112 @@
+"""上传内容扫描测试"""
+from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from apps.security.content_scan import find_threat, scan_file
+from PIL import Image
+import io
+import zlib
+import struct
+import zipfile
+
+def png_chunk(chunk_type, data):
+    """构造PNG数据块"""
+    crc = zlib.crc32(chunk_type + data)
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+class FindThreatTest(TestCase):
+    def test_rules(self):
+        """测试各类特征"""
+        cases = {
+            b'<SCRIPT src="x">alert(1)</script>': 'script',
+            b'var a = eval (code)': 'eval',
+            b'x = Document.Cookie': 'cookie',
+            b'os.system("ls")': 'command',
+            b'UNION SELECT password FROM users': 'sql',
+        }
+        for data, name in cases.items():
+            self.assertEqual(find_threat(data), name)
+
+    def test_bounded_match(self):
+        """测试特征首尾距离超出上限时不匹配"""
+        self.assertIsNone(find_threat(b'select ' + b'x' * 300 + b' from t'))
+        self.assertIsNone(find_threat(b'<script>' + b'x' * 5000 + b'</script>'))
+        # 大量锚点但没有结尾的文本
+        self.assertIsNone(find_threat(b'please update the record and select one ' * 20000))
+
+class FormatAwareScanTest(TestCase):
+    def scan(self, name, content):
+        return scan_file(SimpleUploadedFile(name, content))
+
+    def test_png_skips_pixel_data(self):
+        """测试PNG跳过像素数据，扫描文本块和结尾数据"""
+        header = b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0))
+        idat = png_chunk(b'IDAT', b'eval(1)')
+        iend = png_chunk(b'IEND', b'')
+
+        self.assertIsNone(self.scan('a.png', header + idat + iend))
+        self.assertEqual(
+            self.scan('a.png', header + png_chunk(b'tEXt', b'Comment\x00eval(1)') + idat + iend), 'eval'
+        )
+        self.assertEqual(self.scan('a.png', header + idat + iend + b'<?php system($c); ?>'), 'command')
+
+    def test_jpeg_skips_scan_data(self):
+        """测试JPEG跳过熵编码数据，扫描注释段"""
+        output = io.BytesIO()
+        Image.new('RGB', (16, 16), (200, 10, 10)).save(output, 'JPEG')
+        data = output.getvalue()
+        sos = data.index(b'\xff\xda')
+        scan_start = sos + 2 + int.from_bytes(data[sos + 2:sos + 4], 'big')
+
+        self.assertIsNone(self.scan('a.jpg', data[:scan_start] + b'eval(1)' + data[scan_start:]))
+        comment = b'document.cookie'
+        segment = b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+        self.assertEqual(self.scan('a.jpg', data[:2] + segment + data[2:]), 'cookie')
+
+    def test_pdf_text_streams(self):
+        """测试PDF只扫描未编码的流"""
+        encoded = b'1 0 obj\n<< /Length 7 /Filter /FlateDecode >>\nstream\neval(1)\nendstream\nendobj\n'
+        plain = b'2 0 obj\n<< /Length 7 >>\nstream\neval(1)\nendstream\nendobj\n'
+        action = b'3 0 obj\n<< /S /JavaScript /JS (eval(1)) >>\nendobj\n'
+
+        self.assertIsNone(self.scan('a.pdf', b'%PDF-1.4\n' + encoded + b'%%EOF'))
+        self.assertEqual(self.scan('a.pdf', b'%PDF-1.4\n' + encoded + plain + b'%%EOF'), 'eval')
+        self.assertEqual(self.scan('a.pdf', b'%PDF-1.4\n' + encoded + action + b'%%EOF'), 'eval')
+
+    def test_pdf_flate_streams(self):
+        """测试PDF的 /FlateDecode 流解压后扫描，解压量有上限"""
+        def pdf(data, filters=b'/FlateDecode'):
+            stream = b'1 0 obj\n<< /Length %d /Filter %s >>\nstream\n' % (len(data), filters)
+            return b'%PDF-1.4\n' + stream + data + b'\nendstream\nendobj\n%%EOF'
+
+        self.assertEqual(self.scan('a.pdf', pdf(zlib.compress(b'BT (x) Tj ET eval(1)'))), 'eval')
+        self.assertEqual(
+            self.scan('a.pdf', pdf(zlib.compress(b'<script>alert(1)</script>'), b'[ /FlateDecode ]')),
+            'script'
+        )
+        self.assertIsNone(self.scan('a.pdf', pdf(zlib.compress(b'BT (hello) Tj ET'))))
+        # 其它编码的流和图片流仍然跳过
+        self.assertIsNone(self.scan('a.pdf', pdf(zlib.compress(b'eval(1)'), b'/DCTDecode')))
+
+        bomb = pdf(zlib.compress(b'\x00' * (4 * 1024 * 1024)))
+        self.assertIsNone(self.scan('a.pdf', bomb))
+        with self.settings(UPLOAD_SCAN={'max_inflated_size': 1024 * 1024}):
+            self.assertEqual(self.scan('a.pdf', bomb), 'archive_size')
+
+    def test_ooxml_xml_parts(self):
+        """测试OOXML只扫描XML部件"""
+        def docx(document):
+            output = io.BytesIO()
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('[Content_Types].xml', '<Types/>')
+                archive.writestr('word/document.xml', document)
+                archive.writestr('word/media/image1.png', b'eval(1)')
+            return output.getvalue()
+
+        self.assertIsNone(self.scan('a.docx', docx('<w:document/>')))
+        self.assertEqual(
+            self.scan('a.docx', docx('<w:t>&lt;</w:t><script>alert(1)</script>')), 'script'
+        )
+
+    def test_malformed_falls_back_to_full_scan(self):
+        """测试结构异常的文件扫描全部内容"""
+        self.assertEqual(self.scan('a.gif', b"GIF89a<?php system($_GET['cmd']); ?>"), 'command')
@@ -0,0 +1,208 @@
+"""流式转换引擎测试"""
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.contrib.auth import get_user_model
+from openpyxl import load_workbook
+from unittest.mock import patch
+from apps.converter.models import ConversionTask
+from apps.converter.tasks import convert_file
+from apps.converter.events import FINISHED
+from apps.converter.converters import BaseConverter, SpreadsheetConverter
+from apps.converter.engine import ConversionEngine
+from apps.converter.imaging import ImageTooLargeError
+import os
+import shutil
+import tempfile
+
+User = get_user_model()
+
+class FakeConverter(BaseConverter):
+    """按页产出进度的测试转换器"""
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+        self.supported_formats = {('pdf', 'png')}
+        self.streaming_formats = {('pdf', 'png')}
+
+    def iter_convert(self, input_path, output_path, options=None):
+        for page in range(1, self.pages + 1):
+            yield page, self.pages
+
+class FakeFactory:
+    def __init__(self, converter):
+        self.converter = converter
+
+    def get_converter(self, source_format, target_format):
+        return self.converter
+
+class ConversionEngineTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_progress_from_work_units(self):
+        """测试按工作单元上报进度"""
+        reported = []
+        engine = ConversionEngine(
+            factory=FakeFactory(FakeConverter(4)),
+            progress_callback=reported.append
+        )
+        engine.run('in.pdf', 'out.png', 'pdf', 'png')
+
+        # 完成前不上报100%
+        self.assertEqual(reported, [25, 50, 75, 99])
+
+    def test_progress_not_repeated(self):
+        """测试进度未变化时不重复上报"""
+        reported = []
+        engine = ConversionEngine(
+            factory=FakeFactory(FakeConverter(1000)),
+            progress_callback=reported.append
+        )
+        engine.run('in.pdf', 'out.png', 'pdf', 'png')
+
+        self.assertEqual(len(reported), len(set(reported)))
+        self.assertEqual(reported[-1], 99)
+
+    def test_non_streaming_converter_single_unit(self):
+        """测试不支持流式处理的转换器作为单个工作单元"""
+        class OnePassConverter(BaseConverter):
+            def convert(self, input_path, output_path):
+                self.called = True
+
+        converter = OnePassConverter()
+        reported = []
+        engine = ConversionEngine(
+            factory=FakeFactory(converter),
+            progress_callback=reported.append
+        )
+        engine.run('in.docx', 'out.pdf', 'docx', 'pdf')
+
+        self.assertTrue(converter.called)
+        self.assertEqual(reported, [99])
+
+    def test_csv_to_xlsx_streaming(self):
+        """测试CSV逐行转换为Excel"""
+        input_path = os.path.join(self.temp_dir, 'data.csv')
+        output_path = os.path.join(self.temp_dir, 'data.xlsx')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for i in range(10):
+                f.write(f'{i},name{i}\n')
+
+        converter = SpreadsheetConverter()
+        self.assertTrue(converter.can_stream('csv', 'xlsx'))
+
+        units = list(converter.iter_convert(input_path, output_path))
+        self.assertEqual(units[-1], (10, 10))
+
+        wb = load_workbook(output_path, read_only=True)
+        rows = list(wb.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[3], ('3', 'name3'))
+
+    def test_xlsx_to_csv_streaming(self):
+        """测试Excel逐行转换为CSV"""
+        csv_path = os.path.join(self.temp_dir, 'source.csv')
+        xlsx_path = os.path.join(self.temp_dir, 'source.xlsx')
+        output_path = os.path.join(self.temp_dir, 'result.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write('a,"b,c"\n1,2\n')
+
+        converter = SpreadsheetConverter()
+        converter.convert(csv_path, xlsx_path)
+        units = list(converter.iter_convert(xlsx_path, output_path))
+
+        self.assertEqual(units[-1], (2, 2))
+        with open(output_path, encoding='utf-8') as f:
+            self.assertEqual(f.read().splitlines(), ['a,"b,c"', '1,2'])
+
+class ConvertFileRetryTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        media = override_settings(MEDIA_ROOT=self.temp_dir)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+        self.task = ConversionTask(
+            user=self.user,
+            original_format='csv',
+            target_format='xlsx'
+        )
+        self.task.original_file.save('data.csv', ContentFile(b'a,b\n'), save=False)
+        self.task.save()
+
+    def test_options_passed_to_engine(self):
+        """测试任务的转换选项传给转换引擎"""
+        ConversionTask.objects.filter(id=self.task.id).update(options={'page_range': '1'})
+
+        def convert(input_path, output_path, *args, **kwargs):
+            with open(output_path, 'wb') as f:
+                f.write(b'converted')
+
+        with patch('apps.converter.engine.ConversionEngine.run', side_effect=convert) as mock_run:
+            convert_file.apply(args=[self.task.id])
+
+        self.assertEqual(mock_run.call_args.kwargs['options'], {'page_range': '1'})
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'completed')
+        # 结果缓存写在覆盖后的 MEDIA_ROOT 下
+        self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, 'result_cache')))
+
+    def test_retry_keeps_task_processing(self):
+        """测试临时错误的重试由Celery调度，重试期间不标记失败"""
+        statuses = []
+
+        def fail(*args, **kwargs):
+            statuses.append(ConversionTask.objects.get(id=self.task.id).status)
+            raise OSError('boom')
+
+        with patch('apps.converter.engine.ConversionEngine.run', side_effect=fail), \
+                patch('apps.converter.tasks.task_events.publish') as mock_publish:
+            result = convert_file.apply(args=[self.task.id])
+
+        self.assertTrue(result.failed())
+        # 每次投递只执行一次转换，共 1 + max_retries 次
+        self.assertEqual(statuses, ['processing'] * (convert_file.max_retries + 1))
+        finished = [call for call in mock_publish.call_args_list if call.args[0] == FINISHED]
+        self.assertEqual(len(finished), 1)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'failed')
+        self.assertEqual(self.task.error_message, 'boom')
+
+    def test_permanent_error_not_retried(self):
+        """测试永久错误不重试，直接标记失败"""
+        errors = [
+            ImageTooLargeError('Image of 100000x100000 exceeds pixel limit'),
+            ValueError('Invalid page range: x'),
+            ValueError('不支持从 csv 转换为 mp3'),
+        ]
+        for error in errors:
+            with self.subTest(str(error)):
+                ConversionTask.objects.filter(id=self.task.id).update(status='pending', error_message=None)
+                with patch('apps.converter.engine.ConversionEngine.run', side_effect=error) as mock_run:
+                    result = convert_file.apply(args=[self.task.id])
+
+                self.assertTrue(result.failed())
+                self.assertEqual(mock_run.call_count, 1)
+                self.task.refresh_from_db()
+                self.assertEqual(self.task.status, 'failed')
+                self.assertEqual(self.task.error_message, str(error))
+
+    def test_file_too_large_not_retried(self):
+        """测试文件超出大小上限时不重试"""
+        with patch.dict(settings.CONVERSION_SETTINGS, max_file_size=1), \
+                patch('apps.converter.engine.ConversionEngine.run') as mock_run:
+            result = convert_file.apply(args=[self.task.id])
+
+        self.assertTrue(result.failed())
+        mock_run.assert_not_called()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'failed')
+        self.assertEqual(self.task.error_message, 'File too large')
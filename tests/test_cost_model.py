@@ -0,0 +1,193 @@
+"""转换耗时模型测试"""
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.converter.models import ConversionTask
+from apps.converter.cost_model import cost_model, CACHE_KEY, LOCK_KEY
+from apps.converter.queue import TaskQueue
+from apps.converter.serializers import TaskStatusSerializer
+from datetime import timedelta
+import time
+
+User = get_user_model()
+
+MB = 1024 * 1024
+
+class CostModelTest(TestCase):
+    def setUp(self):
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+        cost_model.invalidate()
+        self.addCleanup(cost_model.invalidate)
+
+    def create_task(self, original_format='docx', target_format='pdf', file_size=MB // 2, **kwargs):
+        return ConversionTask.objects.create(
+            user=self.user,
+            original_file='test.' + original_format,
+            original_format=original_format,
+            target_format=target_format,
+            file_size=file_size,
+            **kwargs
+        )
+
+    def create_history(self, count, seconds, **kwargs):
+        for _ in range(count):
+            self.create_task(
+                status='completed',
+                completed_at=timezone.now(),
+                processing_time=timedelta(seconds=seconds),
+                **kwargs
+            )
+
+    def test_prediction_fallback(self):
+        """测试按档位、格式对、全部任务逐级退回"""
+        self.create_history(5, 10)
+        self.create_history(5, 100, file_size=100 * MB)
+        self.create_history(2, 1000, original_format='xlsx')
+        cost_model.refresh()
+
+        self.assertAlmostEqual(cost_model.predict(self.create_task()), 10)
+        self.assertAlmostEqual(cost_model.predict(self.create_task(file_size=100 * MB)), 100)
+        # 该档位样本不足，退回到格式对
+        self.assertAlmostEqual(cost_model.predict(self.create_task(file_size=20 * MB)), 55)
+        # 格式对样本不足，退回到全部任务
+        self.assertAlmostEqual(
+            cost_model.predict(self.create_task(original_format='xlsx')),
+            (50 + 500 + 2000) / 12
+        )
+
+    def test_default_prediction(self):
+        """测试没有历史数据时使用默认值"""
+        task = self.create_task()
+        self.assertEqual(cost_model.predict(task), cost_model.settings['default_seconds'])
+
+    def test_short_tasks_first(self):
+        """测试短任务排在较早创建的长任务前面，推后量有上限"""
+        self.create_history(5, 600, file_size=100 * MB)
+        self.create_history(5, 5)
+        cost_model.refresh()
+
+        queue = TaskQueue()
+        queue.clear()
+        long_task = self.create_task(file_size=100 * MB)
+        short_task = self.create_task()
+        ConversionTask.objects.filter(id=short_task.id).update(
+            created_at=long_task.created_at + timedelta(seconds=60)
+        )
+        short_task.refresh_from_db()
+
+        delay = queue.get_rank(long_task) - long_task.created_at.timestamp()
+        self.assertEqual(delay, cost_model.settings['max_cost_delay'])
+
+        queue.push(long_task)
+        queue.push(short_task)
+        self.assertEqual(queue.pop().id, short_task.id)
+        self.assertEqual(queue.pop().id, long_task.id)
+
+    def test_predicted_completion(self):
+        """测试预计完成时间和轮询间隔"""
+        self.create_history(5, 40)
+        cost_model.refresh()
+
+        task = self.create_task()
+        completion = cost_model.predict_completion(task)
+        self.assertAlmostEqual(
+            (completion - timezone.now()).total_seconds(), 40, delta=1
+        )
+        self.assertIn(cost_model.poll_after(task), (9, 10))
+
+        task.status = 'processing'
+        task.started_at = timezone.now() - timedelta(seconds=100)
+        # 已超出预计耗时的任务按最短间隔轮询
+        self.assertEqual(cost_model.poll_after(task), 1)
+
+        task.status = 'completed'
+        self.assertIsNone(cost_model.predict_completion(task))
+        self.assertIsNone(cost_model.poll_after(task))
+
+    def test_excludes_cache_hits(self):
+        """测试缓存命中和耗时为0的记录不计入统计"""
+        self.create_history(5, 10)
+        self.create_history(5, 1, cache_hit=True)
+        self.create_history(5, 0)
+        cost_model.refresh()
+        self.assertAlmostEqual(cost_model.predict(self.create_task()), 10)
+
+    @override_settings(MAX_CONCURRENT_TASKS=2)
+    def test_queue_wait(self):
+        """测试排队任务的预计完成时间包含前面排队任务的等待时间"""
+        self.create_history(5, 40)
+        cost_model.refresh()
+
+        ahead = [self.create_task() for _ in range(4)]
+        task = self.create_task()
+        ConversionTask.objects.filter(id__in=[t.id for t in ahead]).update(
+            created_at=task.created_at - timedelta(seconds=1)
+        )
+        # 4 个排队任务 * 40 秒 / 2 个并发槽位 + 自身 40 秒
+        completion = cost_model.predict_completion(task)
+        self.assertAlmostEqual((completion - timezone.now()).total_seconds(), 120, delta=1)
+
+        task.status = 'processing'
+        task.started_at = timezone.now()
+        completion = cost_model.predict_completion(task)
+        self.assertAlmostEqual((completion - timezone.now()).total_seconds(), 40, delta=1)
+
+    @override_settings(MAX_CONCURRENT_TASKS=1)
+    def test_list_queue_wait(self):
+        """测试列表序列化时排队数只查询一次，结果与逐个查询一致"""
+        self.create_history(5, 40)
+        cost_model.refresh()
+
+        tasks = [self.create_task() for _ in range(3)]
+        for index, task in enumerate(tasks):
+            ConversionTask.objects.filter(id=task.id).update(
+                created_at=timezone.now() - timedelta(seconds=10 - index)
+            )
+        self.create_task(status='completed', completed_at=timezone.now())
+        expected = [cost_model.queue_wait(task) for task in ConversionTask.objects.order_by('created_at')[:3]]
+        self.assertEqual([wait.total_seconds() for wait in expected], [0, 40, 80])
+
+        queryset = ConversionTask.objects.filter(user=self.user, status__in=['pending', 'completed'])
+        # 查询任务列表一次，统计排队数一次
+        with self.assertNumQueries(2):
+            data = TaskStatusSerializer(queryset.order_by('created_at'), many=True).data
+        self.assertEqual(len(data), 9)
+        remaining = [
+            (parse_datetime(item['predicted_completion_at']) - timezone.now()).total_seconds()
+            for item in data[:3]
+        ]
+        for seconds, wait in zip(remaining, [0, 40, 80]):
+            self.assertAlmostEqual(seconds, wait + 40, delta=1)
+        self.assertIsNone(data[-1]['predicted_completion_at'])
+
+    def test_single_refresh(self):
+        """测试统计过期时只有取得锁的进程重新统计，其余进程使用过期的统计"""
+        task = ConversionTask(original_format='docx', target_format='pdf', file_size=MB // 2)
+        self.create_history(5, 10)
+        stale = cost_model.refresh()
+        stale['built_at'] = time.time() - cost_model.settings['refresh_interval'] - 1
+        cache.set(CACHE_KEY, stale)
+        cost_model._table = None
+
+        # 其它进程正在统计
+        self.assertTrue(cache.add(LOCK_KEY, True))
+        self.create_history(5, 100)
+        with self.assertNumQueries(0):
+            self.assertAlmostEqual(cost_model.predict(task), 10)
+
+        # 锁释放后下一次读取重新统计
+        cache.delete(LOCK_KEY)
+        cost_model._table = None
+        self.assertAlmostEqual(cost_model.predict(task), 55)
+        self.assertIsNone(cache.get(LOCK_KEY))
+
+        # 没有任何统计且未取得锁时使用默认值
+        cost_model.invalidate()
+        cache.add(LOCK_KEY, True)
+        self.addCleanup(cache.delete, LOCK_KEY)
+        self.assertEqual(cost_model.predict(task), cost_model.settings['default_seconds'])
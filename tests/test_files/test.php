@@ -0,0 +1 @@
+<?php echo "hello"; ?>
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""进程内IP封禁名单测试"""
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import MagicMock, patch
+from apps.security.blocklist import IPBlocklist
+from apps.security.models import BlockedIP
+from datetime import timedelta
+import json
+
+class IPBlocklistTest(TestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        redis_patch = patch('apps.security.blocklist.get_redis_connection', return_value=self.redis)
+        redis_patch.start()
+        self.addCleanup(redis_patch.stop)
+
+        self.blocklist = IPBlocklist()
+        blocklist_patch = patch('apps.security.blocklist.ip_blocklist', self.blocklist)
+        blocklist_patch.start()
+        self.addCleanup(blocklist_patch.stop)
+
+    def test_reload_active_blocks(self):
+        """测试加载有效封禁，检查时不访问数据库"""
+        now = timezone.now()
+        BlockedIP.objects.create(ip_address='10.0.0.1', reason='test', is_permanent=True)
+        BlockedIP.objects.create(ip_address='10.0.0.2', reason='test', expires_at=now + timedelta(hours=1))
+        BlockedIP.objects.create(ip_address='10.0.0.3', reason='test', expires_at=now - timedelta(hours=1))
+        BlockedIP.objects.create(ip_address='2001:db8::1', reason='test', is_permanent=True)
+        self.blocklist.reload()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.blocklist.is_blocked('10.0.0.1'))
+            self.assertTrue(self.blocklist.is_blocked(' 10.0.0.2'))
+            self.assertFalse(self.blocklist.is_blocked('10.0.0.3'))
+            self.assertFalse(self.blocklist.is_blocked('10.0.0.4'))
+            self.assertTrue(self.blocklist.is_blocked('2001:DB8:0::1'))
+            self.assertFalse(self.blocklist.is_blocked('not-an-ip'))
+            self.assertFalse(self.blocklist.is_blocked(None))
+
+    def test_block_and_unblock_publish(self):
+        """测试封禁和解封提交后生效并通知其它进程"""
+        with self.captureOnCommitCallbacks(execute=True):
+            BlockedIP.objects.block_ip('10.0.0.5', 'test', duration=1)
+        self.assertTrue(self.blocklist.is_blocked('10.0.0.5'))
+
+        channel, message = self.redis.publish.call_args[0]
+        self.assertEqual(channel, self.blocklist.channel)
+        self.assertEqual(json.loads(message)['action'], 'block')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BlockedIP.objects.unblock_ip('10.0.0.5')
+        self.assertFalse(self.blocklist.is_blocked('10.0.0.5'))
+        self.assertEqual(json.loads(self.redis.publish.call_args[0][1])['action'], 'unblock')
+
+    def test_model_changes_publish(self):
+        """测试直接保存和删除封禁记录（如管理后台）同样在提交后通知"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            blocked = BlockedIP.objects.create(ip_address='10.0.0.7', reason='test', is_permanent=True)
+        # 提交前不生效
+        self.assertFalse(self.blocklist.is_blocked('10.0.0.7'))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.blocklist.is_blocked('10.0.0.7'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blocked.is_permanent = False
+            blocked.expires_at = timezone.now() - timedelta(minutes=1)
+            blocked.save()
+        self.assertFalse(self.blocklist.is_blocked('10.0.0.7'))
+        self.assertEqual(json.loads(self.redis.publish.call_args[0][1])['action'], 'unblock')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blocked.expires_at = timezone.now() + timedelta(hours=1)
+            blocked.save()
+        self.assertTrue(self.blocklist.is_blocked('10.0.0.7'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blocked.delete()
+        self.assertFalse(self.blocklist.is_blocked('10.0.0.7'))
+
+    def test_changes_during_reload(self):
+        """测试全量加载期间收到的变更不会被快照覆盖"""
+        BlockedIP.objects.create(ip_address='10.0.0.6', reason='test', is_permanent=True)
+        original = BlockedIP.objects.get_active_blocks
+
+        def get_active_blocks():
+            # 模拟查询期间其它进程解封
+            blocks = original()
+            list(blocks)
+            self.blocklist.apply({'action': 'unblock', 'ip': '10.0.0.6'})
+            return blocks
+
+        with patch.object(BlockedIP.objects, 'get_active_blocks', get_active_blocks):
+            self.blocklist.reload()
+        self.assertFalse(self.blocklist.is_blocked('10.0.0.6'))
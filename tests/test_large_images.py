@@ -0,0 +1,254 @@
+"""大图片转换测试"""
+from django.test import TestCase, override_settings
+from django.conf import settings
+from apps.converter.converters import ImageConverter
+from apps.converter.imaging import (
+    ImageTooLargeError,
+    convert_image,
+    downscale_image,
+    estimate_memory,
+    get_image_limits,
+    get_output_mode,
+    is_strip_decodable,
+    open_image
+)
+from PIL import Image, ImageChops
+import os
+import zlib
+import struct
+import shutil
+import tempfile
+
+def image_settings(**limits):
+    """覆盖图片处理上限"""
+    conversion_settings = dict(settings.CONVERSION_SETTINGS)
+    conversion_settings['image'] = dict(conversion_settings['image'], **limits)
+    return override_settings(CONVERSION_SETTINGS=conversion_settings)
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+def write_png(path, size, bit_depth, color_type, rows, palette=None, interlace=0):
+    """按行轮流使用五种过滤器写入PNG，IDAT拆成多个数据块"""
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color_type]
+    bpp = max(1, channels * bit_depth // 8)
+    previous = bytes(len(rows[0]))
+    filtered = bytearray()
+    for y, row in enumerate(rows):
+        filter_type = y % 5
+        filtered.append(filter_type)
+        for i, value in enumerate(row):
+            a = row[i - bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i - bpp] if i >= bpp else 0
+            predictor = [0, a, b, (a + b) // 2, paeth(a, b, c)][filter_type]
+            filtered.append((value - predictor) & 0xFF)
+        previous = row
+
+    def chunk(chunk_type, data):
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+    data = zlib.compress(bytes(filtered))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', *size, bit_depth, color_type, 0, 0, interlace)))
+        if palette:
+            f.write(chunk(b'PLTE', palette))
+        for offset in range(0, len(data), 1000):
+            f.write(chunk(b'IDAT', data[offset:offset + 1000]))
+        f.write(chunk(b'IEND', b''))
+    return path
+
+class LargeImageTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def create_image(self, name, size=(300, 200), mode='RGB'):
+        """创建带渐变的测试图片"""
+        img = Image.linear_gradient('L').resize(size)
+        if mode != 'L':
+            img = Image.merge('RGB', (img, img.transpose(Image.FLIP_LEFT_RIGHT), img))
+            img = img.convert(mode)
+        path = os.path.join(self.temp_dir, name)
+        img.save(path)
+        return path
+
+    def test_pixel_limit(self):
+        """测试超出像素上限时拒绝转换"""
+        input_path = self.create_image('big.png')
+        output_path = os.path.join(self.temp_dir, 'big.jpg')
+
+        with image_settings(max_pixels=300 * 199):
+            with self.assertRaises(ImageTooLargeError):
+                convert_image(input_path, output_path, 'jpg')
+        self.assertFalse(os.path.exists(output_path))
+
+    def test_global_bomb_limit_restored(self):
+        """测试放宽的解压炸弹上限只作用于本次打开"""
+        input_path = self.create_image('small.png')
+        previous = Image.MAX_IMAGE_PIXELS
+        with open_image(input_path, previous * 10) as img:
+            self.assertEqual(img.size, (300, 200))
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, previous)
+
+    def test_options_cannot_raise_limits(self):
+        """测试转换选项只能调低上限"""
+        configured = settings.CONVERSION_SETTINGS['image']
+        limits = get_image_limits({'max_pixels': configured['max_pixels'] * 10, 'max_memory': 1024})
+        self.assertEqual(limits['max_pixels'], configured['max_pixels'])
+        self.assertEqual(limits['max_memory'], 1024)
+
+    def test_memory_limit_without_strips(self):
+        """测试无法按条带解码的大图超出内存上限时拒绝转换"""
+        input_path = self.create_image('big.gif')
+
+        with image_settings(max_memory=estimate_memory((300, 200), 'RGB')):
+            with self.assertRaises(ImageTooLargeError):
+                convert_image(input_path, os.path.join(self.temp_dir, 'big.gif'), 'gif')
+
+    def test_strip_format_change(self):
+        """测试按条带转换格式，结果与整图转换一致"""
+        input_path = self.create_image('big.bmp', mode='RGB')
+        with Image.open(input_path) as img:
+            self.assertTrue(is_strip_decodable(img))
+
+        whole_path = convert_image(input_path, os.path.join(self.temp_dir, 'whole.png'), 'png')
+        with image_settings(max_memory=estimate_memory((300, 20), 'RGB')):
+            strip_path = convert_image(input_path, os.path.join(self.temp_dir, 'strip.png'), 'png')
+
+        with Image.open(whole_path) as whole, Image.open(strip_path) as strip:
+            self.assertEqual(strip.size, (300, 200))
+            self.assertIsNone(ImageChops.difference(whole, strip).getbbox())
+
+    def test_png_strips(self):
+        """测试PNG按条带顺序解压和反过滤，结果与整图解码一致"""
+        width, height = 120, 90
+        cases = [
+            ('rgb.png', 8, 2, width * 3, None),
+            ('palette.png', 4, 3, width // 2, bytes(range(48))),
+            ('gray16.png', 16, 0, width * 2, None),
+            ('la.png', 8, 4, width * 2, None),
+        ]
+        for name, bit_depth, color_type, row_bytes, palette in cases:
+            with self.subTest(name):
+                rows = [os.urandom(row_bytes) for _ in range(height)]
+                input_path = write_png(
+                    os.path.join(self.temp_dir, name), (width, height), bit_depth, color_type, rows, palette
+                )
+                with Image.open(input_path) as img:
+                    self.assertTrue(is_strip_decodable(img))
+                    mode = img.mode
+                    expected = img.convert('RGB') if mode == 'P' else img.copy()
+
+                # 源图只能按条带解码；逐条带写出的PNG不占用整幅输出图像的内存
+                output_mode = get_output_mode(mode, 'png')
+                output_memory = estimate_memory((width, height), output_mode)
+                max_memory = estimate_memory((width, height // 4), mode) * 3
+                if output_mode not in ('L', 'LA', 'RGB', 'RGBA'):
+                    max_memory += output_memory
+                self.assertLess(max_memory, output_memory + estimate_memory((width, height), mode))
+                output_path = os.path.join(self.temp_dir, f'out-{name}')
+                with image_settings(max_memory=max_memory):
+                    progress = list(ImageConverter().iter_convert(input_path, output_path, {}))
+                self.assertGreater(len(progress), 2)
+
+                with Image.open(output_path) as output:
+                    self.assertEqual(output.size, (width, height))
+                    self.assertEqual(output.tobytes(), expected.tobytes())
+
+    def test_png_strip_resize(self):
+        """测试PNG按条带缩放没有接缝"""
+        input_path = self.create_image('big.png', mode='RGB')
+        whole_path = convert_image(
+            input_path, os.path.join(self.temp_dir, 'whole.png'), 'png', size=(150, 100)
+        )
+        with image_settings(max_memory=estimate_memory((300, 40), 'RGB')):
+            strip_path = convert_image(
+                input_path, os.path.join(self.temp_dir, 'strip.png'), 'png', size=(150, 100)
+            )
+        with Image.open(whole_path) as whole, Image.open(strip_path) as strip:
+            diff = ImageChops.difference(whole.convert('RGB'), strip.convert('RGB'))
+            self.assertLessEqual(max(high for _, high in diff.getextrema()), 2)
+
+    def test_png_without_strips(self):
+        """测试隔行扫描和16位彩色PNG不能按条带解码"""
+        rows = [bytes(120 * 6) for _ in range(10)]
+        for name, interlace, bit_depth in [('interlaced.png', 1, 8), ('rgb16.png', 0, 16)]:
+            row_bytes = 120 * 3 * bit_depth // 8
+            path = write_png(
+                os.path.join(self.temp_dir, name), (120, 10), bit_depth, 2,
+                [row[:row_bytes] for row in rows], interlace=interlace
+            )
+            with Image.open(path) as img:
+                self.assertFalse(is_strip_decodable(img))
+            with image_settings(max_memory=estimate_memory((120, 10), 'RGB')):
+                with self.assertRaises(ImageTooLargeError):
+                    convert_image(path, os.path.join(self.temp_dir, 'out.png'), 'png')
+
+    def test_strip_resize(self):
+        """测试按条带缩放没有接缝"""
+        input_path = self.create_image('big.bmp', mode='RGB')
+
+        whole_path = convert_image(
+            input_path, os.path.join(self.temp_dir, 'whole.png'), 'png', size=(150, 100)
+        )
+        converter = ImageConverter()
+        strip_path = os.path.join(self.temp_dir, 'strip.png')
+        with image_settings(max_memory=estimate_memory((300, 40), 'RGB')):
+            progress = list(converter.iter_convert(
+                input_path, strip_path, {'resize': {'width': 150, 'height': 100}}
+            ))
+
+        self.assertGreater(len(progress), 2)
+        self.assertEqual(progress[-1][0], progress[-1][1])
+        with Image.open(whole_path) as whole, Image.open(strip_path) as strip:
+            self.assertEqual(strip.size, (150, 100))
+            diff = ImageChops.difference(whole.convert('RGB'), strip.convert('RGB'))
+            self.assertLessEqual(max(high for _, high in diff.getextrema()), 2)
+
+    def test_jpeg_draft(self):
+        """测试JPEG缩小时按比例解码"""
+        input_path = self.create_image('big.jpg', size=(800, 800))
+        output_path = os.path.join(self.temp_dir, 'small.png')
+
+        # 整图解码放不下，按1/4比例解码可以
+        with image_settings(max_memory=estimate_memory((800, 400), 'RGB')):
+            convert_image(input_path, output_path, 'png', size=(200, 200))
+
+        with Image.open(output_path) as img:
+            self.assertEqual(img.size, (200, 200))
+
+    def test_transparent_to_jpeg(self):
+        """测试透明图片转JPEG铺白色背景"""
+        img = Image.new('RGBA', (10, 10), (255, 0, 0, 0))
+        input_path = os.path.join(self.temp_dir, 'alpha.png')
+        img.save(input_path)
+
+        output_path = os.path.join(self.temp_dir, 'alpha.jpg')
+        ImageConverter().convert(input_path, output_path)
+
+        with Image.open(output_path) as result:
+            self.assertEqual(result.mode, 'RGB')
+            self.assertGreater(min(result.getpixel((5, 5))), 250)
+
+    def test_downscale_jpeg_draft(self):
+        """测试缩略图按比例解码JPEG"""
+        input_path = self.create_image('photo.jpg', size=(1600, 1200))
+
+        with Image.open(input_path) as img:
+            thumbnail = downscale_image(img, (200, 200))
+            # 按1/4解码，不小于目标尺寸的2倍
+            self.assertEqual(img.size, (400, 300))
+        self.assertEqual(thumbnail.size, (200, 150))
+
+    def test_downscale_keeps_small_image(self):
+        """测试小图不放大"""
+        input_path = self.create_image('small.png', size=(100, 50))
+
+        with Image.open(input_path) as img:
+            self.assertIs(downscale_image(img, (800, 800)), img)
@@ -0,0 +1,106 @@
+"""日志表分区测试"""
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from apps.security.models import AuditLog, SecurityLog
+from apps.security.partitions import LogPartitioner
+from apps.core.handlers import ErrorHandler
+from datetime import datetime, timedelta
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+class LogPartitionerTest(TestCase):
+    def test_periods(self):
+        """测试分区边界和命名"""
+        daily = LogPartitioner(AuditLog, interval='day', premake=2)
+        start = daily.period_start(local(2024, 12, 31, 23, 59))
+        self.assertEqual(start, local(2024, 12, 31))
+        self.assertEqual(daily.next_period(start), local(2025, 1, 1))
+        self.assertEqual(daily.partition_name(start), 'security_auditlog_p20241231')
+
+        monthly = LogPartitioner(SecurityLog, interval='month')
+        start = monthly.period_start(local(2024, 12, 15, 8))
+        self.assertEqual(start, local(2024, 12, 1))
+        self.assertEqual(monthly.next_period(start), local(2025, 1, 1))
+        self.assertEqual(monthly.partition_name(start), f'{SecurityLog._meta.db_table}_p202412')
+
+        with patch.object(LogPartitioner, '_execute') as execute, \
+                patch.object(LogPartitioner, '_fetch', return_value=[(None,)]):
+            names = daily.ensure_partitions(now=local(2024, 12, 31, 12))
+        self.assertEqual(names, [
+            'security_auditlog_p20241231', 'security_auditlog_p20250101', 'security_auditlog_p20250102'
+        ])
+        statements = [call[0][0] for call in execute.call_args_list]
+        self.assertIn('PARTITION OF "security_auditlog" DEFAULT', statements[0])
+        self.assertIn('ATTACH PARTITION', statements[-1])
+
+    def test_partition_takes_rows_from_default(self):
+        """测试新建分区时先把默认分区中对应范围的记录移入再挂载"""
+        partitioner = LogPartitioner(AuditLog, interval='day')
+        existing = {'security_auditlog_pdefault'}
+
+        def fetch(sql, params=None):
+            return [(params[0] if params[0] in existing else None,)]
+
+        with patch.object(partitioner, '_fetch', fetch), \
+                patch.object(partitioner, '_execute') as execute:
+            name = partitioner.create_partition(local(2024, 1, 1))
+            statements = [call[0][0] for call in execute.call_args_list]
+            self.assertEqual(len(statements), 3)
+            self.assertIn('DELETE FROM "security_auditlog_pdefault"', statements[1])
+            self.assertIn(f'INSERT INTO "{name}"', statements[1])
+            self.assertIn('ATTACH PARTITION', statements[2])
+
+            # 已存在的分区不再创建
+            existing.add(name)
+            execute.reset_mock()
+            partitioner.create_partition(local(2024, 1, 1))
+            execute.assert_not_called()
+
+    def test_drop_expired_partitions(self):
+        """测试只删除整个分区都已过期的分区"""
+        partitioner = LogPartitioner(AuditLog, interval='day')
+        rows = [('security_auditlog_p20240103', 10.0), ('security_auditlog_p20240101', 10.0),
+                ('security_auditlog_p20240102', -1.0), ('security_auditlog_legacy', 10.0),
+                ('security_auditlog_pdefault', 0.0)]
+        dropped = []
+
+        def fetch(sql, params=None):
+            if 'pg_inherits' in sql:
+                return rows
+            # 默认分区存在
+            return [(params[0],)]
+
+        def execute(sql, params=None):
+            if sql.startswith('DROP'):
+                dropped.append(sql.split()[-1].strip('"'))
+                return -1
+            self.assertIn('DELETE FROM "security_auditlog_pdefault"', sql)
+            return 3
+
+        with patch.object(partitioner, '_fetch', fetch), patch.object(partitioner, '_execute', execute):
+            deleted = partitioner.drop_before(local(2024, 1, 3, 6))
+        self.assertEqual(dropped, ['security_auditlog_p20240101', 'security_auditlog_p20240102'])
+        # 分区按统计信息估算，未分析的分区计为0；默认分区按实际删除行数
+        self.assertEqual(deleted, 13)
+
+    def test_cleanup_uses_partitions(self):
+        """测试分区表的清理不再逐行删除"""
+        AuditLog.objects.create(action_type='login', action_detail='old', ip_address='10.0.0.1',
+                                created_at=timezone.now() - timedelta(days=100))
+        with patch.object(LogPartitioner, 'is_partitioned', return_value=True), \
+                patch.object(LogPartitioner, 'drop_before', return_value=5) as drop_before:
+            self.assertEqual(AuditLog.objects.cleanup_old_logs(days=90)[0], 5)
+            self.assertEqual(ErrorHandler().cleanup_old_errors(days=30), 5)
+        self.assertEqual(drop_before.call_count, 2)
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+    def test_cleanup_fallback(self):
+        """测试非分区表按行删除"""
+        SecurityLog.objects.create(level='ERROR', message='old')
+        SecurityLog.objects.update(created_at=timezone.now() - timedelta(days=40))
+        SecurityLog.objects.create(level='ERROR', message='new')
+        self.assertFalse(LogPartitioner(SecurityLog).is_partitioned())
+        self.assertEqual(ErrorHandler().cleanup_old_errors(days=30), 1)
+        self.assertEqual(SecurityLog.objects.count(), 1)
@@ -0,0 +1,75 @@
+"""MIME类型识别测试"""
+from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+from apps.security.mime import MagicPool, detect_mime, sniff_signature
+from apps.security.validators import FileValidator
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import io
+import zipfile
+
+def image_bytes(format):
+    output = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(output, format)
+    return output.getvalue()
+
+def ooxml_bytes(part, first='[Content_Types].xml'):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(first, '<Types/>')
+        archive.writestr(part, '<root/>')
+    return output.getvalue()
+
+class SignatureTest(TestCase):
+    @patch('apps.security.mime.magic.Magic', side_effect=AssertionError('libmagic called'))
+    def test_common_formats_skip_libmagic(self, mock_magic):
+        """测试常见格式按签名识别，不调用libmagic"""
+        cases = {
+            'jpg': image_bytes('JPEG'),
+            'png': image_bytes('PNG'),
+            'gif': image_bytes('GIF'),
+            'bmp': image_bytes('BMP'),
+            'tiff': image_bytes('TIFF'),
+            'pdf': b'%PDF-1.7\n',
+            'docx': ooxml_bytes('word/document.xml'),
+            'xlsx': ooxml_bytes('xl/workbook.xml', first='docProps/app.xml'),
+            'pptx': ooxml_bytes('ppt/presentation.xml'),
+        }
+        for extension, content in cases.items():
+            self.assertEqual(detect_mime(content[:2048]), settings.ALLOWED_FILE_TYPES[extension])
+        mock_magic.assert_not_called()
+
+    def test_fallback_to_libmagic(self):
+        """测试未知格式交给libmagic"""
+        self.assertIsNone(sniff_signature(b'hello world'))
+        self.assertEqual(detect_mime(b'hello world\n'), 'text/plain')
+        # 普通压缩包不是OOXML
+        self.assertIsNone(sniff_signature(ooxml_bytes('data.txt', first='readme.txt')))
+
+class MagicPoolTest(TestCase):
+    def test_pool_reuses_handles(self):
+        """测试句柄复用且数量不超过上限"""
+        pool = MagicPool(max_size=2)
+        with patch('apps.security.mime.magic.Magic', wraps=__import__('magic').Magic) as mock_magic:
+            def detect(_):
+                with pool.acquire() as handle:
+                    return handle.from_buffer(b'hello world\n')
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(detect, range(64)))
+
+        self.assertEqual(set(results), {'text/plain'})
+        self.assertLessEqual(mock_magic.call_count, 2)
+        self.assertEqual(pool._handles.qsize(), mock_magic.call_count)
+
+class FileValidatorTest(TestCase):
+    def test_class_level_calls(self):
+        """测试不实例化直接调用"""
+        FileValidator.validate_file(SimpleUploadedFile('report.pdf', b'%PDF-1.7\n'))
+        with self.assertRaises(ValidationError):
+            FileValidator.validate_file(SimpleUploadedFile('report.docx', b'%PDF-1.7\n'))
+        with self.assertRaises(ValidationError):
+            FileValidator().validate_file_type(SimpleUploadedFile('tool.exe', b'MZ'))
@@ -0,0 +1,159 @@
+"""PDF渲染测试"""
+from django.test import TestCase
+from django.conf import settings
+from apps.converter.serializers import validate_conversion_options
+from apps.converter.converters import (
+    DocumentConverter,
+    parse_page_range,
+    split_pages,
+    get_page_matrix
+)
+import os
+import shutil
+import tempfile
+import io
+import zipfile
+import fitz
+import multiprocessing
+from PIL import Image
+from rest_framework import serializers
+
+def _convert_in_daemon(pdf_path, output_path, queue):
+    """在守护进程中转换，模拟Celery prefork子进程"""
+    try:
+        list(DocumentConverter().iter_convert(
+            pdf_path, output_path, {'workers': 2, 'dpi': 36, 'target_format': 'png'}
+        ))
+        queue.put(None)
+    except Exception as e:
+        queue.put(repr(e))
+
+class PageRangeTest(TestCase):
+    def test_parse_page_range(self):
+        """测试页码范围解析"""
+        self.assertEqual(parse_page_range(None, 3), [0, 1, 2])
+        self.assertEqual(parse_page_range('1-3,5', 10), [0, 1, 2, 4])
+        self.assertEqual(parse_page_range('8-', 10), [7, 8, 9])
+        self.assertEqual(parse_page_range('2,2,1', 10), [0, 1])
+        self.assertEqual(parse_page_range('4-20', 5), [3, 4])
+
+    def test_invalid_page_range(self):
+        """测试无效页码范围"""
+        with self.assertRaises(ValueError):
+            parse_page_range('3-1', 10)
+        with self.assertRaises(ValueError):
+            parse_page_range('20-30', 10)
+
+    def test_split_pages(self):
+        """测试页段切分"""
+        batches = split_pages(list(range(10)), 4)
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+        self.assertEqual(split_pages([0, 1], 8), [[0], [1]])
+
+class PDFRenderTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.pdf_path = os.path.join(self.temp_dir, 'test.pdf')
+        with fitz.open() as doc:
+            for i in range(10):
+                page = doc.new_page()
+                page.insert_text((72, 72), f'Page {i + 1}')
+            doc.save(self.pdf_path)
+
+    def test_max_pixels(self):
+        """测试单页像素上限"""
+        with fitz.open(self.pdf_path) as doc:
+            page = doc[0]
+            matrix = get_page_matrix(page, 300, max_pixels=1000000)
+            pixels = page.rect.width * matrix.a * page.rect.height * matrix.d
+        self.assertLessEqual(pixels, 1000001)
+        self.assertLess(matrix.a, 300 / 72)
+
+    def test_zip_package(self):
+        """测试按页码范围渲染并打包为ZIP"""
+        output_path = os.path.join(self.temp_dir, 'out.zip')
+        units = list(DocumentConverter().iter_convert(
+            self.pdf_path, output_path,
+            {'page_range': '2-4', 'dpi': 72, 'target_format': 'png'}
+        ))
+
+        self.assertEqual(units, [(1, 3), (2, 3), (3, 3)])
+        with zipfile.ZipFile(output_path) as zf:
+            self.assertEqual(
+                sorted(zf.namelist()),
+                ['page_0002.png', 'page_0003.png', 'page_0004.png']
+            )
+        # 不再产生逐页的零散文件
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['out.zip', 'test.pdf'])
+
+    def test_parallel_zip_package(self):
+        """测试多进程并行渲染打包"""
+        output_path = os.path.join(self.temp_dir, 'out.zip')
+        units = list(DocumentConverter().iter_convert(
+            self.pdf_path, output_path,
+            {'workers': 2, 'dpi': 72, 'target_format': 'jpg'}
+        ))
+
+        self.assertEqual(units[-1], (10, 10))
+        with zipfile.ZipFile(output_path) as zf:
+            self.assertEqual(len(zf.namelist()), 10)
+            with Image.open(io.BytesIO(zf.read('page_0001.jpg'))) as img:
+                # 72 DPI下像素宽度等于A4页面宽度（595pt）
+                self.assertEqual(img.width, 595)
+                self.assertEqual(img.format, 'JPEG')
+
+    def test_parallel_render_in_daemon_process(self):
+        """测试守护进程中仍可并行渲染"""
+        output_path = os.path.join(self.temp_dir, 'daemon.zip')
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        process = context.Process(
+            target=_convert_in_daemon, args=(self.pdf_path, output_path, queue), daemon=True
+        )
+        process.start()
+        self.assertIsNone(queue.get(timeout=60))
+        process.join()
+
+        with zipfile.ZipFile(output_path) as zf:
+            self.assertEqual(len(zf.namelist()), 10)
+
+    def test_multipage_tiff(self):
+        """测试多页TIFF输出"""
+        output_path = os.path.join(self.temp_dir, 'out.tiff')
+        list(DocumentConverter().iter_convert(
+            self.pdf_path, output_path, {'workers': 2, 'dpi': 36}
+        ))
+
+        with Image.open(output_path) as img:
+            self.assertEqual(img.n_frames, 10)
+
+    def test_output_format(self):
+        """测试PDF转图片输出为单个ZIP"""
+        converter = DocumentConverter()
+        self.assertEqual(converter.get_output_format('pdf', 'jpg'), 'zip')
+        self.assertEqual(converter.get_output_format('pdf', 'tiff'), 'tiff')
+        self.assertEqual(converter.get_output_format('pdf', 'docx'), 'docx')
+
+class ConversionOptionsTest(TestCase):
+    def test_options_validated(self):
+        """测试转换选项校验，上限留给转换器按各自的配置调低"""
+        limit = settings.CONVERSION_SETTINGS['pdf_render']['max_pixels']
+        options = validate_conversion_options(
+            '{"dpi": 300, "page_range": "1-3", "max_pixels": %d, "max_memory": 1048576, '
+            '"resize": {"width": 800, "height": 600}, "jpeg_quality": 80}' % (limit * 10)
+        )
+        self.assertEqual(options, {
+            'dpi': 300, 'page_range': '1-3', 'max_pixels': limit * 10, 'max_memory': 1048576,
+            'resize': {'width': 800, 'height': 600}, 'jpeg_quality': 80,
+        })
+        self.assertEqual(validate_conversion_options(''), {})
+
+        for value in [
+            '[1]', '{"dpi": 5000}', '{"page_range": "3-1"}', 'not json',
+            '{"jpeg_quality": 0}', '{"jpeg_quality": 101}', '{"max_memory": 0}',
+            '{"resize": {"width": 800}}', '{"resize": {"width": 0, "height": 600}}',
+            '{"resize": {"width": 70000, "height": 600}}',
+        ]:
+            with self.assertRaises(serializers.ValidationError):
+                validate_conversion_options(value)
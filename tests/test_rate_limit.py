@@ -0,0 +1,96 @@
+"""速率限制测试"""
+from django.test import TestCase
+from django.core.cache import cache
+from unittest.mock import patch
+from apps.security.ratelimit import RateLimitEngine
+from apps.security.validators import RateLimiter
+from apps.security.cache import CacheManager
+
+class FakeScript:
+    """记录脚本调用，由管道按GCRA逻辑执行"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __call__(self, keys, args, client):
+        client.calls.append((keys[0], [int(arg) for arg in args]))
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def execute(self):
+        self.redis.round_trips += 1
+        results = []
+        for key, (interval, limit, cost) in self.calls:
+            now = self.redis.now
+            period = interval * limit
+            tat = max(self.redis.data.get(key, now), now)
+            new_tat = tat + interval * cost
+            if new_tat - now > period:
+                results.append([0, 0, new_tat - period - now])
+            else:
+                self.redis.data[key] = new_tat
+                results.append([1, (period - (new_tat - now)) // interval, 0])
+        return results
+
+class FakeRedis:
+    """时间固定的内存Redis"""
+
+    def __init__(self):
+        self.data = {}
+        self.now = 1_000_000
+        self.round_trips = 0
+
+    def register_script(self, script):
+        return FakeScript(self)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class RateLimitEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_gcra_script_calls(self):
+        """测试每个键一次脚本调用，多个键一次往返"""
+        redis = FakeRedis()
+        engine = RateLimitEngine()
+        with patch('apps.security.ratelimit.get_redis_connection', return_value=redis):
+            results = [engine.hit('login:1.2.3.4', 3, 60) for _ in range(4)]
+            self.assertEqual(results, [
+                (True, 2, 0.0), (True, 1, 0.0), (True, 0, 0.0), (False, 0, 20.0)
+            ])
+            self.assertEqual(redis.round_trips, 4)
+
+            # 名额随时间恢复
+            redis.now += 20000
+            self.assertTrue(engine.hit('login:1.2.3.4', 3, 60)[0])
+
+            results = engine.hit_many([('a', 1, 1), ('b', 1, 1), ('a', 1, 1)])
+            self.assertEqual([allowed for allowed, _, _ in results], [True, True, False])
+            self.assertEqual(redis.round_trips, 6)
+            self.assertIn(cache.make_key('a'), redis.data)
+
+    def test_cache_fallback(self):
+        """测试非Redis缓存后端使用固定窗口计数"""
+        engine = RateLimitEngine()
+        self.assertIsNone(engine.redis)
+        self.assertEqual(
+            [engine.hit('api:1', 2, 60)[0] for _ in range(3)],
+            [True, True, False]
+        )
+        self.assertEqual([engine.count('requests', 60) for _ in range(3)], [1, 2, 3])
+
+    def test_call_sites(self):
+        """测试各限流入口共用引擎"""
+        limiter = RateLimiter('upload', max_requests=1, time_window=60)
+        self.assertTrue(limiter.is_allowed('user1'))
+        self.assertFalse(limiter.is_allowed('user1'))
+        self.assertTrue(limiter.is_allowed('user2'))
+
+        manager = CacheManager()
+        self.assertEqual(manager.increment_request_count('1.2.3.4'), 1)
+        self.assertEqual(manager.increment_request_count('1.2.3.4'), 2)
+        self.assertEqual(manager.get_request_count('1.2.3.4'), 2)
@@ -0,0 +1,136 @@
+"""转换结果缓存测试"""
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.contrib.auth import get_user_model
+from unittest.mock import patch
+from apps.converter.models import ConversionTask
+from apps.converter.result_cache import ResultCache, normalize_options
+from apps.converter.workers import dispatch_conversion
+import os
+import shutil
+import hashlib
+import tempfile
+
+User = get_user_model()
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        cache.clear()
+
+        conversion_settings = dict(settings.CONVERSION_SETTINGS)
+        conversion_settings['result_cache'] = dict(
+            conversion_settings['result_cache'],
+            dir=os.path.join(self.temp_dir, 'result_cache')
+        )
+        media = override_settings(
+            MEDIA_ROOT=self.temp_dir,
+            CONVERSION_SETTINGS=conversion_settings
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+
+    def create_task(self, content=b'a,b\n1,2\n', target_format='xlsx', options=None, hashed=True):
+        """创建转换任务，上传时已流式计算哈希"""
+        task = ConversionTask(
+            user=self.user,
+            original_format='csv',
+            target_format=target_format,
+            file_size=len(content),
+            file_hash=hashlib.sha256(content).hexdigest() if hashed else '',
+            options=options or {}
+        )
+        task.original_file.save('data.csv', ContentFile(content), save=False)
+        task.save()
+        return task
+
+    def complete_task(self, task, content=b'converted'):
+        """模拟转换完成"""
+        task.converted_file.save(f'{task.id}.{task.target_format}', ContentFile(content), save=False)
+        task.status = 'completed'
+        task.save()
+        ResultCache().store(task)
+
+    def test_normalize_options(self):
+        """测试选项规范化"""
+        self.assertEqual(
+            normalize_options({'Quality': 'High', 'dpi': 300, 'resize': None}),
+            normalize_options({'dpi': 300, 'quality': 'high'})
+        )
+        self.assertEqual(normalize_options(None), normalize_options({}))
+        self.assertNotEqual(normalize_options({'dpi': 300}), normalize_options({'dpi': 150}))
+
+    @patch('apps.converter.tasks.convert_file.apply_async')
+    def test_cache_hit_skips_worker(self, mock_apply):
+        """测试相同输入直接复用结果，不投递任务"""
+        first = self.create_task()
+        self.complete_task(first)
+
+        second = self.create_task()
+        self.assertIsNone(dispatch_conversion(second))
+        mock_apply.assert_not_called()
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'completed')
+        self.assertEqual(second.progress, 100)
+        # 缓存命中不计入处理耗时
+        self.assertTrue(second.cache_hit)
+        self.assertIsNone(second.processing_time)
+        self.assertEqual(second.file_hash, first.file_hash)
+        self.assertNotEqual(second.converted_file.name, first.converted_file.name)
+        # 结果通过硬链接共享
+        self.assertTrue(os.path.samefile(second.converted_file.path, first.converted_file.path))
+
+    @patch('apps.converter.tasks.convert_file.apply_async')
+    def test_cache_miss(self, mock_apply):
+        """测试输入、目标格式或转换器版本不同时不命中"""
+        self.complete_task(self.create_task())
+
+        dispatch_conversion(self.create_task(content=b'a,b\n3,4\n'))
+        dispatch_conversion(self.create_task(target_format='pdf'))
+        dispatch_conversion(self.create_task(options={'dpi': 300}))
+        with patch('apps.converter.converters.BaseConverter.version', 2):
+            dispatch_conversion(self.create_task())
+
+        self.assertEqual(mock_apply.call_count, 4)
+
+    @patch('apps.converter.tasks.convert_file.apply_async')
+    def test_unhashed_task_not_hashed_on_dispatch(self, mock_apply):
+        """测试没有上传哈希的任务在投递时不计算哈希，保存结果时补算"""
+        self.complete_task(self.create_task())
+
+        task = self.create_task(hashed=False)
+        with patch('apps.converter.result_cache.hash_file') as mock_hash:
+            dispatch_conversion(task)
+        mock_hash.assert_not_called()
+        mock_apply.assert_called_once()
+
+        self.complete_task(task)
+        task.refresh_from_db()
+        self.assertEqual(task.file_hash, hashlib.sha256(b'a,b\n1,2\n').hexdigest())
+
+    def test_lru_eviction(self):
+        """测试超出大小上限时淘汰最久未使用的结果"""
+        result_cache = ResultCache()
+        result_cache.max_size = 25
+
+        keys = []
+        for index, last_used in enumerate([300, 100, 200]):
+            task = self.create_task(content=f'a\n{index}\n'.encode())
+            self.complete_task(task, content=b'x' * 10)
+            key = result_cache.get_key(task)
+            os.utime(result_cache._entry_path(key, 'xlsx'), (last_used, last_used))
+            keys.append(key)
+
+        self.assertEqual(result_cache.evict(), 20)
+        self.assertIsNotNone(result_cache.lookup(keys[0]))
+        self.assertIsNone(result_cache.lookup(keys[1]))
+        self.assertIsNotNone(result_cache.lookup(keys[2]))
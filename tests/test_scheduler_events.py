@@ -0,0 +1,168 @@
+"""事件驱动调度测试"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from apps.converter.models import ConversionTask
+from apps.converter.scheduler import TaskScheduler
+from apps.converter.state_machine import TaskStateMachine
+from apps.converter.cost_model import cost_model
+from apps.converter.events import task_events, SUBMITTED, STARTED, FINISHED
+from unittest.mock import patch
+import time
+
+User = get_user_model()
+
+class EventDrivenSchedulerTest(TestCase):
+    def setUp(self):
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+        cost_model.invalidate()
+        self.addCleanup(cost_model.invalidate)
+        self.scheduler = TaskScheduler()
+        self.scheduler.queue.clear()
+        self.subscription = task_events.subscribe()
+        self.addCleanup(self.subscription.close)
+
+        for target, value in [
+            (patch.object(TaskScheduler, 'MAX_CONCURRENT_TASKS', 2), None),
+            (patch.object(TaskScheduler, 'get_cpu_usage', return_value=10), None),
+            (patch.object(TaskScheduler, 'get_memory_usage', return_value=10), None),
+        ]:
+            target.start()
+            self.addCleanup(target.stop)
+        send = patch('apps.converter.workers.send_conversion')
+        self.send = send.start()
+        self.addCleanup(send.stop)
+
+    def create_task(self):
+        return ConversionTask.objects.create(
+            user=self.user,
+            original_file='test.txt',
+            original_format='txt',
+            target_format='pdf',
+            status='pending'
+        )
+
+    def drain_events(self):
+        events = []
+        event = self.subscription.get(timeout=0)
+        while event is not None:
+            events.append(event)
+            event = self.subscription.get(timeout=0)
+        return events
+
+    def test_submit_wakes_scheduler(self):
+        """测试任务入队事件触发派发"""
+        self.scheduler._process_tasks()
+        self.assertGreater(self.scheduler._dispatch_at, time.monotonic())
+
+        task = self.create_task()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scheduler.queue.push(task)
+        events = self.drain_events()
+        self.assertEqual([(e['event'], e['task_id']) for e in events], [(SUBMITTED, str(task.id))])
+
+        for event in events:
+            self.scheduler._handle_event(event)
+        self.assertEqual(self.scheduler._dispatch_at, 0)
+
+    def test_running_gauge(self):
+        """测试运行中任务数按事件增减，不查询数据库计数"""
+        tasks = [self.create_task() for _ in range(3)]
+        for task in tasks:
+            self.scheduler.queue.push(task)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scheduler._process_tasks()
+        self.assertEqual(self.scheduler.running_count, 2)
+        self.assertEqual(self.scheduler.queue.size(), 1)
+
+        # 派发时发布的开始事件不重复计数
+        for event in self.drain_events():
+            self.scheduler._handle_event(event)
+        self.assertEqual(self.scheduler.running_count, 2)
+
+        # 槽位已满时不访问数据库
+        with self.assertNumQueries(0):
+            self.scheduler._process_tasks()
+
+        finished = ConversionTask.objects.get(id=tasks[0].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            TaskStateMachine(finished).transition_to('completed')
+        events = self.drain_events()
+        self.assertEqual([e['event'] for e in events], [FINISHED])
+        self.scheduler._handle_event(events[0])
+        self.assertEqual(self.scheduler.running_count, 1)
+        self.assertEqual(self.scheduler._dispatch_at, 0)
+
+        self.scheduler._process_tasks()
+        self.assertEqual(self.scheduler.running_count, 2)
+        self.assertTrue(self.scheduler.queue.is_empty())
+
+    def test_idle_dispatch_without_queries(self):
+        """测试队列为空时派发不访问数据库"""
+        with self.assertNumQueries(0):
+            self.scheduler._process_tasks()
+
+    def test_resource_pressure_does_not_block(self):
+        """测试资源紧张时推迟派发而不是阻塞调度线程"""
+        self.scheduler.queue.push(self.create_task())
+        with patch.object(TaskScheduler, 'get_cpu_usage', return_value=95):
+            started = time.monotonic()
+            self.scheduler._process_tasks()
+            self.assertLess(time.monotonic() - started, 1)
+
+        self.assertEqual(self.scheduler.running_count, 0)
+        self.assertLessEqual(
+            self.scheduler._dispatch_at,
+            time.monotonic() + TaskScheduler.RESOURCE_RETRY_DELAY
+        )
+
+    def test_reconcile(self):
+        """测试与数据库对账校正运行中任务数"""
+        task = self.create_task()
+        ConversionTask.objects.filter(id=task.id).update(status='processing')
+        self.scheduler._running = {'lost': False}
+
+        self.scheduler._reconcile()
+        self.assertEqual(list(self.scheduler._running), [str(task.id)])
+
+    def test_started_event(self):
+        """测试其他节点开始的任务计入运行中任务数"""
+        task = self.create_task()
+        with self.captureOnCommitCallbacks(execute=True):
+            TaskStateMachine(task).transition_to('processing')
+        for event in self.drain_events():
+            self.assertEqual(event['event'], STARTED)
+            self.scheduler._handle_event(event)
+        self.assertEqual(self.scheduler.running_count, 1)
+
+    def test_dispatch_after_commit(self):
+        """测试事务提交后才投递到转换队列"""
+        task = self.create_task()
+        self.scheduler.queue.push(task)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.scheduler._process_tasks()
+            self.send.assert_not_called()
+        self.assertEqual(self.scheduler.running_count, 1)
+
+        for callback in callbacks:
+            callback()
+        self.send.assert_called_once()
+        self.assertEqual(self.send.call_args[0][0].id, task.id)
+
+    def test_dispatch_failure(self):
+        """测试投递失败的任务标记为失败并发布结束事件"""
+        self.send.side_effect = ConnectionError('broker unavailable')
+        task = self.create_task()
+        self.scheduler.queue.push(task)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scheduler._process_tasks()
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'failed')
+        self.assertIn('broker unavailable', task.error_message)
+        for event in self.drain_events():
+            self.scheduler._handle_event(event)
+        self.assertEqual(self.scheduler.running_count, 0)
@@ -0,0 +1,112 @@
+"""调度器领导者选举测试"""
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from apps.converter.models import ConversionTask
+from apps.converter.scheduler import TaskScheduler
+from apps.converter.queue import in_shard
+from apps.converter.cost_model import cost_model
+from unittest.mock import patch
+from datetime import timedelta
+
+User = get_user_model()
+
+class SchedulerLeaderTest(TestCase):
+    def setUp(self):
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+        cost_model.invalidate()
+        self.addCleanup(cost_model.invalidate)
+        self.schedulers = [TaskScheduler() for _ in range(3)]
+        for scheduler in self.schedulers:
+            self.addCleanup(scheduler.queue.resign, scheduler.node_id)
+        self.schedulers[0].queue.clear()
+
+        dispatch = patch('apps.converter.workers.send_conversion')
+        dispatch.start()
+        self.addCleanup(dispatch.stop)
+
+    def elect(self, *schedulers):
+        for scheduler in schedulers:
+            scheduler._elect_at = 0
+            scheduler._check_leadership()
+
+    def create_task(self, **kwargs):
+        return ConversionTask.objects.create(
+            user=self.user,
+            original_file='test.txt',
+            original_format='txt',
+            target_format='pdf',
+            **kwargs
+        )
+
+    def test_single_leader(self):
+        """测试只有一个领导者，备用节点分片"""
+        first, second, third = self.schedulers
+        self.elect(first, second, third)
+        # 后加入的节点在下次续约时才能看到完整的节点列表
+        self.elect(first, second, third)
+
+        self.assertTrue(first.is_leader)
+        self.assertFalse(second.is_leader)
+        self.assertFalse(third.is_leader)
+        self.assertIsNone(first.shard)
+        self.assertEqual(sorted([second.shard, third.shard]), [(0, 2), (1, 2)])
+
+        # 续约不改变令牌
+        token = first.token
+        self.elect(first)
+        self.assertEqual(first.token, token)
+
+    def test_leader_without_standbys(self):
+        """测试没有备用节点时领导者负责全部恢复"""
+        leader = self.schedulers[0]
+        self.elect(leader)
+        self.assertEqual(leader.shard, (0, 1))
+
+    def test_failover_fences_old_leader(self):
+        """测试领导者让出后备用节点接任，旧令牌不能再出队"""
+        old, new, _ = self.schedulers
+        self.elect(old, new)
+        old_token = old.token
+
+        # 模拟旧领导者失联期间租约被释放
+        old.queue.resign(old.node_id)
+        self.elect(new)
+        self.assertTrue(new.is_leader)
+        self.assertGreater(new.token, old_token)
+
+        task = self.create_task(status='pending')
+        old.queue.push(task)
+        with patch.object(TaskScheduler, 'get_cpu_usage', return_value=10), \
+                patch.object(TaskScheduler, 'get_memory_usage', return_value=10):
+            old._process_tasks()
+            self.assertFalse(old.is_leader)
+            self.assertEqual(old.queue.size(), 1)
+
+            new._process_tasks()
+        self.assertTrue(old.queue.is_empty())
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'processing')
+
+    def test_sharded_recovery(self):
+        """测试卡住的任务按分片恢复"""
+        tasks = [
+            self.create_task(status='processing', started_at=timezone.now() - timedelta(hours=2))
+            for _ in range(8)
+        ]
+        shards = [(0, 2), (1, 2)]
+        for task in tasks:
+            self.assertEqual(sum(in_shard(task.id, shard) for shard in shards), 1)
+
+        standby = self.schedulers[1]
+        standby._recover_tasks((0, 2))
+        for task in tasks:
+            task.refresh_from_db()
+            expected = 'failed' if in_shard(task.id, (0, 2)) else 'processing'
+            self.assertEqual(task.status, expected)
+
+        self.schedulers[2]._recover_tasks((1, 2))
+        self.assertFalse(ConversionTask.objects.filter(status='processing').exists())
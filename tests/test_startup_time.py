@@ -0,0 +1,43 @@
+"""启动时间测试"""
+from django.test import SimpleTestCase
+from django.conf import settings
+from apps.converter.management.commands.check_startup_time import parse_import_times
+import os
+import sys
+import subprocess
+
+SAMPLE_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        420 | io
+import time:      1500 |       2000 |     fitz.utils
+import time:      4000 |       6000 | fitz
+"""
+
+class StartupTimeTest(SimpleTestCase):
+    def test_parse_import_times(self):
+        """测试解析导入耗时"""
+        results = parse_import_times(SAMPLE_OUTPUT)
+
+        self.assertEqual(results[0], ('_io', 120, 120, 1))
+        self.assertEqual(results[1], ('io', 300, 420, 0))
+        self.assertEqual(results[2], ('fitz.utils', 1500, 2000, 2))
+        self.assertEqual(len(results), 4)
+
+    def test_converters_import_is_lazy(self):
+        """测试导入转换器模块不会加载重量级依赖"""
+        code = (
+            'import sys; '
+            'import apps.converter.converters, apps.converter.optimizers, apps.converter.engine; '
+            'print(",".join(sorted(m for m in {modules} if m in sys.modules)))'
+        ).format(modules=settings.STARTUP_TIME_BUDGET['forbidden_modules'])
+
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
@@ -0,0 +1,71 @@
+"""转换任务索引和查询计划测试"""
+from django.test import TestCase
+from django.db import connection
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from apps.converter.models import ConversionTask
+from datetime import timedelta
+from unittest import skipUnless
+
+User = get_user_model()
+
+class TaskIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create 不触发用户信号
+        cls.user, cls.other = User.objects.bulk_create([
+            User(email='a@example.com', username='a'),
+            User(email='b@example.com', username='b'),
+        ])
+        statuses = ['completed'] * 8 + ['failed', 'pending', 'processing']
+        ConversionTask.objects.bulk_create([
+            ConversionTask(
+                user=cls.user if i % 2 else cls.other,
+                original_format='jpg', target_format='png',
+                status=statuses[i % len(statuses)],
+                file_size=i
+            )
+            for i in range(500)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {ConversionTask._meta.db_table}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        """断言查询计划使用了指定索引"""
+        if connection.vendor == 'postgresql':
+            # 测试数据量小，关闭顺序扫描后检查能否用上索引
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_user_queries(self):
+        """测试历史列表和每日限额使用 (user, created_at) 索引"""
+        history = ConversionTask.objects.filter(user=self.user).order_by('-created_at')
+        self.assertUsesIndex(history, 'conv_task_user_created_idx')
+
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        daily = ConversionTask.objects.filter(
+            user=self.user,
+            created_at__gte=today,
+            created_at__lt=today + timedelta(days=1)
+        )
+        self.assertUsesIndex(daily, 'conv_task_user_created_idx')
+        self.assertEqual(daily.count(), 250)
+
+    def test_status_queries(self):
+        """测试按状态的统计使用 (status, created_at) 索引"""
+        failed = ConversionTask.objects.filter(status='failed').order_by('-created_at')[:10]
+        self.assertUsesIndex(failed, 'conv_task_status_created_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', 'partial index implication needs PostgreSQL')
+    def test_scheduler_queries(self):
+        """测试调度器的计数和超时恢复使用部分索引"""
+        processing = ConversionTask.objects.filter(status='processing')
+        self.assertUsesIndex(processing, 'conv_task_active_idx')
+
+        stuck = ConversionTask.objects.filter(
+            status='processing',
+            started_at__lt=timezone.now() - timedelta(hours=1)
+        )
+        self.assertUsesIndex(stuck, 'conv_task_active_idx')
@@ -2,8 +2,12 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from apps.converter.models import ConversionTask
-from apps.converter.queue import TaskQueue
+from apps.converter.queue import TaskQueue, FairLanes
+from apps.converter.workers import submit_conversion
 from apps.core.exceptions import *
+from django.conf import settings
+from django.utils import timezone
+from unittest.mock import patch
 import time
 
 User = get_user_model()
@@ -160,4 +164,170 @@ class TaskQueueTest(TestCase):
         # 验证队列状态恢复
         for task in tasks:
             queued_task = new_queue.pop()
-            self.assertEqual(queued_task.id, task.id) 
\ No newline at end of file
+            self.assertEqual(queued_task.id, task.id)
+
+class SharedTaskQueueTest(TestCase):
+    """共享存储上的队列：租约、跨实例共享状态"""
+
+    def setUp(self):
+        # bulk_create 不触发用户信号
+        self.user, = User.objects.bulk_create([
+            User(email='test@example.com', username='testuser')
+        ])
+        self.queue = TaskQueue()
+        self.queue.clear()
+        self.addCleanup(self.queue.clear)
+
+    def create_task(self, **kwargs):
+        return ConversionTask.objects.create(
+            user=self.user,
+            original_file='test.txt',
+            original_format='txt',
+            target_format='pdf',
+            status='pending',
+            **kwargs
+        )
+
+    def test_queue_capacity(self):
+        """测试队列总容量先于用户任务数达到上限"""
+        with patch.object(TaskQueue, 'MAX_SIZE', 3):
+            for _ in range(3):
+                self.queue.push(self.create_task())
+            with self.assertRaises(QueueFullError):
+                self.queue.push(self.create_task())
+        self.assertEqual(self.queue.size(), 3)
+
+    def test_user_task_limit(self):
+        """测试用户排队任务数限制"""
+        with patch.object(TaskQueue, 'MAX_USER_TASKS', 2):
+            for _ in range(2):
+                self.queue.push(self.create_task())
+            with self.assertRaises(UserTaskLimitError):
+                self.queue.push(self.create_task())
+
+    def test_queued_task_timeout(self):
+        """测试排队过久的任务被标记失败并移出队列"""
+        task = self.create_task()
+        self.queue.push(task)
+        ConversionTask.objects.filter(id=task.id).update(
+            created_at=timezone.now() - timezone.timedelta(hours=25)
+        )
+
+        self.queue.cleanup_timeouts()
+        self.assertTrue(self.queue.is_empty())
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'failed')
+        self.assertIn('timed out', task.error_message.lower())
+
+    def test_shared_state(self):
+        """测试队列状态保存在共享存储中，新实例无需恢复即可出队"""
+        tasks = [self.create_task() for _ in range(3)]
+        for task in tasks:
+            self.queue.push(task)
+
+        new_queue = TaskQueue()
+        self.assertEqual([new_queue.pop().id for _ in tasks], [task.id for task in tasks])
+
+    def test_lease_claim_and_ack(self):
+        """测试多个调度节点领取不重复，确认后释放用户名额"""
+        tasks = [self.create_task() for _ in range(3)]
+        for task in tasks:
+            self.queue.push(task)
+        self.assertFalse(self.queue.push(tasks[0]))
+        self.assertEqual(self.queue.user_task_count(self.user.id), 3)
+
+        other = TaskQueue()
+        claimed = [self.queue.pop(), other.pop(), self.queue.pop()]
+        self.assertEqual(sorted(task.id for task in claimed), sorted(task.id for task in tasks))
+        self.assertIsNone(other.pop())
+
+        # 领取后未确认的任务仍占用户名额
+        self.assertEqual(self.queue.user_task_count(self.user.id), 3)
+        for task in claimed:
+            self.queue.ack(task)
+        self.assertEqual(self.queue.user_task_count(self.user.id), 0)
+
+    def test_lease_expiry(self):
+        """测试未确认的任务在租约到期后重新入队"""
+        task = self.create_task()
+        self.queue.push(task)
+        with patch.object(TaskQueue, 'LEASE_TIMEOUT', 0):
+            self.assertEqual(self.queue.pop().id, task.id)
+        self.assertEqual(self.queue.pop().id, task.id)
+        self.assertIsNone(self.queue.pop())
+
+    def test_skip_started_tasks(self):
+        """测试已经开始的任务出队时被丢弃"""
+        task = self.create_task()
+        self.queue.push(task)
+        ConversionTask.objects.filter(id=task.id).update(status='processing')
+        self.assertIsNone(self.queue.pop())
+        self.assertEqual(self.queue.user_task_count(self.user.id), 0)
+
+    def test_submit_through_queue(self):
+        """测试启用调度器时提交的任务进入队列，不直接投递"""
+        task = self.create_task()
+        with patch('apps.converter.workers.dispatch_conversion') as dispatch:
+            with patch.dict(settings.CONVERSION_SETTINGS['scheduler'], {'enabled': True}):
+                submit_conversion(task)
+            dispatch.assert_not_called()
+            self.assertEqual(self.queue.pop().id, task.id)
+
+            other = self.create_task()
+            with patch.dict(settings.CONVERSION_SETTINGS['scheduler'], {'enabled': False}):
+                submit_conversion(other)
+            dispatch.assert_called_once_with(other)
+        self.assertTrue(self.queue.is_empty())
+
+    def test_submit_rejected(self):
+        """测试队列拒绝的任务标记为失败"""
+        task = self.create_task()
+        with patch.dict(settings.CONVERSION_SETTINGS['scheduler'], {'enabled': True}), \
+                patch.object(TaskQueue, 'MAX_USER_TASKS', 0):
+            with self.assertRaises(UserTaskLimitError):
+                submit_conversion(task)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'failed')
+
+class FairLanesTest(TestCase):
+    def setUp(self):
+        self.weights = {'high': 6, 'medium': 3, 'low': 1}
+
+    def test_weighted_share(self):
+        """测试队列饱和时按权重分配出队次数，同一通道内先进先出"""
+        lanes = FairLanes(self.weights, aging_interval=1e9)
+        for lane in self.weights:
+            for i in range(20):
+                lanes.push(f'{lane}-{i}', lane, i)
+        popped = [lanes.pop(now=100) for _ in range(20)]
+        counts = {lane: sum(task_id.startswith(lane) for task_id in popped) for lane in self.weights}
+        self.assertEqual(counts, {'high': 12, 'medium': 6, 'low': 2})
+        self.assertEqual(popped[0], 'high-0')
+        self.assertLess(popped.index('high-1'), popped.index('high-2'))
+
+    def test_aging(self):
+        """测试出队时按等待时间提高积压通道的份额，高优先级通道仍有份额"""
+        def low_share(aging_interval):
+            lanes = FairLanes({'high': 6, 'low': 1}, aging_interval=aging_interval)
+            for i in range(100):
+                # 低优先级任务已积压 1000 秒，高优先级任务刚到达
+                lanes.push(f'low-{i}', 'low', 0)
+                lanes.push(f'high-{i}', 'high', 1000)
+            popped = [lanes.pop(now=1000) for _ in range(70)]
+            return sum(task_id.startswith('low') for task_id in popped)
+
+        self.assertEqual(low_share(1e9), 10)
+        self.assertGreater(low_share(100), 40)
+        self.assertLess(low_share(100), 70)
+
+    def test_idle_lane_credit(self):
+        """测试空闲通道不会积攒额度"""
+        lanes = FairLanes(self.weights, aging_interval=1e9)
+        for i in range(30):
+            lanes.push(f'high-{i}', 'high', 0)
+        for _ in range(20):
+            lanes.pop(now=0)
+        for i in range(10):
+            lanes.push(f'low-{i}', 'low', 0)
+        popped = [lanes.pop(now=0) for _ in range(7)]
+        self.assertEqual(sum(task_id.startswith('low') for task_id in popped), 1)
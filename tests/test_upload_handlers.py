@@ -0,0 +1,78 @@
+"""上传流式检查测试"""
+from django.test import TestCase, override_settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from apps.security.upload_handlers import (
+    InspectingMemoryFileUploadHandler,
+    InspectingTemporaryFileUploadHandler
+)
+from apps.security.content_scan import StreamScanner
+from apps.security.validators import SecurityScanner
+import hashlib
+
+class UploadHandlerTest(TestCase):
+    def receive(self, handler_class, content, chunk_size=7):
+        """按块把内容交给上传处理器"""
+        handler = handler_class()
+        handler.handle_raw_input(None, {}, len(content), 'boundary')
+        try:
+            handler.new_file('file', 'data.txt', 'text/plain', len(content))
+        except StopFutureHandlers:
+            # 内存处理器接管文件
+            pass
+        for start in range(0, len(content), chunk_size):
+            self.assertIsNone(handler.receive_data_chunk(content[start:start + chunk_size], start))
+        return handler.file_complete(len(content))
+
+    def test_inspect_while_receiving(self):
+        """测试接收时计算哈希、识别类型"""
+        content = b'%PDF-1.4\n' + b'0' * 100
+        for handler_class in (InspectingMemoryFileUploadHandler, InspectingTemporaryFileUploadHandler):
+            file = self.receive(handler_class, content)
+            self.assertTrue(file.inspected)
+            self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(file.sniffed_mime, 'application/pdf')
+            # PDF 按结构扫描，接收时不扫描
+            self.assertFalse(file.scanned)
+            self.assertEqual(file.read(), content)
+            file.close()
+
+    def test_threat_across_chunks(self):
+        """测试特征跨越数据块边界"""
+        file = self.receive(InspectingMemoryFileUploadHandler, b'x' * 20 + b'eval (1)', chunk_size=22)
+        self.assertIsNotNone(file.scan_threat)
+        with self.assertRaises(ValidationError):
+            SecurityScanner.scan_file(file)
+
+    def test_memory_handler_skips_large_files(self):
+        """测试大文件交给临时文件处理器"""
+        handler = InspectingMemoryFileUploadHandler()
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10):
+            handler.handle_raw_input(None, {}, 100, 'boundary')
+        handler.new_file('file', 'data.txt', 'text/plain', 100)
+        self.assertEqual(handler.receive_data_chunk(b'eval(', 0), b'eval(')
+        self.assertIsNone(handler.file_complete(100))
+
+class StreamScannerTest(TestCase):
+    def test_threat_across_feeds(self):
+        """测试识别跨块特征"""
+        scanner = StreamScanner()
+        scanner.feed(b'a' * 100 + b'<script type="text/javascript">')
+        scanner.feed(b'x' * 3000)
+        scanner.feed(b'</script>')
+        self.assertEqual(scanner.threat, 'script')
+
+    def test_scan_without_handler(self):
+        """测试未经上传处理器的文件按块扫描"""
+        file = SimpleUploadedFile('data.txt', b'a' * 1000 + b'<script>alert(1)</script>')
+        with self.assertRaises(ValidationError):
+            SecurityScanner.scan_file(file)
+
+    def test_prescanned_file(self):
+        """测试已扫描的文件不再读取内容"""
+        file = SimpleUploadedFile('data.txt', b'eval(1)')
+        file.scanned = True
+        file.scan_threat = None
+        SecurityScanner.scan_file(file)
+        self.assertEqual(file.tell(), 0)
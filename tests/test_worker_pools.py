@@ -0,0 +1,58 @@
+"""转换工作进程池测试"""
+from django.test import TestCase
+from unittest.mock import patch, MagicMock
+from apps.converter import workers
+from apps.converter.converters import get_conversion_factory
+import os
+
+class FormatFamilyTest(TestCase):
+    def test_format_family(self):
+        """测试格式族划分"""
+        self.assertEqual(workers.get_format_family('jpg', 'png'), 'image')
+        self.assertEqual(workers.get_format_family('svg', 'jpg'), 'image')
+        self.assertEqual(workers.get_format_family('pdf', 'docx'), 'pdf')
+        self.assertEqual(workers.get_format_family('PDF', 'PNG'), 'pdf')
+        self.assertEqual(workers.get_format_family('docx', 'pdf'), 'pdf')
+        self.assertEqual(workers.get_format_family('xlsx', 'csv'), 'office')
+
+    def test_conversion_queue(self):
+        """测试队列路由"""
+        self.assertEqual(workers.get_conversion_queue('png', 'gif'), 'convert_image')
+        self.assertEqual(workers.get_conversion_queue('pdf', 'jpg'), 'convert_pdf')
+        self.assertEqual(workers.get_conversion_queue('csv', 'xlsx'), 'convert_office')
+
+    @patch('apps.converter.tasks.convert_file.apply_async')
+    def test_dispatch_conversion(self, mock_apply):
+        """测试任务投递到格式族队列"""
+        task = MagicMock(id=42, original_format='pdf', target_format='docx')
+        workers.dispatch_conversion(task)
+
+        mock_apply.assert_called_once_with(args=[42], queue='convert_pdf')
+
+class WorkerWarmUpTest(TestCase):
+    def test_families_from_queues(self):
+        """测试根据监听队列确定格式族"""
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('CONVERTER_WORKER_FAMILY', None)
+            families = workers.get_worker_families(['convert_image', 'celery'])
+        self.assertEqual(families, ['image'])
+
+    def test_families_from_environment(self):
+        """测试环境变量指定格式族"""
+        with patch.dict(os.environ, {'CONVERTER_WORKER_FAMILY': 'pdf,unknown'}):
+            families = workers.get_worker_families(['convert_image'])
+        self.assertEqual(families, ['pdf'])
+
+    @patch('apps.converter.workers.warm_up')
+    def test_warm_worker_signal(self, mock_warm_up):
+        """测试工作进程启动时预热"""
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('CONVERTER_WORKER_FAMILY', None)
+            workers.warm_worker(options={'queues': 'convert_pdf,convert_office'})
+
+        warmed = [call.args[0] for call in mock_warm_up.call_args_list]
+        self.assertEqual(sorted(warmed), ['office', 'pdf'])
+
+    def test_shared_factory(self):
+        """测试转换器工厂在进程内复用"""
+        self.assertIs(get_conversion_factory(), get_conversion_factory())